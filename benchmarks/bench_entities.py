@@ -0,0 +1,71 @@
+"""
+Compare memory and decode throughput of api entities against the
+previous __dict__ based representation.
+
+  python benchmarks/bench_entities.py [count]
+"""
+
+import gc
+import sys
+import time
+
+from juju_rs.client import Droplet
+
+
+class DictDroplet(object):
+    """Previous representation, the full result in a per instance dict.
+    """
+
+    @classmethod
+    def from_dict(cls, data):
+        i = cls()
+        i.__dict__.update(data)
+        return i
+
+
+def droplet_data(n):
+    return {
+        'id': 2442349 + n, 'name': 'rspace-%032x' % n, 'size_id': 66,
+        'image_id': 5141286, 'region_id': 4, 'event_id': 31223 + n,
+        'backups_active': False, 'status': 'active',
+        'ip_address': '162.243.%d.%d' % (n / 256 % 256, n % 256),
+        'private_ip_address': None, 'locked': False,
+        'created_at': '2014-08-25T13:32:04Z'}
+
+
+def instance_size(i):
+    size = sys.getsizeof(i)
+    if hasattr(i, '__dict__'):
+        size += sys.getsizeof(i.__dict__)
+    extra = getattr(i, '_extra', None)
+    if extra is not None:
+        size += sys.getsizeof(extra) + sum(
+            sys.getsizeof(pair) for pair in extra)
+    return size
+
+
+def bench(cls, results, repeat=5):
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        t = time.time()
+        entities = map(cls.from_dict, results)
+        elapsed = time.time() - t
+        best = best is None and elapsed or min(best, elapsed)
+    size = sum(instance_size(i) for i in entities)
+    return best, size
+
+
+def main():
+    count = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+    results = [droplet_data(n) for n in range(count)]
+    print("{:<12} {:>12} {:>14} {:>12}".format(
+        "Entity", "Decode (s)", "Entities/s", "Bytes/each"))
+    for cls in (DictDroplet, Droplet):
+        elapsed, size = bench(cls, results)
+        print("{:<12} {:>12.3f} {:>14.0f} {:>12.0f}".format(
+            cls.__name__, elapsed, count / elapsed, size / float(count)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Cold start time of the cli for juju's plugin discovery (--description),
+--help and each subcommand's --help, with the modules each imports.
+
+  python benchmarks/bench_startup.py [repeat]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import sys
+sys.argv = ['juju-rs'] + sys.argv[1:]
+before = len(sys.modules)
+try:
+    from juju_rs import cli
+    cli.main()
+except SystemExit:
+    pass
+sys.stderr.write("%d" % (len(sys.modules) - before))
+"""
+
+CASES = (
+    ['--description'], ['--help'], ['bootstrap', '--help'],
+    ['add-machine', '--help'], ['warm-pool', '--help'],
+    ['list-machines', '--help'], ['terminate-machine', '--help'],
+    ['destroy-environment', '--help'], ['reconcile', '--help'])
+
+
+def bench(args, repeat):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        proc = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT] + args, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        elapsed = time.time() - t
+        best = best is None and elapsed or min(best, elapsed)
+    return best, int(err.splitlines()[-1])
+
+
+def main():
+    repeat = len(sys.argv) > 1 and int(sys.argv[1]) or 5
+    print("{:<32} {:>10} {:>8}".format("Invocation", "Best (ms)", "Modules"))
+    for args in CASES:
+        elapsed, modules = bench(args, repeat)
+        print("{:<32} {:>10.1f} {:>8}".format(
+            " ".join(args), elapsed * 1000, modules))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+In process client for the juju api server.
+
+The juju cli forks per command, parses the jenv and logs in to the api
+server every time. Instead a single authenticated websocket connection
+(port 17070) is shared by all runner threads, requests are multiplexed
+over it by request id and a reader thread dispatches the responses.
+
+Only the websocket features the api server uses are implemented, text
+frames, fragmentation, ping/pong and close.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import socket
+import ssl
+import struct
+import threading
+
+import yaml
+
+from juju_rs.exceptions import JujuAPIError
+
+log = logging.getLogger("juju.rspace")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class ConnectionClosed(socket.error):
+    """The api server connection is gone."""
+
+
+def mask_payload(mask, payload):
+    data = bytearray(payload)
+    for i in range(len(data)):
+        data[i] ^= mask[i % 4]
+    return str(data)
+
+
+def encode_frame(opcode, payload, mask=True):
+    """Encode a single final frame, clients must mask their frames.
+    """
+    header = bytearray([0x80 | opcode])
+    mask_bit = mask and 0x80 or 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header.extend(struct.pack("!H", length))
+    else:
+        header.append(mask_bit | 127)
+        header.extend(struct.pack("!Q", length))
+    if mask:
+        key = bytearray(os.urandom(4))
+        header.extend(key)
+        payload = mask_payload(key, payload)
+    return str(header) + payload
+
+
+def read_exact(recv, count):
+    chunks = []
+    while count:
+        chunk = recv(count)
+        if not chunk:
+            raise ConnectionClosed("Connection closed by api server")
+        chunks.append(chunk)
+        count -= len(chunk)
+    return "".join(chunks)
+
+
+def read_frame(recv):
+    """Return (fin, opcode, payload) of the next frame read with recv.
+    """
+    first, second = bytearray(read_exact(recv, 2))
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", read_exact(recv, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", read_exact(recv, 8))[0]
+    key = second & 0x80 and bytearray(read_exact(recv, 4)) or None
+    payload = read_exact(recv, length)
+    if key is not None:
+        payload = mask_payload(key, payload)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key + WS_GUID).digest())
+
+
+class WebSocket(object):
+    """Blocking websocket client, one reader and many writers.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.write_lock = threading.Lock()
+        # Frame data read along with the handshake response.
+        self.buffer = ""
+
+    @classmethod
+    def connect(cls, host, port, path="/", ca_cert=None, secure=True,
+                timeout=30):
+        sock = socket.create_connection((host, port), timeout)
+        if secure:
+            # The api server certificate is signed by the environment's
+            # own CA, and its name doesn't match the address.
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            context.check_hostname = False
+            if ca_cert:
+                context.verify_mode = ssl.CERT_REQUIRED
+                context.load_verify_locations(cadata=ca_cert.decode('ascii'))
+            else:
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock)
+        ws = cls(sock)
+        ws.handshake(host, port, path)
+        sock.settimeout(None)
+        return ws
+
+    def handshake(self, host, port, path):
+        key = base64.b64encode(os.urandom(16))
+        self.sock.sendall("\r\n".join([
+            "GET %s HTTP/1.1" % path,
+            "Host: %s:%d" % (host, port),
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            "Origin: http://localhost/",
+            "Sec-WebSocket-Key: %s" % key,
+            "Sec-WebSocket-Version: 13", "", ""]))
+        response = ""
+        while "\r\n\r\n" not in response:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise ConnectionClosed("Websocket handshake failed")
+            response += chunk
+        response, self.buffer = response.split("\r\n\r\n", 1)
+        lines = response.split("\r\n")
+        if " 101 " not in lines[0] + " ":
+            raise ConnectionClosed("Websocket handshake failed: %s" % lines[0])
+        headers = dict(
+            [l.split(":", 1)[0].strip().lower(), l.split(":", 1)[1].strip()]
+            for l in lines[1:] if ":" in l)
+        if headers.get('sec-websocket-accept') != accept_key(key):
+            raise ConnectionClosed("Websocket handshake failed: bad accept")
+
+    def recv_bytes(self, count):
+        if self.buffer:
+            data, self.buffer = self.buffer[:count], self.buffer[count:]
+            return data
+        return self.sock.recv(count)
+
+    def send(self, message):
+        frame = encode_frame(OP_TEXT, message)
+        with self.write_lock:
+            self.sock.sendall(frame)
+
+    def recv(self):
+        """Return the next text message, answering pings on the way.
+        """
+        fragments = []
+        while True:
+            fin, opcode, payload = read_frame(self.recv_bytes)
+            if opcode == OP_PING:
+                with self.write_lock:
+                    self.sock.sendall(encode_frame(OP_PONG, payload))
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                raise ConnectionClosed("Connection closed by api server")
+            fragments.append(payload)
+            if fin:
+                return "".join(fragments)
+
+    def close(self):
+        try:
+            with self.write_lock:
+                self.sock.sendall(encode_frame(OP_CLOSE, ""))
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+class Pending(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.message = None
+        self.error = None
+
+
+class APIConnection(object):
+    """Authenticated api connection shared by threads.
+    """
+
+    DEFAULT_TIMEOUT = 300
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.lock = threading.Lock()
+        self.request_id = 0
+        self.pending = {}
+        self.closed = False
+        self.reader = threading.Thread(target=self.read)
+        self.reader.daemon = True
+        self.reader.start()
+
+    @classmethod
+    def connect(cls, address, user, password, ca_cert=None, secure=True,
+                path="/"):
+        host, port = address.rsplit(":", 1)
+        conn = cls(WebSocket.connect(
+            host, int(port), path, ca_cert=ca_cert, secure=secure))
+        try:
+            conn.login(user, password)
+        except:
+            conn.close()
+            raise
+        return conn
+
+    @classmethod
+    def from_jenv(cls, jenv_path, secure=True):
+        """Connect with the addresses and credentials of a jenv.
+        """
+        with open(jenv_path) as fh:
+            data = yaml.safe_load(fh.read()) or {}
+        addresses = data.get('state-servers') or []
+        if not addresses:
+            raise JujuAPIError("No api server address in %s" % jenv_path)
+        path = "/"
+        if data.get('environ-uuid'):
+            path = "/environment/%s/api" % data['environ-uuid']
+        error = None
+        for address in addresses:
+            try:
+                return cls.connect(
+                    address, data.get('user', 'admin'),
+                    data.get('password'), ca_cert=data.get('ca-cert'),
+                    secure=secure, path=path)
+            except (socket.error, ssl.SSLError), e:
+                log.debug("Could not connect to api at %s: %s", address, e)
+                error = e
+        raise error
+
+    def login(self, user, password):
+        if not user.startswith('user-'):
+            user = "user-%s" % user
+        return self.rpc(
+            "Admin", "Login", {"AuthTag": user, "Password": password})
+
+    def rpc(self, facade, request, params=None, timeout=DEFAULT_TIMEOUT,
+            watcher_id=None):
+        """Make a request, returning its response.
+
+        Raises JujuAPIError for errors reported by the api server, and
+        ConnectionClosed if the connection is lost. A timeout of None
+        waits as long as the connection lives.
+        """
+        pending = Pending()
+        with self.lock:
+            if self.closed:
+                raise ConnectionClosed("Api connection is closed")
+            self.request_id += 1
+            request_id = self.request_id
+            self.pending[request_id] = pending
+        message = {"RequestId": request_id, "Type": facade,
+                   "Request": request, "Params": params or {}}
+        if watcher_id is not None:
+            message["Id"] = watcher_id
+        try:
+            self.ws.send(json.dumps(message))
+        except socket.error, e:
+            self.fail(ConnectionClosed(str(e)))
+        if not pending.event.wait(timeout) and timeout is not None:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise ConnectionClosed(
+                "No api response to %s.%s in %ds" % (
+                    facade, request, timeout))
+        if pending.error is not None:
+            raise pending.error
+        if pending.message.get('Error'):
+            raise JujuAPIError(
+                pending.message['Error'], pending.message.get('ErrorCode'))
+        return pending.message.get('Response', {})
+
+    def read(self):
+        while True:
+            try:
+                message = json.loads(self.ws.recv())
+            except (socket.error, ValueError), e:
+                self.fail(ConnectionClosed(str(e)))
+                return
+            with self.lock:
+                pending = self.pending.pop(message.get('RequestId'), None)
+            if pending is None:
+                log.debug("Unexpected api message %s", message)
+                continue
+            pending.message = message
+            pending.event.set()
+
+    def fail(self, error):
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for p in pending.values():
+            p.error = error
+            p.event.set()
+
+    def close(self):
+        self.fail(ConnectionClosed("Api connection is closed"))
+        self.ws.close()
+
+    def status(self):
+        """Environment status, shaped like `juju status` yaml output.
+        """
+        result = self.rpc("Client", "FullStatus", {"Patterns": None})
+        machines = {}
+        for mid, m in (result.get('Machines') or {}).items():
+            machines[mid] = {
+                'dns-name': m.get('DNSName'),
+                'instance-id': m.get('InstanceId'),
+                'agent-state': m.get('AgentState'),
+                'series': m.get('Series')}
+        services = {}
+        for name, s in (result.get('Services') or {}).items():
+            services[name] = {'charm': s.get('Charm')}
+        return {'environment': result.get('EnvironmentName'),
+                'machines': machines, 'services': services}
+
+    def destroy_machines(self, machines, force=True):
+        return self.rpc("Client", "DestroyMachines", {
+            "MachineNames": machines, "Force": force})
+
+    def destroy_environment(self):
+        return self.rpc("Client", "DestroyEnvironment")
+
+    def watch_all(self):
+        """Start a watcher of all environment changes, returns its id.
+        """
+        return self.rpc("Client", "WatchAll")['AllWatcherId']
+
+    def next_deltas(self, watcher_id):
+        """Block until the watcher has changes, returns them as a list
+        of [entity, "change" | "remove", data]. The first call returns
+        the entire environment.
+        """
+        return self.rpc(
+            "AllWatcher", "Next", {}, timeout=None, watcher_id=watcher_id
+        ).get('Deltas') or []
+
+    def stop_watcher(self, watcher_id):
+        return self.rpc("AllWatcher", "Stop", {}, watcher_id=watcher_id)
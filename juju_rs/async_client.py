@@ -0,0 +1,200 @@
+"""
+Non-blocking provider api client.
+
+Mirrors client.Client on top of tornado's async http client, so a single
+process and thread can drive many concurrent provisioning requests and
+event polls over one shared connection pool. Methods are coroutines and
+must be run on a tornado ioloop ie.
+
+  client = AsyncClient.connect()
+  droplets = IOLoop.current().run_sync(client.get_droplets)
+
+tornado is an optional dependency (pip install juju-rs[async]).
+"""
+
+import json
+import logging
+import os
+import urllib
+
+try:
+    from tornado import gen
+    from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "AsyncClient requires tornado, pip install juju-rs[async]")
+
+from juju_rs.auth import TokenManager
+from juju_rs.client import Client, Droplet, Image, SSHKey, Region
+from juju_rs.exceptions import ProviderAPIError, ProviderError
+
+log = logging.getLogger("juju.rspace")
+
+
+class AsyncResponse(object):
+    """Adapt a tornado response to the requests api used for errors.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.code
+
+    def json(self):
+        return json.loads(self.response.body or 'null')
+
+
+class AsyncClient(object):
+
+    DEFAULT_MAX_CLIENTS = 100
+
+    def __init__(self, client_id, api_key, max_clients=DEFAULT_MAX_CLIENTS,
+                 token_cache=None):
+        self.client_id = client_id
+        self.api_key = api_key
+        self.api_url_base = (
+            'https://identity.api.rackspacecloud.com/v2.0/tokens')
+        # All requests share one keep-alive pool of at most max_clients
+        # connections, further requests are queued by the http client.
+        self.http = AsyncHTTPClient(
+            force_instance=True, max_clients=max_clients)
+        # Authentication requests are made here, the manager only keeps
+        # and caches tokens.
+        self.tokens = TokenManager(client_id, api_key, cache_path=token_cache)
+        self._auth_future = None
+
+    def get_url(self, target):
+        return "%s%s" % (self.api_url_base, target)
+
+    def get_headers(self):
+        headers = {'User-Agent': 'juju/client'}
+        headers['Content-Type'] = "application/json"
+        return headers
+
+    @gen.coroutine
+    def get_images(self, filter="global"):
+        data = yield self.request("/images")
+        raise gen.Return(map(Image.from_dict, data.get("images", [])))
+
+    @gen.coroutine
+    def get_ssh_keys(self):
+        data = yield self.request("/ssh_keys")
+        raise gen.Return(map(SSHKey.from_dict, data.get('ssh_keys', [])))
+
+    @gen.coroutine
+    def get_droplets(self):
+        data = yield self.request("/droplets")
+        raise gen.Return(map(Droplet.from_dict, data.get('droplets', [])))
+
+    @gen.coroutine
+    def get_droplet(self, droplet_id):
+        data = yield self.request("/droplets/%s" % (droplet_id))
+        raise gen.Return(Droplet.from_dict(data.get('droplet', {})))
+
+    @gen.coroutine
+    def get_regions(self):
+        data = yield self.request("/regions")
+        raise gen.Return(map(Region.from_dict, data.get("regions", [])))
+
+    @gen.coroutine
+    def create_droplet(self, name, size_id, image_id, region_id,
+                       ssh_key_ids=None, private_networking=False,
+                       backups_enabled=False, virtio=True):
+        params = dict(
+            name=name, size_id=size_id,
+            image_id=image_id, region_id=region_id,
+            virtio=bool(private_networking),
+            private_networking=bool(private_networking),
+            backups_enabled=bool(backups_enabled))
+
+        if ssh_key_ids:
+            params['ssh_key_ids'] = ','.join(ssh_key_ids)
+        data = yield self.request('/droplets/new', params=params)
+        raise gen.Return(Droplet.from_dict(data.get('droplet', {})))
+
+    @gen.coroutine
+    def destroy_droplet(self, droplet_id, scrub=True):
+        data = yield self.request(
+            "/droplets/%s/destroy" % droplet_id,
+            params=dict(scrub_data=int(bool(scrub))))
+        raise gen.Return(data.get('event_id'))
+
+    @gen.coroutine
+    def get_event(self, event_id):
+        data = yield self.request("/events/%s" % event_id)
+        raise gen.Return(data['event'])
+
+    @gen.coroutine
+    def wait_on_event(self, event_id, interval=8, max_polls=26):
+        """Poll an event until done, without holding a thread.
+        """
+        for i in range(max_polls):
+            yield gen.sleep(interval)
+            event = yield self.get_event(event_id)
+            if event['action_status'] == 'done':
+                raise gen.Return(event)
+            log.debug("Waiting on event %s %s%%",
+                      event_id, event.get('percentage') or '0')
+        raise ProviderError("Timed out waiting on event %s" % event_id)
+
+    @gen.coroutine
+    def get_token(self):
+        token_id = self.tokens.current()
+        if token_id is not None:
+            raise gen.Return(token_id)
+        # Coroutines needing a token share a single in-flight request.
+        if self._auth_future is None:
+            self._auth_future = self._authenticate()
+        try:
+            token = yield self._auth_future
+        finally:
+            self._auth_future = None
+        raise gen.Return(token.id)
+
+    @gen.coroutine
+    def _authenticate(self):
+        log.debug("Authenticating as %s", self.client_id)
+        url, body, headers = self.tokens.auth_request()
+        response = yield self.http.fetch(
+            HTTPRequest(url, 'POST', headers=headers, body=body),
+            raise_error=False)
+        token = self.tokens.auth_result(AsyncResponse(response))
+        self.tokens.store(token)
+        raise gen.Return(token)
+
+    @gen.coroutine
+    def request(self, target, method='GET', params=None):
+        p = params and dict(params) or {}
+        url = self.get_url(target)
+        if p:
+            url = "%s?%s" % (url, urllib.urlencode(p))
+        if method != 'POST':
+            method = 'GET'
+        body = method == 'POST' and '' or None
+
+        headers = self.get_headers()
+        for attempt in range(2):
+            token = headers['X-Auth-Token'] = yield self.get_token()
+            response = yield self.http.fetch(
+                HTTPRequest(url, method, headers=headers, body=body),
+                raise_error=False)
+            if response.code != 401:
+                break
+            # Token revoked or expired early, re-authenticate once.
+            self.tokens.invalidate(token)
+
+        if response.code == 599:
+            # Connection level failure, no http response.
+            raise ProviderAPIError(
+                AsyncResponse(response), str(response.error))
+        raise gen.Return(Client.check_result(AsyncResponse(response)))
+
+    def close(self):
+        self.http.close()
+
+    @classmethod
+    def connect(cls):
+        client_id = os.environ.get('DO_CLIENT_ID')
+        key = os.environ.get('DO_API_KEY')
+        if not client_id or not key:
+            raise KeyError("Missing api credentials")
+        return cls(client_id, key)
@@ -0,0 +1,179 @@
+"""
+Identity token management for the provider api.
+
+Credentials are exchanged once for a token which is then reused until
+shortly before it expires. Tokens can optionally be cached on disk so
+subsequent cli invocations skip authentication.
+"""
+
+import calendar
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from juju_rs.exceptions import ProviderAPIError
+from juju_rs.jsonfile import write_json
+
+log = logging.getLogger("juju.rspace")
+
+AUTH_URL = 'https://identity.api.rackspacecloud.com/v2.0/tokens'
+
+
+def parse_expires(value):
+    """Convert an identity api timestamp to epoch seconds.
+
+    ie. 2014-11-24T22:05:39.115Z or 2014-11-24T22:05:39.115-06:00
+    """
+    offset = 0
+    if value.endswith('Z'):
+        value = value[:-1]
+    elif len(value) > 19 and value[-6] in '+-':
+        sign = value[-6] == '-' and -1 or 1
+        offset = sign * (int(value[-5:-3]) * 3600 + int(value[-2:]) * 60)
+        value = value[:-6]
+    stamp = time.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    return calendar.timegm(stamp) - offset
+
+
+class Token(object):
+
+    def __init__(self, id, expires):
+        self.id = id
+        self.expires = expires
+
+    def valid(self, margin=0):
+        return self.expires - margin > time.time()
+
+
+class TokenManager(object):
+    """Authenticate once and share the token across runner threads.
+
+    Tokens are refreshed `margin` seconds ahead of expiry, while inside
+    that window a single thread refreshes and others keep using the
+    still valid token.
+
+    Clients making their own authentication requests (ie. async ones)
+    pass no `http` and use current() and store() instead of get_token().
+    """
+
+    DEFAULT_MARGIN = 300
+
+    def __init__(self, username, api_key, http=None, auth_url=AUTH_URL,
+                 cache_path=None, margin=DEFAULT_MARGIN):
+        self.username = username
+        self.api_key = api_key
+        self.http = http
+        self.auth_url = auth_url
+        self.cache_path = cache_path
+        self.margin = margin
+        self.token = None
+        self.lock = threading.Lock()
+
+    def get_token(self):
+        token = self.token
+        if token is not None and token.valid(self.margin):
+            return token.id
+        if token is not None and token.valid():
+            if not self.lock.acquire(False):
+                return token.id
+        else:
+            self.lock.acquire()
+        try:
+            if self.token is None or not self.token.valid(self.margin):
+                self.token = self.load() or self.authenticate()
+            return self.token.id
+        finally:
+            self.lock.release()
+
+    def current(self):
+        """Id of a token valid beyond the margin, from memory or the
+        disk cache, or None if one must be requested.
+        """
+        with self.lock:
+            if self.token is None or not self.token.valid(self.margin):
+                token = self.load()
+                if token is None:
+                    return None
+                self.token = token
+            return self.token.id
+
+    def store(self, token):
+        """Use a token from an authentication made outside get_token().
+        """
+        with self.lock:
+            self.token = token
+
+    def invalidate(self, token_id):
+        """Drop a token the api rejected, unless already replaced.
+        """
+        with self.lock:
+            if self.token is not None and self.token.id == token_id:
+                self.token = None
+                self.save(None)
+
+    def authenticate(self):
+        log.debug("Authenticating as %s", self.username)
+        url, body, headers = self.auth_request()
+        response = self.http.request('POST', url, data=body, headers=headers)
+        return self.auth_result(response)
+
+    def auth_request(self):
+        """Return the url, body and headers of an authentication request.
+        """
+        credentials = dict(username=self.username, apiKey=self.api_key)
+        body = {'auth': {'RAX-KSKEY:apiKeyCredentials': credentials}}
+        headers = {'User-Agent': 'juju/client',
+                   'Content-Type': 'application/json'}
+        return self.auth_url, json.dumps(body), headers
+
+    def auth_result(self, response):
+        """Extract and store the token from an authentication response.
+        """
+        if response.status_code not in (200, 203):
+            raise ProviderAPIError(response, 'Authentication failed')
+        try:
+            data = response.json()['access']['token']
+            token = Token(data['id'], parse_expires(data['expires']))
+        except (ValueError, KeyError, TypeError):
+            raise ProviderAPIError(response, 'Invalid authentication result')
+        self.save(token)
+        return token
+
+    @property
+    def cache_key(self):
+        return hashlib.sha1(
+            "%s:%s" % (self.username, self.api_key)).hexdigest()
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path) as fh:
+                data = json.load(fh)[self.cache_key]
+            token = Token(data['id'], data['expires'])
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+        if not token.valid(self.margin):
+            return None
+        log.debug("Using cached token for %s", self.username)
+        return token
+
+    def save(self, token):
+        if not self.cache_path:
+            return
+        data = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path) as fh:
+                    data = json.load(fh)
+            except (IOError, ValueError):
+                data = {}
+        if token is None:
+            data.pop(self.cache_key, None)
+        else:
+            data[self.cache_key] = {'id': token.id, 'expires': token.expires}
+        # Token is a credential, only readable by the user.
+        write_json(self.cache_path, data, mode=0600)
@@ -0,0 +1,91 @@
+"""
+Group calls made by concurrent ops into batched calls.
+
+Juju takes many machines per terminate-machine call, so instead of an
+invocation per op, ops submit their machine to a Batcher. The first op
+of a batch waits a short window for others to join (or the batch to
+fill up), makes one call for all of them and hands each op its own
+outcome.
+"""
+
+import logging
+import threading
+
+log = logging.getLogger("juju.rspace")
+
+
+class Batch(object):
+
+    def __init__(self):
+        self.items = []
+        self.results = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class Batcher(object):
+    """Batch items submitted from many threads into calls of `call`.
+
+    `call` takes a list of items and returns a list of their results
+    (or None). If it raises, the items are retried one by one so each
+    submitter gets its own error.
+    """
+
+    def __init__(self, call, window=0.1, size=50, metrics=None):
+        self.call = call
+        self.window = window
+        self.size = size
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.current = None
+
+    def submit(self, item):
+        """Add item to the open batch and return its result once made.
+        """
+        with self.lock:
+            batch = self.current
+            leader = batch is None
+            if leader:
+                batch = self.current = Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.size:
+                self.current = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.current is batch:
+                    self.current = None
+            self.flush(batch)
+        else:
+            batch.done.wait()
+        value, error = batch.results[index]
+        if error is not None:
+            raise error
+        return value
+
+    def flush(self, batch):
+        try:
+            batch.results = self.apply(batch.items)
+            if self.metrics is not None:
+                self.metrics.incr('batches')
+                self.metrics.incr('batched', len(batch.items))
+        finally:
+            batch.done.set()
+
+    def apply(self, items):
+        try:
+            values = self.call(items)
+        except Exception, e:
+            if len(items) == 1:
+                return [(None, e)]
+            log.debug("Batch of %d failed, retrying singly: %s",
+                      len(items), e)
+            results = []
+            for item in items:
+                results.extend(self.apply([item]))
+            return results
+        if values is None:
+            values = [None] * len(items)
+        return [(v, None) for v in values]
@@ -0,0 +1,106 @@
+"""
+Persistent response cache for slow changing catalog endpoints.
+
+Images, regions and ssh keys almost never change, caching them on disk
+saves a round trip per endpoint on every bootstrap and add-machine.
+Entries are keyed by account and endpoint, expire per endpoint ttl and
+are revalidated with ETag/Last-Modified when the api provides them.
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+import time
+
+from juju_rs.jsonfile import write_json
+
+log = logging.getLogger("juju.rspace")
+
+
+class ResponseCache(object):
+    """Size bounded LRU cache of api results persisted to `path`.
+
+    When `refresh` is set, cached entries are never served but fresh
+    results are still stored.
+    """
+
+    DEFAULT_TTLS = {
+        '/images': 24 * 3600,
+        '/regions': 24 * 3600,
+        '/ssh_keys': 3600}
+
+    DEFAULT_MAX_ENTRIES = 64
+
+    def __init__(self, path, account, ttls=None,
+                 max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        self.path = path
+        self.account = account
+        if ttls is None:
+            ttls = dict(self.DEFAULT_TTLS)
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def cacheable(self, target):
+        return target in self.ttls
+
+    def key(self, target):
+        return "%s:%s" % (self.account, target)
+
+    def get(self, target):
+        """Return the cached entry for target, fresh or stale.
+
+        Entries are dicts with data, stored, etag and last_modified keys.
+        """
+        if self.refresh:
+            return None
+        with self.lock:
+            entries = self._load()
+            entry = entries.pop(self.key(target), None)
+            if entry is not None:
+                # Move to most recently used.
+                entries[self.key(target)] = entry
+            return entry
+
+    def is_fresh(self, target, entry):
+        return entry['stored'] + self.ttls.get(target, 0) > time.time()
+
+    def put(self, target, data, etag=None, last_modified=None):
+        with self.lock:
+            entries = self._load()
+            entries.pop(self.key(target), None)
+            entries[self.key(target)] = {
+                'data': data, 'stored': time.time(),
+                'etag': etag, 'last_modified': last_modified}
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._save()
+
+    def touch(self, target):
+        """Mark a revalidated entry as fresh.
+        """
+        with self.lock:
+            entry = self._load().get(self.key(target))
+            if entry is not None:
+                entry['stored'] = time.time()
+                self._save()
+
+    def _load(self):
+        if self.entries is not None:
+            return self.entries
+        self.entries = OrderedDict()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as fh:
+                    self.entries = json.load(
+                        fh, object_pairs_hook=OrderedDict)
+            except (IOError, ValueError):
+                log.debug("Ignoring unreadable cache %s", self.path)
+        return self.entries
+
+    def _save(self):
+        write_json(self.path, self.entries)
@@ -1,12 +1,16 @@
+"""
+Command line entry point, also run by juju for plugin discovery.
+
+Commands, the provider stack and their dependencies (requests, yaml,
+...) are only imported once a command runs, so --description and
+--help start fast.
+"""
+
 import argparse
 import logging
 import sys
 
-from juju_rs.config import Config
 from juju_rs.constraints import SERIES_MAP
-from juju_rs.exceptions import (
-    ConfigError, PrecheckError, ProviderAPIError)
-from juju_rs import commands
 
 
 def _default_opts(parser):
@@ -14,6 +18,12 @@ def _default_opts(parser):
         "-e", "--environment", help="Juju environment to operate on")
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "--refresh-cache", action="store_true", default=False,
+        help="Bypass cached provider images, regions and ssh keys")
+    parser.add_argument(
+        "--parallel", type=int, default=None, metavar="N",
+        help="Number of machine operations to run at once")
 
 
 def _machine_opts(parser):
@@ -44,7 +54,10 @@ def setup_parser():
         "--upload-tools",
         action="store_true", default=False,
         help="upload local version of tools before bootstrapping")
-    bootstrap.set_defaults(command=commands.Bootstrap)
+    bootstrap.add_argument(
+        "-n", "--num-machines", type=int, default=0,
+        help="Number of machines to add once bootstrapped")
+    bootstrap.set_defaults(command="Bootstrap")
 
     add_machine = subparsers.add_parser(
         'add-machine',
@@ -57,7 +70,23 @@ def setup_parser():
     add_machine.add_argument(
         "-k", "--ssh-key", default="",
         help="Use specified key when adding machines")
-    add_machine.set_defaults(command=commands.AddMachine)
+    add_machine.add_argument(
+        "--resume", action="store_true", default=False,
+        help="Resume an interrupted add-machine, adopting its instances")
+    add_machine.add_argument(
+        "--warm-pool", type=int, default=0, metavar="N",
+        help="Claim machines from, and refill, a warm pool of N machines")
+    add_machine.set_defaults(command="AddMachine")
+
+    warm_pool = subparsers.add_parser(
+        'warm-pool',
+        help="Pre-launch ssh verified machines for add-machine --warm-pool")
+    warm_pool.add_argument(
+        "-n", "--num-machines", type=int, default=1,
+        help="Number of machines to keep in the pool")
+    _default_opts(warm_pool)
+    _machine_opts(warm_pool)
+    warm_pool.set_defaults(command="FillPool")
 
     list_machines = subparsers.add_parser(
         'list-machines',
@@ -66,14 +95,14 @@ def setup_parser():
     list_machines.add_argument(
         "-a", "--all", action="store_true", default=False,
         help="Display all droplets in digital ocean.")
-    list_machines.set_defaults(command=commands.ListMachines)
+    list_machines.set_defaults(command="ListMachines")
 
     terminate_machine = subparsers.add_parser(
         "terminate-machine",
         help="Terminate machine")
     terminate_machine.add_argument("machines", nargs="+")
     _default_opts(terminate_machine)
-    terminate_machine.set_defaults(command=commands.TerminateMachine)
+    terminate_machine.set_defaults(command="TerminateMachine")
 
     destroy_environment = subparsers.add_parser(
         'destroy-environment',
@@ -82,14 +111,33 @@ def setup_parser():
     destroy_environment.add_argument(
         "--force", action="store_true", default=False,
         help="Irrespective of environment state, destroy all env machines")
-    destroy_environment.set_defaults(command=commands.DestroyEnvironment)
+    destroy_environment.set_defaults(command="DestroyEnvironment")
+
+    reconcile = subparsers.add_parser(
+        'reconcile',
+        help="Rebuild the index of machines and their instances")
+    _default_opts(reconcile)
+    reconcile.set_defaults(command="Reconcile")
 
     return parser
 
 
+def load_command(name):
+    """Command class by name, importing the commands module on use.
+    """
+    from juju_rs import commands
+    return getattr(commands, name)
+
+
 def main():
     parser = setup_parser()
     options = parser.parse_args()
+
+    from juju_rs.config import Config
+    from juju_rs.exceptions import (
+        ConfigError, PrecheckError, ProviderAPIError, TimeoutError)
+    from juju_rs import ssh
+
     config = Config(options)
 
     if config.verbose:
@@ -108,12 +156,13 @@ def main():
         print("Configuration error: %s" % str(e))
         sys.exit(1)
 
-    cmd = options.command(
+    cmd = load_command(options.command)(
         config,
         config.connect_provider(),
         config.connect_environment())
     try:
         cmd.run()
+        cmd.report()
     except ProviderAPIError, e:
         print("Provider interaction error: %s" % str(e))
     except ConfigError, e:
@@ -122,6 +171,15 @@ def main():
     except PrecheckError, e:
         print("Precheck error: %s" % str(e))
         sys.exit(1)
+    except TimeoutError, e:
+        print("Timed out: %s" % str(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Interrupted")
+        sys.exit(130)
+    finally:
+        cmd.close()
+        ssh.mux.close()
 
 if __name__ == '__main__':
     main()
@@ -1,58 +1,157 @@
+import logging
 import os
+import threading
 
 # http://stackoverflow.com/a/20782252
 import json
 
+from juju_rs.auth import TokenManager
+from juju_rs.coalesce import SingleFlight
 from juju_rs.exceptions import ProviderAPIError
+from juju_rs.pool import SessionPool
+from juju_rs.retry import RetryPolicy
 
 # https://github.com/shazow/urllib3/issues/497
+import requests
 import requests.packages.urllib3
 requests.packages.urllib3.disable_warnings()
 
-import requests
+log = logging.getLogger("juju.rspace")
+
+
+class EntityType(type):
+    """Keep each entity class's slot names as a frozenset for decoding.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(EntityType, cls).__init__(name, bases, attrs)
+        cls._fields = frozenset(cls.__slots__)
+
 
 class Entity(object):
+    """Api result with fixed, slot backed attributes.
+
+    Subclasses list the fields the plugin uses in __slots__, any other
+    fields in a result are kept as raw pairs and only turned into a
+    dict when first accessed.
+    """
+    __metaclass__ = EntityType
+    __slots__ = ('_extra',)
+
+    def __init__(self, **kw):
+        self._set_fields(kw)
 
     @classmethod
     def from_dict(cls, data):
-        i = cls()
-        i.__dict__.update(data)
+        i = cls.__new__(cls)
+        i._set_fields(data)
         return i
 
+    def _set_fields(self, data):
+        get = data.get
+        for f in self.__slots__:
+            setattr(self, f, get(f))
+        fields = self._fields
+        self._extra = tuple([
+            (k, v) for k, v in data.iteritems() if k not in fields]) or None
+
+    def to_dict(self):
+        d = dict(self._get_extra())
+        for f in self.__slots__:
+            d[f] = getattr(self, f)
+        return d
+
+    def _get_extra(self):
+        extra = self._extra
+        if extra is None:
+            return {}
+        if not isinstance(extra, dict):
+            extra = self._extra = dict(extra)
+        return extra
+
+    def __getattr__(self, name):
+        # Only called when name isn't a slot.
+        if name == '_extra' or name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            return self._get_extra()[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return "<%s id:%s>" % (
+            self.__class__.__name__, getattr(self, 'id', None))
+
 
 class SSHKey(Entity):
     """SSH Key on digital ocean
-
-    Attributes: id, name
     """
+    __slots__ = ('id', 'name')
 
 
 class Droplet(Entity):
     """Instance on digital ocean.
 
-    Attributes: id, name, size_id, image_id, region_id, event_id,
-    backups_active, status, ip_address, created_at
+    Other attributes (image_id, backups_active, ...) decoded on access.
     """
+    __slots__ = ('id', 'name', 'size_id', 'region_id', 'event_id',
+                 'status', 'ip_address', 'created_at')
 
 
 class Image(Entity):
-    """
-    Attributes:, id, name, distribution, slug, public
-    """
+    __slots__ = ('id', 'name', 'distribution', 'slug', 'public')
 
 
 class Region(Entity):
-    """
-    Attributes: slug, id, name
+    __slots__ = ('slug', 'id', 'name')
+
+
+class Prefetch(threading.Thread):
+    """Run a call in the background, its result is collected on demand.
     """
 
+    def __init__(self, func, *args):
+        super(Prefetch, self).__init__()
+        self.daemon = True
+        self.func = func
+        self.args = args
+        self.value = self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except Exception, e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
 
 class Client(object):
 
-    def __init__(self, client_id, api_key):
+    DEFAULT_PAGE_SIZE = 200
+
+    # Seconds identical GETs may reuse a just completed result, by
+    # target prefix. Other GETs are only shared while in flight.
+    COALESCE_TTLS = {'/events/': 1}
+
+    def __init__(self, client_id, api_key, pool_size=None, token_cache=None,
+                 cache=None, retry=None):
         self.client_id = client_id
         self.api_key = api_key
         self.api_url_base = 'https://identity.api.rackspacecloud.com/v2.0/tokens'
+        self.http = SessionPool(pool_size)
+        self.tokens = TokenManager(
+            client_id, api_key, self.http, cache_path=token_cache)
+        self.cache = cache
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry
+        self.flights = SingleFlight()
 
     def get_images(self, filter="global"):
         data = self.request("/images")
@@ -69,6 +168,24 @@ class Client(object):
         data = self.request("/droplets")
         return map(Droplet.from_dict, data.get('droplets', []))
 
+    def iter_droplets(self, per_page=DEFAULT_PAGE_SIZE):
+        """Yield droplets page by page, fetching the next page while the
+        caller works through the current one.
+        """
+        page = 1
+        data = self.request(
+            "/droplets", params=dict(page=page, per_page=per_page))
+        while data is not None:
+            pending = None
+            if data.get('links', {}).get('pages', {}).get('next'):
+                page += 1
+                pending = Prefetch(
+                    self.request, "/droplets", 'GET',
+                    dict(page=page, per_page=per_page))
+            for d in data.get('droplets', []):
+                yield Droplet.from_dict(d)
+            data = pending and pending.result() or None
+
     def get_droplet(self, droplet_id):
         data = self.request("/droplets/%s" % (droplet_id))
         return Droplet.from_dict(data.get('droplet', {}))
@@ -92,6 +209,11 @@ class Client(object):
         data = self.request('/droplets/new', params=params)
         return Droplet.from_dict(data.get('droplet', {}))
 
+    def rename_droplet(self, droplet_id, name):
+        data = self.request(
+            "/droplets/%s/rename" % droplet_id, params=dict(name=name))
+        return data.get('event_id')
+
     def destroy_droplet(self, droplet_id, scrub=True):
         data = self.request(
             "/droplets/%s/destroy" % droplet_id,
@@ -99,24 +221,90 @@ class Client(object):
         return data.get('event_id')
 
     def request(self, target, method='GET', params=None):
+        if method == 'POST' or not self.retry.is_idempotent(target):
+            return self._request(target, method, params)
+        key = (target, tuple(sorted((params or {}).items())))
+        ttl = 0
+        for prefix in self.COALESCE_TTLS:
+            if target.startswith(prefix):
+                ttl = self.COALESCE_TTLS[prefix]
+        return self.flights.do(
+            key, self._request, target, method, params, ttl=ttl)
+
+    def _request(self, target, method='GET', params=None):
         p = params and dict(params) or {}
-        credentials = dict(
-            username=self.client_id, apiKey=self.api_key
-        )
-        auth = dict()
-        auth['RAX-KSKEY:apiKeyCredentials'] = credentials
-        p['auth'] = auth
 
-        headers = {'User-Agent': 'juju/client'}
-        headers['Content-Type'] = "application/json"
+        headers = self.get_headers()
         url = self.get_url(target)
         print json.dumps(p)
-        if method == 'POST':
-            response = requests.post(url, headers=headers, params=p)
-        else:
-            response = requests.get(url, headers=headers, params=p)
+        if method != 'POST':
+            method = 'GET'
+
+        cached = None
+        if (self.cache is not None and method == 'GET' and not p and
+                self.cache.cacheable(target)):
+            cached = self.cache.get(target) or {}
+            if cached.get('data') and self.cache.is_fresh(target, cached):
+                return cached['data']
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        response = self.send(method, url, headers, p, target)
+        if cached is None:
+            return self.check_result(response)
+
+        if response.status_code == 304 and cached.get('data'):
+            log.debug("Revalidated cached %s", target)
+            self.cache.touch(target)
+            return cached['data']
+        data = self.check_result(response)
+        self.cache.put(
+            target, data, etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'))
+        return data
 
-        data = response.json()
+    def send(self, method, url, headers, params, target):
+        attempt = 0
+        while True:
+            self.retry.bucket.acquire()
+            try:
+                response = self._send(method, url, headers, params)
+            except (requests.ConnectionError, requests.Timeout), e:
+                if not self.retry.should_retry(target, attempt, error=e):
+                    raise
+                response = None
+            else:
+                if not self.retry.should_retry(
+                        target, attempt, response=response):
+                    return response
+            self.retry.backoff(target, attempt, response)
+            attempt += 1
+
+    def _send(self, method, url, headers, params):
+        token = headers['X-Auth-Token'] = self.tokens.get_token()
+        response = self.http.request(
+            method, url, headers=headers, params=params)
+        if response.status_code == 401:
+            # Token revoked or expired early, re-authenticate once.
+            self.tokens.invalidate(token)
+            headers['X-Auth-Token'] = self.tokens.get_token()
+            response = self.http.request(
+                method, url, headers=headers, params=params)
+        return response
+
+    def get_headers(self):
+        headers = {'User-Agent': 'juju/client'}
+        headers['Content-Type'] = "application/json"
+        return headers
+
+    @staticmethod
+    def check_result(response):
+        try:
+            data = response.json()
+        except ValueError:
+            raise ProviderAPIError(response, 'Invalid json result')
         print json.dumps(data)
         if not data:
             raise ProviderAPIError(response, 'No json result found')
@@ -127,6 +315,12 @@ class Client(object):
 
         return data
 
+    def get_pool_stats(self):
+        return self.http.get_stats()
+
+    def close(self):
+        self.http.close()
+
     @classmethod
     def connect(cls):
         client_id = os.environ.get('DO_CLIENT_ID')
@@ -0,0 +1,70 @@
+"""
+Single flight coalescing of concurrent identical requests.
+
+When several runner threads issue the same GET at once, only the first
+performs the request and the others wait for and share its result. A
+short ttl optionally lets callers arriving just after reuse it too.
+Shared results must be treated as read only.
+"""
+
+import threading
+import time
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.recent = {}
+        self.shared = 0
+
+    def do(self, key, func, *args, **kw):
+        """Return func(*args), sharing the call with concurrent callers
+        of the same key. Results are reused for `ttl` seconds.
+        """
+        ttl = kw.pop('ttl', 0)
+        with self.lock:
+            if key in self.recent:
+                expires, value = self.recent[key]
+                if expires > time.time():
+                    self.shared += 1
+                    return value
+                del self.recent[key]
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func(*args)
+        except Exception, e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+                if ttl and call.error is None:
+                    now = time.time()
+                    for k in [k for k, (expires, v) in self.recent.items()
+                              if expires <= now]:
+                        del self.recent[k]
+                    self.recent[key] = (now + ttl, call.value)
+            call.event.set()
+        return call.value
@@ -1,12 +1,21 @@
 import logging
+import os
 import time
 import uuid
 import yaml
 
+from juju_rs.batch import Batcher
 from juju_rs import constraints
-from juju_rs.exceptions import ConfigError, PrecheckError
+from juju_rs.exceptions import ConfigError, PrecheckError, ProviderAPIError
+from juju_rs.index import MachineIndex, entry_for
+from juju_rs.journal import Journal
+from juju_rs.metrics import Metrics
+from juju_rs import limit
 from juju_rs import ops
-from juju_rs.runner import Runner
+from juju_rs.pipeline import Pipeline
+from juju_rs.runner import DependencyError, Runner
+from juju_rs.status import StatusCache
+from juju_rs.warm import WarmPool
 
 
 log = logging.getLogger("juju.rspace")
@@ -14,11 +23,78 @@ log = logging.getLogger("juju.rspace")
 
 class BaseCommand(object):
 
+    # Deadline for a single bulk op (ie. a machine termination).
+    OP_TIMEOUT = 600
+
     def __init__(self, config, provider, environment):
         self.config = config
         self.provider = provider
         self.env = environment
-        self.runner = Runner()
+        self.status = StatusCache(environment)
+        self.index = None
+        self.limits = limit.Limits.create(config.parallel)
+        self.metrics = Metrics()
+        self.runner = Runner(
+            parallel=config.parallel, timeout=self.OP_TIMEOUT,
+            limits=self.limits, metrics=self.metrics)
+
+    def get_index(self):
+        """Index of the environment's machines and their instances.
+        """
+        if self.index is None:
+            self.index = MachineIndex(os.path.join(
+                self.config.cache_dir,
+                "index-%s.json" % self.config.get_env_name()))
+        return self.index
+
+    def get_terminations(self):
+        """Batcher removing machines from juju in as few calls as possible.
+        """
+        def terminate(machine_ids):
+            with self.limits.slot(limit.JUJU):
+                self.env.terminate_machines(machine_ids)
+        return Batcher(terminate, metrics=self.metrics)
+
+    def get_pool(self):
+        """Warm pool of the environment, verified members recorded locally.
+        """
+        env_name = self.config.get_env_name()
+        return WarmPool(self.provider, env_name, os.path.join(
+            self.config.cache_dir, "pool-%s.json" % env_name))
+
+    def fill_pool(self, pool, template, count):
+        """Launch and ssh verify count pool members.
+        """
+        provision = Pipeline(
+            FillPool.STAGES, limits=self.limits, metrics=self.metrics,
+            timeout=self.OP_TIMEOUT)
+        for n in range(count):
+            params = dict(template)
+            params['name'] = pool.new_name()
+            provision.queue_op(ops.MachineAdd(
+                self.provider, self.env, params, series=self.config.series))
+        verified = []
+        for op in provision.iter_results():
+            if op.error is None:
+                log.info("Pooled id:%s name:%s ip:%s", op.result.id,
+                         op.result.name, op.result.ip_address)
+                verified.append(op.result)
+        pool.record_verified(verified)
+        return verified
+
+    def close(self):
+        """Release the command's connections to the environment.
+        """
+        self.status.close()
+        self.provider.close()
+
+    def report(self):
+        """Log timings of the ops run by the command, if any.
+        """
+        if not self.metrics:
+            return
+        for line in self.metrics.report():
+            log.info(line)
 
     def solve_constraints(self):
         size, region = constraints.solve_constraints(self.config.constraints)
@@ -74,25 +150,79 @@ class Bootstrap(BaseCommand):
     - at least one ssh key must exist.
     - ? existing digital ocean with matching env name does not exist.
     """
+
+    # Deadline of launching, booting and bootstrapping the state server,
+    # a slow bootstrap is not a stuck op.
+    BOOTSTRAP_TIMEOUT = 1800
+
     def run(self):
         keys = self.check_preconditions()
         image, size, region = self.solve_constraints()
         log.info("Launching bootstrap host (eta 5m)...")
-        params = dict(
-            name="%s-0" % self.config.get_env_name(), image_id=image,
-            size_id=size, region_id=region, ssh_key_ids=keys)
-
-        op = ops.MachineAdd(
-            self.provider, self.env, params, series=self.config.series)
-        instance = op.run()
-
-        log.info("Bootstrapping environment...")
-        try:
-            self.env.bootstrap_jenv(instance.ip_address)
-        except:
-            self.provider.terminate_instance(instance.id)
-            raise
+        env_name = self.config.get_env_name()
+        template = dict(
+            image_id=image, size_id=size, region_id=region, ssh_key_ids=keys)
+
+        boot = ops.EnvironmentBootstrap(
+            self.provider, self.env, dict(template, name="%s-0" % env_name),
+            series=self.config.series, index=self.get_index())
+        boot.deadline = self.BOOTSTRAP_TIMEOUT
+        self.runner.queue_op(boot)
+
+        # Additional machines boot alongside the state server, and are
+        # registered as soon as the environment is up.
+        machines = []
+        if self.config.num_machines:
+            log.info("Launching %d instances...", self.config.num_machines)
+        for n in range(self.config.num_machines):
+            params = dict(
+                template, name="%s-%s" % (env_name, uuid.uuid4().hex))
+            add = ops.MachineAdd(
+                self.provider, self.env, params, series=self.config.series)
+            self.runner.queue_op(add)
+            enlist = ops.MachineEnlist(
+                self.provider, self.env, params, index=self.get_index(),
+                key=getattr(self.config.options, 'ssh_key', None)).after(
+                    add, boot)
+            self.runner.queue_op(enlist)
+            machines.append((add, enlist))
+
+        results = {}
+        for result in self.runner.iter_results():
+            results[result.op] = result
+            if isinstance(result.op, ops.MachineEnlist) and result.ok:
+                instance, machine_id = result.value
+                log.info("Registered id:%s name:%s ip:%s as juju machine",
+                         instance.id, instance.name, instance.ip_address)
+
+        if not results[boot].ok:
+            # A timed out bootstrap is still running, its instance is
+            # terminated here, otherwise the op terminated it.
+            boot.terminate()
+            for add, enlist in machines:
+                if add.instance is not None:
+                    self.provider.terminate_instance(add.instance.id)
+            raise results[boot].error
+
+        failed = []
+        for add, enlist in machines:
+            if results[enlist].ok:
+                continue
+            if isinstance(results[enlist].error, DependencyError):
+                # The launch failed, registering terminates on failure.
+                failed.append((add, results[add].error))
+                if add.instance is not None:
+                    self.provider.terminate_instance(add.instance.id)
+            else:
+                failed.append((add, results[enlist].error))
+        for add, error in failed:
+            log.error("Could not add machine %s: %s",
+                      add.params['name'], error)
         log.info("Bootstrap complete.")
+        if failed:
+            raise PrecheckError(
+                "%d of %d machines could not be added, their instances "
+                "were terminated" % (len(failed), len(machines)))
 
     def check_preconditions(self):
         result = super(Bootstrap, self).check_preconditions()
@@ -107,11 +237,14 @@ class ListMachines(BaseCommand):
 
     def run(self):
         env_name = self.config.get_env_name()
-        header = "{:<8} {:<18} {:<5} {:<8} {:<12} {:<6} {:<10}".format(
-            "Id", "Name", "Size", "Status", "Created", "Region", "Address")
+        header = "{:<8} {:<18} {:<5} {:<8} {:<12} {:<6} {:<15} {}".format(
+            "Id", "Name", "Size", "Status", "Created", "Region", "Address",
+            "Pool")
+        pool = self.get_pool()
 
         allmachines = self.config.options.all
-        for m in self.provider.get_instances():
+        for m in self.provider.get_instances(
+                env=not allmachines and env_name or None):
             if not allmachines and not m.name.startswith('%s-' % env_name):
                 continue
 
@@ -125,38 +258,193 @@ class ListMachines(BaseCommand):
             name = m.name
             if len(name) > 18:
                 name = name[:15] + "..."
-            print("{:<8} {:<18} {:<5} {:<8} {:<12} {:<6} {:<10}".format(
+            print("{:<8} {:<18} {:<5} {:<8} {:<12} {:<6} {:<15} {}".format(
                 m.id,
                 name,
                 constraints.SIZE_MAP.get(m.size_id, {}).get('name', "Unknown"),
                 m.status,
                 m.created_at[:-10],
                 r['aliases'][0],
-                m.ip_address).strip())
+                m.ip_address,
+                pool.is_member(m) and "warm" or "").strip())
 
 
 class AddMachine(BaseCommand):
 
+    # Concurrency bound per provisioning stage, waiting is cheap while
+    # api calls and juju registrations are held to adaptive limits.
+    STAGES = (
+        ('launch', limit.PROVIDER_MAX),
+        ('wait', 64),
+        ('verify', 16),
+        ('register', limit.JUJU_MAX))
+
     def run(self):
         keys = self.check_preconditions()
-        image, size, region = self.solve_constraints()
-        log.info("Launching %d instances...", self.config.num_machines)
+        journal = Journal(os.path.join(
+            self.config.cache_dir,
+            "journal-%s.json" % self.config.get_env_name()))
+
+        if self.config.resume:
+            provision = self.resume(journal)
+        else:
+            # Starting afresh would drop the journal of launched
+            # instances, orphaning them.
+            unfinished = journal.unfinished()
+            if unfinished:
+                raise PrecheckError(
+                    "Unfinished add-machine (%s), rerun with --resume to "
+                    "adopt its instances" % (
+                        " ".join([name for name, entry in unfinished])))
+            image, size, region = self.solve_constraints()
+            template = dict(
+                image_id=image, size_id=size, region_id=region,
+                ssh_key_ids=keys)
+            options = dict(
+                series=self.config.series, key=self.config.options.ssh_key)
+            journal.start(self.config.num_machines, template, options)
+            provision = Pipeline(
+                self.STAGES, limits=self.limits, metrics=self.metrics,
+                timeout=self.OP_TIMEOUT)
+            count = self.config.num_machines
+            if self.config.warm_pool:
+                pool = self.get_pool()
+                verified = pool.verified()
+                for instance in pool.claim(template, count):
+                    self.queue_adopted(
+                        provision, journal, instance,
+                        verified=instance.id in verified)
+                    count -= 1
+            log.info("Launching %d instances...", count)
+            self.queue_new(provision, journal, count)
+
+        failed = False
+        for op in provision.iter_results():
+            if op.error is not None:
+                failed = True
+                continue
+            instance, machine_id = op.result
+            log.info("Registered id:%s name:%s ip:%s as juju machine",
+                     instance.id, instance.name, instance.ip_address)
+
+        template = journal.load()['template']
+        if not failed and not journal.unfinished():
+            journal.clear()
+        if self.config.warm_pool:
+            pool = self.get_pool()
+            missing = pool.shortfall(template, self.config.warm_pool)
+            if missing:
+                log.info("Refilling warm pool with %d machines", missing)
+                self.fill_pool(pool, template, missing)
+
+    def new_op(self, journal, name=None):
+        data = journal.load()
+        params = dict(data['template'])
+        params['name'] = name or "%s-%s" % (
+            self.config.get_env_name(), uuid.uuid4().hex)
+        options = dict(data['options'])
+        return ops.MachineRegister(
+            self.provider, self.env, params, journal=journal,
+            index=self.get_index(), **options)
+
+    def queue_new(self, provision, journal, count):
+        for n in range(count):
+            provision.queue_op(self.new_op(journal))
+
+    def queue_adopted(self, provision, journal, instance, state=None,
+                      verified=False):
+        """Queue an already launched instance from its recorded state.
+
+        Without a state, active instances continue from ready, or from
+        ssh_ok when already verified.
+        """
+        if state is None:
+            if instance.status != 'active':
+                state = 'launched'
+            else:
+                state = verified and 'ssh_ok' or 'ready'
+        journal.record(instance.name, state, instance_id=instance.id)
+        op = self.new_op(journal, instance.name)
+        op.adopt(instance, state)
+        provision.queue_op(op)
+
+    def resume(self, journal):
+        """Adopt the instances of an interrupted add-machine.
+
+        Machines are picked up from the last state recorded in the
+        journal, launch attempts that never returned are looked up by
+        name, and instances gone from the account are replaced.
+        """
+        if not journal.exists():
+            raise PrecheckError(
+                "No interrupted add-machine to resume for %s" % (
+                    self.config.get_env_name()))
+        unfinished = journal.unfinished()
+        launching = set(
+            [name for name, entry in unfinished
+             if entry['state'] == 'launching'])
+        by_name = {}
+        if launching:
+            for d in self.provider.get_instances(
+                    env=self.config.get_env_name(), max_age=0):
+                if d.name in launching:
+                    by_name[d.name] = d
+
+        provision = Pipeline(
+            self.STAGES, limits=self.limits, metrics=self.metrics,
+            timeout=self.OP_TIMEOUT)
+        adopted = 0
+        for name, entry in unfinished:
+            if entry['state'] == 'launching':
+                instance = by_name.get(name)
+                if instance is None:
+                    # Launch never reached the provider, retry it.
+                    journal.remove(name)
+                    continue
+                entry['state'] = 'launched'
+            else:
+                try:
+                    instance = self.provider.get_instance(entry['instance_id'])
+                except ProviderAPIError, e:
+                    log.warning("Instance %s of %s is gone (%s), replacing",
+                                entry['instance_id'], name, e)
+                    journal.remove(name)
+                    continue
+            log.info("Resuming %s from %s", name, entry['state'])
+            self.queue_adopted(provision, journal, instance, entry['state'])
+            adopted += 1
+
+        data = journal.load()
+        self.queue_new(
+            provision, journal,
+            data['total'] - len(journal.registered()) - adopted)
+        return provision
+
 
+class FillPool(BaseCommand):
+
+    # Pool members are launched and ssh verified, but not registered.
+    STAGES = AddMachine.STAGES[:-1]
+
+    def run(self):
+        """Bring the warm pool for the constraints and series to size.
+        """
+        keys = self.check_preconditions()
+        image, size, region = self.solve_constraints()
         template = dict(
             image_id=image, size_id=size, region_id=region, ssh_key_ids=keys)
+        pool = self.get_pool()
+        members = pool.members(template, max_age=0)
+        target = self.config.num_machines
 
-        for n in range(self.config.num_machines):
-            params = dict(template)
-            params['name'] = "%s-%s" % (
-                self.config.get_env_name(), uuid.uuid4().hex)
-            self.runner.queue_op(
-                ops.MachineRegister(
-                    self.provider, self.env, params, series=self.config.series,
-                    key=self.config.options.ssh_key))
+        for m in members[target:]:
+            log.info("Terminating surplus pool instance %s", m.id)
+            self.provider.terminate_instance(m.id)
+        if len(members) >= target:
+            return
 
-        for (instance, machine_id) in self.runner.iter_results():
-            log.info("Registered id:%s name:%s ip:%s as juju machine",
-                     instance.id, instance.name, instance.ip_address)
+        log.info("Launching %d pool instances...", target - len(members))
+        self.fill_pool(pool, template, target - len(members))
 
 
 class TerminateMachine(BaseCommand):
@@ -168,32 +456,75 @@ class TerminateMachine(BaseCommand):
         self._terminate_machines(lambda x: x in self.config.options.machines)
 
     def _terminate_machines(self, machine_filter):
+        machines, instance_ids, removals = self._queue_terminations(
+            machine_filter)
+        for result in self.runner.iter_results():
+            pass
+        return machines, instance_ids
+
+    def resolve_instances(self, machines, machine_ids):
+        """Map machine ids to instance ids.
+
+        Machines are looked up in the index, only those missing from it
+        cost a listing of the account's instances.
+        """
+        index = self.get_index()
+        resolved = {}
+        missing = {}
+        for mid in machine_ids:
+            address = machines[mid]['dns-name']
+            instance_id = index.resolve(mid, address)
+            if instance_id is None:
+                missing[address] = mid
+            else:
+                resolved[mid] = instance_id
+        if not missing:
+            return resolved
+        log.debug("Machines %s not indexed, listing instances",
+                  " ".join(sorted(missing.values())))
+        for d in self.provider.get_instances(max_age=0):
+            mid = missing.get(d.ip_address)
+            if mid is not None:
+                resolved[mid] = d.id
+                index.add(mid, d)
+        return resolved
+
+    def _queue_terminations(self, machine_filter, resolve=()):
+        """Queue ops removing matching machines from juju and provider.
+
+        Returns the env's machines, instance ids by machine id of those
+        removed (and of the `resolve` machines) and the ops removing
+        machines from juju state.
+        """
         log.debug("Checking for machines to terminate")
-        status = self.env.status()
-        machines = status.get('machines', {})
+        self.status.refresh()
+        machines = self.status.snapshot()
 
         # Using the api instance-id can be the provider id, but
         # else it defaults to ip, and we have to disambiguate.
         remove = []
-        for m in machines:
+        for m in sorted(machines):
             if machine_filter(m):
                 remove.append(
                     {'address': machines[m]['dns-name'],
                      'instance_id': machines[m]['instance-id'],
                      'machine_id': m})
 
-        address_map = dict([(d.ip_address, d) for
-                            d in self.provider.get_instances()])
+        instance_ids = self.resolve_instances(
+            machines, [m['machine_id'] for m in remove] +
+            [mid for mid in resolve if mid in machines])
+        removals = []
         if not remove:
-            return status, address_map
+            return machines, instance_ids, removals
 
         log.info("Terminating machines %s",
                  " ".join([m['machine_id'] for m in remove]))
 
+        terminations = self.get_terminations()
         for m in remove:
-            instance = address_map.get(m['address'])
+            instance_id = instance_ids.get(m['machine_id'])
             env_only = False  # Remove from only env or also provider.
-            if instance is None:
+            if instance_id is None:
                 log.warning(
                     "Couldn't resolve machine %s's address %s to instance" % (
                         m['machine_id'], m['address']))
@@ -201,23 +532,27 @@ class TerminateMachine(BaseCommand):
                 # find in provider. Remove it from state so destroy
                 # can proceed.
                 env_only = True
-                instance_id = None
-            else:
-                instance_id = instance.id
-            self.runner.queue_op(
-                ops.MachineDestroy(
-                    self.provider, self.env, {
-                        'machine_id': m['machine_id'],
-                        'instance_id': instance_id},
-                    env_only=env_only))
-        for result in self.runner.iter_results():
-            pass
-
-        return status, address_map
+            params = {'machine_id': m['machine_id'],
+                      'instance_id': instance_id}
+            removal = ops.MachineDestroy(
+                self.provider, self.env, params, env_only=True,
+                terminations=terminations, index=self.get_index())
+            self.runner.queue_op(removal)
+            removals.append(removal)
+            # The instance goes once juju let go of the machine.
+            if not env_only:
+                self.runner.queue_op(ops.MachineDestroy(
+                    self.provider, self.env, params, iaas_only=True,
+                    index=self.get_index()).after(removal))
+
+        return machines, instance_ids, removals
 
 
 class DestroyEnvironment(TerminateMachine):
 
+    # Deadline for juju to catch up with removed machines.
+    SETTLE_TIMEOUT = 120
+
     def run(self):
         """Destroy environment.
         """
@@ -233,33 +568,54 @@ class DestroyEnvironment(TerminateMachine):
         if force:
             return self.force_environment_destroy()
 
-        env_status, instance_map = self._terminate_machines(
-            state_service_filter)
+        machines, instance_ids, removals = self._queue_terminations(
+            state_service_filter, resolve=['0'])
 
-        # sadness, machines are marked dead, but juju is async to
-        # reality. either sleep (racy) or retry loop, 10s seems to
-        # plenty of time.
-        time.sleep(10)
-
-        log.info("Destroying environment")
-        self.env.destroy_environment()
+        # Destroy the environment as soon as its machines are out of
+        # juju state, while their instances are still terminating.
+        destroy = ops.EnvironmentDestroy(
+            self.provider, self.env, {'name': self.config.get_env_name()},
+            status=self.status,
+            machine_ids=[r.params['machine_id'] for r in removals],
+            settle_timeout=self.SETTLE_TIMEOUT).after(*removals)
+        self.runner.queue_op(destroy)
 
         # Remove the state server.
-        bootstrap_host = env_status.get(
-            'machines', {}).get('0', {}).get('dns-name')
-        instance = instance_map.get(bootstrap_host)
-        if instance:
-            log.info("Terminating state server")
-            self.provider.terminate_instance(instance.id)
+        instance_id = instance_ids.get('0')
+        if instance_id:
+            self.runner.queue_op(ops.MachineDestroy(
+                self.provider, self.env, {'instance_id': instance_id},
+                iaas_only=True).after(destroy))
+
+        # Let every op finish, ie. instances still terminating, before
+        # reporting failures.
+        failed = {}
+        destroy_error = None
+        for result in self.runner.iter_results():
+            if result.ok:
+                continue
+            if result.op in removals:
+                failed[result.op.params['machine_id']] = result.error
+            elif result.op is destroy:
+                destroy_error = result.error
+        if failed:
+            raise PrecheckError(
+                "Environment not destroyed, removing machines failed: %s" % (
+                    ", ".join("%s (%s)" % (mid, failed[mid])
+                              for mid in sorted(failed))))
+        if destroy_error is not None:
+            raise destroy_error
+        self.get_index().clear()
+        self.get_pool().drain()
         log.info("Environment Destroyed")
 
     def force_environment_destroy(self):
         env_name = self.config.get_env_name()
-        env_machines = [m for m in self.provider.get_instances()
-                        if m.name.startswith("%s-" % env_name)]
 
         log.info("Destroying environment")
-        for m in env_machines:
+        for m in self.provider.get_instances(env=env_name, max_age=0):
+            if not m.name.startswith("%s-" % env_name):
+                continue
             self.runner.queue_op(
                 ops.MachineDestroy(
                     self.provider, self.env, {'instance_id': m.id},
@@ -270,4 +626,34 @@ class DestroyEnvironment(TerminateMachine):
 
         # Fast destroy the client cache by removing the jenv file.
         self.env.destroy_environment_jenv()
+        self.get_index().clear()
         log.info("Environment Destroyed")
+
+
+class Reconcile(BaseCommand):
+    """Rebuild the machine index from juju status and the provider.
+    """
+
+    def run(self):
+        self.status.refresh()
+        machines = self.status.snapshot()
+        addresses = dict(
+            (m['dns-name'], mid) for mid, m in machines.items())
+        entries = {}
+        for d in self.provider.get_instances(max_age=0):
+            mid = addresses.get(d.ip_address)
+            if mid is not None:
+                entries[mid] = entry_for(mid, d)
+        for mid in sorted(set(machines) - set(entries)):
+            log.warning("Machine %s at %s has no instance", mid,
+                        machines[mid]['dns-name'])
+
+        index = self.get_index()
+        indexed = index.entries()
+        added = set(entries) - set(indexed)
+        removed = set(indexed) - set(entries)
+        changed = [mid for mid in set(entries) & set(indexed)
+                   if entries[mid] != indexed[mid]]
+        index.replace(entries)
+        log.info("Reconciled machine index, %d added %d changed %d removed",
+                 len(added), len(changed), len(removed))
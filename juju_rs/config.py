@@ -15,7 +15,9 @@ class Config(object):
     def connect_provider(self):
         """Connect to digital ocean.
         """
-        return provider.factory()
+        return provider.factory(
+            cache_dir=self.cache_dir, refresh_cache=self.refresh_cache,
+            parallel=self.parallel)
 
     def connect_environment(self):
         """Return a websocket connection to the environment.
@@ -42,6 +44,22 @@ class Config(object):
     def upload_tools(self):
         return getattr(self.options, 'upload_tools', False)
 
+    @property
+    def refresh_cache(self):
+        return getattr(self.options, 'refresh_cache', False)
+
+    @property
+    def parallel(self):
+        return getattr(self.options, 'parallel', None)
+
+    @property
+    def resume(self):
+        return getattr(self.options, 'resume', False)
+
+    @property
+    def warm_pool(self):
+        return getattr(self.options, 'warm_pool', 0)
+
     @property
     def num_machines(self):
         return getattr(self.options, 'num_machines', 0)
@@ -56,6 +74,12 @@ class Config(object):
                 os.path.join('APPDATA'), "Juju")
         return os.path.expanduser("~/.juju")
 
+    @property
+    def cache_dir(self):
+        """Plugin private state (api tokens, caches) within juju home.
+        """
+        return os.path.join(self.juju_home, "rspace")
+
     def get_env_name(self):
         """Get the environment name.
         """
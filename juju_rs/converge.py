@@ -0,0 +1,68 @@
+"""
+Wait for state to converge instead of sleeping and hoping.
+
+Juju applies changes asynchronously, ie. a terminated machine lingers
+in state for a while. A Convergence polls a check for what is still
+outstanding, fast at first and backing off while nothing changes, until
+nothing is left or its deadline passes.
+"""
+
+import logging
+import time
+
+from juju_rs.exceptions import TimeoutError
+
+log = logging.getLogger("juju.rspace")
+
+
+class Convergence(object):
+    """Poll `check` until it returns nothing outstanding.
+
+    `check` returns a collection of the items still being waited on.
+    """
+
+    MIN_INTERVAL = 0.25
+    MAX_INTERVAL = 5
+    BACKOFF = 1.5
+    TIMEOUT = 120
+    # Seconds between progress messages.
+    PROGRESS_INTERVAL = 10
+
+    def __init__(self, name, check, timeout=TIMEOUT):
+        self.name = name
+        self.check = check
+        self.timeout = timeout
+
+    def wait(self):
+        """Return seconds taken to converge, raises TimeoutError if the
+        deadline passed first.
+        """
+        started = time.time()
+        deadline = started + self.timeout
+        interval = self.MIN_INTERVAL
+        reported = started
+        remaining = initial = None
+        while True:
+            outstanding = self.check()
+            now = time.time()
+            if not outstanding:
+                log.debug("%s converged in %0.2fs", self.name, now - started)
+                return now - started
+            if initial is None:
+                initial = len(outstanding)
+            if now >= deadline:
+                raise TimeoutError(
+                    "%s did not converge in %ds, waiting on %s" % (
+                        self.name, self.timeout,
+                        " ".join(sorted(map(str, outstanding)))))
+            if remaining is not None and len(outstanding) < remaining:
+                # Progress, things are moving again.
+                interval = self.MIN_INTERVAL
+            else:
+                interval = min(self.MAX_INTERVAL, interval * self.BACKOFF)
+            remaining = len(outstanding)
+            if now - reported >= self.PROGRESS_INTERVAL:
+                reported = now
+                log.info("Waiting for %s, %d of %d remaining",
+                         self.name, remaining, initial)
+            time.sleep(min(interval, deadline - now))
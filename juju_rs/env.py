@@ -3,24 +3,82 @@ import logging
 import shutil
 import subprocess
 import socket
+import ssl
+import threading
 
 import os
 import yaml
 
 log = logging.getLogger("juju.rspace")
 
+from juju_rs.api import APIConnection, ConnectionClosed
 from juju_rs.constraints import SERIES_MAP
+from juju_rs.exceptions import JujuAPIError
+from juju_rs import ssh
 
 
 class Environment(object):
 
     def __init__(self, config):
         self.config = config
+        self.api_lock = threading.Lock()
+        self._api = None
+        self.api_failed = False
+
+    def api(self):
+        """Shared api server connection, or None to use the juju cli.
+
+        A failed connection isn't retried, so we fall back to the cli
+        once instead of per call.
+        """
+        with self.api_lock:
+            if self._api is not None and not self._api.closed:
+                return self._api
+            if self.api_failed:
+                return None
+            jenv = self.jenv_path()
+            if not os.path.exists(jenv):
+                return None
+            try:
+                self._api = APIConnection.from_jenv(jenv)
+            except (socket.error, ssl.SSLError, JujuAPIError), e:
+                log.debug("Using juju cli, api connection failed: %s", e)
+                self.api_failed = True
+                return None
+            return self._api
+
+    def close_api(self):
+        with self.api_lock:
+            api, self._api = self._api, None
+        if api is not None:
+            api.close()
+
+    def _call_api(self, method, *args):
+        """Call method on the api connection.
+
+        Returns (True, result), or (False, None) if the cli must be used.
+        """
+        api = self.api()
+        if api is None:
+            return False, None
+        try:
+            return True, getattr(api, method)(*args)
+        except ConnectionClosed, e:
+            log.warning("Lost api connection, using juju cli: %s", e)
+            with self.api_lock:
+                self.api_failed = True
+            return False, None
+
+    def jenv_path(self):
+        return os.path.join(
+            self.config.juju_home, "environments",
+            "%s.jenv" % self.config.get_env_name())
 
     def _run(self, command, env=None, capture_err=False):
         if env is None:
             env = dict(os.environ)
         env["JUJU_ENV"] = self.config.get_env_name()
+        ssh.mux.update_env(env)
         args = ['juju']
         args.extend(command)
         log.debug("Running juju command: %s", " ".join(args))
@@ -37,14 +95,15 @@ class Environment(object):
             raise
 
     def status(self):
+        used_api, status = self._call_api('status')
+        if used_api:
+            return status
         return yaml.safe_load(self._run(['status']))
 
     def is_running(self):
         """Try to connect the api server websocket to see if env is running.
         """
-        name = self.config.get_env_name()
-        jenv = os.path.join(
-            self.config.juju_home, "environments", "%s.jenv" % name)
+        jenv = self.jenv_path()
         if not os.path.exists(jenv):
             return False
         with open(jenv) as fh:
@@ -72,11 +131,20 @@ class Environment(object):
         return self._run(ops, capture_err=debug)
 
     def terminate_machines(self, machines):
+        used_api, result = self._call_api('destroy_machines', machines)
+        if used_api:
+            return result
         cmd = ['terminate-machine', '--force']
         cmd.extend(machines)
         return self._run(cmd)
 
     def destroy_environment(self):
+        used_api, result = self._call_api('destroy_environment')
+        if used_api:
+            # The cli would also remove the jenv.
+            self.close_api()
+            self.destroy_environment_jenv()
+            return result
         cmd = [
             'destroy-environment', "-y", self.config.get_env_name()]
         return self._run(cmd)
@@ -89,9 +157,7 @@ class Environment(object):
         will work, but will wait for a timeout to connect to the state server
         before doing the same.
         """
-        env_name = self.config.get_env_name()
-        jenv_path = os.path.join(
-            self.config.juju_home, "environments", "%s.jenv" % env_name)
+        jenv_path = self.jenv_path()
         if os.path.exists(jenv_path):
             os.remove(jenv_path)
 
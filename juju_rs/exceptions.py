@@ -40,3 +40,16 @@ class ProviderAPIError(Exception):
         return "<ProviderAPIError message:%s response:%r>" % (
             self.message or "Unknown",
             self.response.status_code)
+
+
+class JujuAPIError(Exception):
+    """ Juju api server returned an error.
+    """
+    def __init__(self, message, code=None):
+        self.message = message
+        self.code = code
+
+    def __str__(self):
+        if self.code:
+            return "%s (%s)" % (self.message, self.code)
+        return self.message
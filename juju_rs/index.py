@@ -0,0 +1,96 @@
+"""
+Local index of an environment's machines and their instances.
+
+Resolving a juju machine to its droplet otherwise means listing every
+droplet in the account. Machines are indexed by juju machine id with
+their instance id, name and public/private addresses as they are
+registered and destroyed, so terminations look them up directly. The
+reconcile command repairs drift against the provider and juju.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from juju_rs.jsonfile import write_json
+
+log = logging.getLogger("juju.rspace")
+
+
+def entry_for(machine_id, instance):
+    return {'machine_id': machine_id,
+            'instance_id': instance.id,
+            'name': instance.name,
+            'public_ip': instance.ip_address,
+            'private_ip': getattr(instance, 'private_ip_address', None)}
+
+
+class MachineIndex(object):
+    """Machine id to instance entries, saved as they change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = None
+
+    def _load(self):
+        if self.data is None:
+            self.data = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as fh:
+                        self.data = json.load(fh)
+                except ValueError:
+                    log.warning("Ignoring corrupt machine index %s",
+                                self.path)
+        return self.data
+
+    def add(self, machine_id, instance):
+        with self.lock:
+            self._load()[machine_id] = entry_for(machine_id, instance)
+            self._save()
+
+    def remove(self, machine_id=None, instance_id=None):
+        """Drop the entry of a machine, or of its instance.
+        """
+        with self.lock:
+            for mid, entry in self._load().items():
+                if mid == machine_id or (
+                        instance_id is not None and
+                        entry['instance_id'] == instance_id):
+                    del self.data[mid]
+            self._save()
+
+    def get(self, machine_id):
+        with self.lock:
+            entry = self._load().get(machine_id)
+            return entry and dict(entry)
+
+    def resolve(self, machine_id, address):
+        """Instance id of a machine, if indexed at that address.
+        """
+        entry = self.get(machine_id)
+        if entry is None or address not in (
+                entry['public_ip'], entry['private_ip']):
+            return None
+        return entry['instance_id']
+
+    def entries(self):
+        with self.lock:
+            return dict((k, dict(v)) for k, v in self._load().items())
+
+    def replace(self, entries):
+        with self.lock:
+            self.data = dict(entries)
+            self._save()
+
+    def clear(self):
+        with self.lock:
+            self.data = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        write_json(self.path, self.data)
@@ -0,0 +1,183 @@
+"""
+Cached inventory of the account's droplets.
+
+Listing every droplet in the account is the slowest call commands make,
+and list-machines, terminate-machine and destroy-environment all make
+it. The inventory keeps a snapshot of droplets on disk, indexed by name
+prefix so an environment's machines (<env>-*) are looked up directly.
+
+The v1 api has no changes-since or updated-at query, so refreshes are
+full listings diffed against the snapshot. In between, the provider
+writes its own launches, renames and terminations through. These are
+saved with the next refresh, at most every SAVE_INTERVAL seconds, or on
+save().
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from juju_rs.client import Droplet
+from juju_rs.jsonfile import write_json
+
+log = logging.getLogger("juju.rspace")
+
+
+def name_prefixes(name):
+    """Dash separated prefixes of a name, ie. a-b-c gives a and a-b.
+    """
+    parts = (name or '').split('-')
+    return ['-'.join(parts[:i]) for i in range(1, len(parts))]
+
+
+class Inventory(object):
+    """Droplet snapshot refreshed after `ttl` seconds, persisted to path.
+
+    When `refresh` is set the persisted snapshot is not used.
+    """
+
+    DEFAULT_TTL = 60
+    # Minimum seconds between saving write throughs.
+    SAVE_INTERVAL = 5
+
+    def __init__(self, client, path=None, account=None, ttl=DEFAULT_TTL,
+                 refresh=False):
+        self.client = client
+        self.path = path
+        self.account = account
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.droplets = {}
+        self.prefixes = collections.defaultdict(set)
+        self.fetched = 0
+        # Write through count, and the count as of each droplet's last
+        # write, so refreshes don't undo writes made while listing.
+        self.writes = 0
+        self.written = {}
+        self.dirty = False
+        self.saved = 0
+        if path and not refresh:
+            self._load()
+
+    def get_instances(self, env=None, max_age=None):
+        """Droplets in the account, or only those named <env>-*.
+
+        The snapshot is refreshed if older than max_age seconds, which
+        defaults to the ttl. Pass 0 for an up to date listing.
+        """
+        if max_age is None:
+            max_age = self.ttl
+        if time.time() - self.fetched > max_age:
+            self.refresh()
+        with self.lock:
+            if env is None:
+                ids = self.droplets.keys()
+            else:
+                ids = self.prefixes.get(env, ())
+            return [self.droplets[i] for i in sorted(ids)]
+
+    def refresh(self):
+        """Relist the account, applying differences to the snapshot.
+
+        Returns the ids of droplets added, changed and removed.
+        """
+        started = time.time()
+        with self.lock:
+            known = set(self.droplets)
+            writes = self.writes
+        listed = dict((d.id, d) for d in self.client.iter_droplets())
+        with self.lock:
+            # Written through since the listing started, so newer than it.
+            fresh = set(i for i, n in self.written.items() if n > writes)
+            added = set(listed) - set(self.droplets) - fresh
+            removed = (known & set(self.droplets)) - set(listed) - fresh
+            changed = set(
+                i for i in (set(listed) & set(self.droplets)) - fresh
+                if listed[i].to_dict() != self.droplets[i].to_dict())
+            for i in removed:
+                self._remove(i)
+            for i in added | changed:
+                self._put(listed[i])
+            self.fetched = started
+            self._save()
+        log.debug("Inventory refreshed, %d added %d changed %d removed",
+                  len(added), len(changed), len(removed))
+        return added, changed, removed
+
+    def put(self, droplet):
+        """Write through a launched or updated droplet.
+        """
+        with self.lock:
+            self._put(droplet)
+            self._written(droplet.id)
+
+    def rename(self, droplet_id, name):
+        with self.lock:
+            droplet = self.droplets.get(droplet_id)
+            if droplet is None:
+                return
+            data = droplet.to_dict()
+            data['name'] = name
+            self._put(Droplet.from_dict(data))
+            self._written(droplet_id)
+
+    def remove(self, droplet_id):
+        with self.lock:
+            self._remove(droplet_id)
+            self._written(droplet_id)
+
+    def save(self):
+        """Persist write throughs not yet saved.
+        """
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def _written(self, droplet_id):
+        self.writes += 1
+        self.written[droplet_id] = self.writes
+        self.dirty = True
+        if time.time() - self.saved >= self.SAVE_INTERVAL:
+            self._save()
+
+    def _put(self, droplet):
+        self._remove(droplet.id)
+        self.droplets[droplet.id] = droplet
+        for prefix in name_prefixes(droplet.name):
+            self.prefixes[prefix].add(droplet.id)
+
+    def _remove(self, droplet_id):
+        droplet = self.droplets.pop(droplet_id, None)
+        if droplet is None:
+            return
+        for prefix in name_prefixes(droplet.name):
+            self.prefixes[prefix].discard(droplet_id)
+            if not self.prefixes[prefix]:
+                del self.prefixes[prefix]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except (IOError, ValueError):
+            log.debug("Ignoring unreadable inventory %s", self.path)
+            return
+        if data.get('account') != self.account:
+            return
+        for d in data.get('droplets', []):
+            self._put(Droplet.from_dict(d))
+        self.fetched = data.get('fetched', 0)
+
+    def _save(self):
+        self.dirty = False
+        self.saved = time.time()
+        if not self.path:
+            return
+        write_json(self.path, {
+            'account': self.account, 'fetched': self.fetched,
+            'droplets': [d.to_dict() for d in self.droplets.values()]})
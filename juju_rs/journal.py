@@ -0,0 +1,90 @@
+"""
+Durable progress journal for bulk add-machine.
+
+Each machine's progress (launching, launched, ready, ssh_ok, registered)
+is recorded as it happens, so an interrupted or partially failed batch
+can be resumed, adopting instances that were already launched instead
+of orphaning them and paying for boot time again.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from juju_rs.jsonfile import write_json
+
+log = logging.getLogger("juju.rspace")
+
+# Machine states, in order of progress.
+STATES = ('launching', 'launched', 'ready', 'ssh_ok', 'registered')
+
+
+class Journal(object):
+    """Journal file rewritten atomically on every update.
+
+    The journal holds the batch template (launch params and options),
+    the requested machine total and per machine entries keyed by name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = None
+
+    def load(self):
+        with self.lock:
+            return self._load()
+
+    def _load(self):
+        if self.data is None:
+            self.data = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as fh:
+                        self.data = json.load(fh)
+                except ValueError:
+                    log.warning("Ignoring corrupt journal %s", self.path)
+        return self.data
+
+    def exists(self):
+        return bool(self.load())
+
+    def start(self, total, template, options):
+        with self.lock:
+            self.data = {'total': total, 'template': template,
+                         'options': options, 'machines': {}}
+            self._save()
+
+    def record(self, name, state, **fields):
+        with self.lock:
+            entry = self._load().setdefault('machines', {}).setdefault(
+                name, {})
+            entry.update(fields)
+            entry['state'] = state
+            self._save()
+
+    def remove(self, name):
+        with self.lock:
+            self._load().get('machines', {}).pop(name, None)
+            self._save()
+
+    def unfinished(self):
+        """Return (name, entry) pairs of machines not yet registered.
+        """
+        machines = self.load().get('machines', {})
+        return [(name, dict(entry)) for name, entry in sorted(
+            machines.items()) if entry['state'] != 'registered']
+
+    def registered(self):
+        return [name for name, entry in self.load().get(
+            'machines', {}).items() if entry['state'] == 'registered']
+
+    def clear(self):
+        with self.lock:
+            self.data = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _save(self):
+        write_json(self.path, self.data)
@@ -0,0 +1,31 @@
+"""
+Atomic writes of the json state files kept in the cache directory.
+
+Tokens, catalog responses, the droplet inventory, the machine index and
+add-machine journals are all rewritten as a whole. Writing to a temp
+file, syncing it and renaming it over the old one means readers, and a
+crash midway, only ever see the previous or the new content.
+"""
+
+import json
+import os
+import thread
+
+
+def write_json(path, data, mode=0666):
+    """Atomically replace path with data serialized as json.
+
+    Missing directories are created. The file is created with `mode`
+    (less the umask), ie. 0600 for credentials.
+    """
+    parent = os.path.dirname(path)
+    if parent and not os.path.exists(parent):
+        os.makedirs(parent)
+    # Unique per writer so concurrent saves don't share a temp file.
+    tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), thread.get_ident())
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.rename(tmp_path, path)
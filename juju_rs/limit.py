@@ -0,0 +1,170 @@
+"""
+Adaptive (AIMD) concurrency limits for bulk operations.
+
+Ops hold a slot of the limit for the resource they call, the provider
+api or the juju state server, while they call it. Each limit grows by
+one slot per window of healthy completions, and is halved on throttling,
+timeouts, connection failures or when tail latency rises well above the
+lowest latency seen.
+"""
+
+import collections
+import contextlib
+import logging
+import re
+import socket
+import subprocess
+import threading
+import time
+
+import requests
+
+from juju_rs.exceptions import ProviderAPIError, TimeoutError
+from juju_rs.retry import THROTTLE_STATUSES, TRANSIENT_STATUSES
+
+log = logging.getLogger("juju.rspace")
+
+PROVIDER = 'provider'
+JUJU = 'juju'
+
+# Starting and maximum concurrency per resource.
+PROVIDER_INITIAL, PROVIDER_MAX = 4, 32
+JUJU_INITIAL, JUJU_MAX = 2, 16
+
+# Juju cli output of failures to reach or hear back from the state server.
+JUJU_CONGESTION = re.compile(
+    r"timeout|timed out|connection refused|connection reset|"
+    r"unable to connect|no reachable servers|broken pipe", re.I)
+
+
+def is_congestion(error):
+    """Whether an error indicates an overloaded resource.
+    """
+    if isinstance(error, ProviderAPIError):
+        status = getattr(error.response, 'status_code', None)
+        return status in THROTTLE_STATUSES or status in TRANSIENT_STATUSES
+    if isinstance(error, subprocess.CalledProcessError):
+        # Only the cli failing to reach the state server, not a refusal
+        # of the command itself.
+        return bool(JUJU_CONGESTION.search(error.output or ''))
+    return isinstance(error, (
+        TimeoutError, requests.ConnectionError, requests.Timeout,
+        socket.error))
+
+
+class AdaptiveLimit(object):
+    """Concurrency limit adjusted by additive increase, multiplicative
+    decrease between `minimum` and `maximum`.
+    """
+
+    # Multiplier over baseline latency at which the tail is unhealthy.
+    LATENCY_FACTOR = 3.0
+    WINDOW = 20
+    PERCENTILE = 0.95
+
+    def __init__(self, name, initial, minimum=1, maximum=64):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.active = 0
+        self.cond = threading.Condition()
+        self.latencies = collections.deque(maxlen=self.WINDOW)
+        self.baseline = None
+        # Completions to ignore congestion for after a decrease, ops
+        # already in flight saw the old limit.
+        self.cooldown = 0
+
+    @property
+    def fixed(self):
+        return self.minimum == self.maximum
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= int(self.limit):
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, latency, error=None):
+        with self.cond:
+            self.active -= 1
+            if not self.fixed:
+                self._adjust(latency, error)
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self):
+        self.acquire()
+        started = time.time()
+        try:
+            yield
+        except Exception, e:
+            self.release(time.time() - started, e)
+            raise
+        self.release(time.time() - started)
+
+    def _adjust(self, latency, error):
+        if self.cooldown:
+            self.cooldown -= 1
+        if error is not None:
+            if is_congestion(error):
+                self._decrease(error.__class__.__name__)
+            return
+
+        self.latencies.append(latency)
+        if len(self.latencies) == self.latencies.maxlen:
+            ordered = sorted(self.latencies)
+            median = ordered[len(ordered) // 2]
+            tail = ordered[int(self.PERCENTILE * (len(ordered) - 1))]
+            if self.baseline is None or median < self.baseline:
+                self.baseline = median
+            if tail > self.baseline * self.LATENCY_FACTOR:
+                self.latencies.clear()
+                self._decrease("p95 latency %0.2fs" % tail)
+                return
+        # One more slot per limit's worth of healthy completions.
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, reason):
+        if self.cooldown:
+            return
+        limit = max(self.minimum, self.limit / 2)
+        if int(limit) < int(self.limit):
+            log.debug("Reducing %s concurrency to %d (%s)",
+                      self.name, int(limit), reason)
+        self.limit = limit
+        self.cooldown = int(self.limit)
+
+
+class Limits(dict):
+    """Limits by resource name, unknown resources are unlimited.
+    """
+
+    @classmethod
+    def create(cls, parallel=None):
+        """Adaptive provider and juju limits, or fixed ones at parallel.
+        """
+        if parallel:
+            return cls({
+                PROVIDER: AdaptiveLimit(
+                    PROVIDER, parallel, parallel, parallel),
+                JUJU: AdaptiveLimit(JUJU, parallel, parallel, parallel)})
+        return cls({
+            PROVIDER: AdaptiveLimit(
+                PROVIDER, PROVIDER_INITIAL, maximum=PROVIDER_MAX),
+            JUJU: AdaptiveLimit(JUJU, JUJU_INITIAL, maximum=JUJU_MAX)})
+
+    @property
+    def maximum(self):
+        return max([l.maximum for l in self.values()])
+
+    def slot(self, name):
+        limit = self.get(name)
+        if limit is None:
+            return _no_limit()
+        return limit.slot()
+
+
+@contextlib.contextmanager
+def _no_limit():
+    yield
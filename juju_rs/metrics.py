@@ -0,0 +1,85 @@
+"""
+Timing and counters for bulk operations.
+
+The runner and pipeline record how long ops wait in queues and how busy
+their workers are, ops record the duration and api retries of each of
+their phases (launch, wait_on, verify_ssh, add_machine, ...). Samples
+are summarized as count, p50, p95 and max.
+"""
+
+import collections
+import math
+import threading
+
+
+def percentile(ordered, fraction):
+    """Nearest rank percentile of a sorted list.
+    """
+    if not ordered:
+        return 0
+    rank = int(math.ceil(fraction * len(ordered))) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = collections.defaultdict(list)
+        self.counters = collections.defaultdict(int)
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples[name].append(seconds)
+
+    def incr(self, name, count=1):
+        with self.lock:
+            self.counters[name] += count
+
+    def __nonzero__(self):
+        return bool(self.samples or self.counters)
+
+    def summary(self):
+        """Return stats by timing name, and counters.
+        """
+        with self.lock:
+            samples = dict((k, sorted(v)) for k, v in self.samples.items())
+            counters = dict(self.counters)
+        timings = {}
+        for name, ordered in samples.items():
+            timings[name] = dict(
+                count=len(ordered), total=sum(ordered),
+                p50=percentile(ordered, 0.5), p95=percentile(ordered, 0.95),
+                max=ordered[-1])
+        return {'timings': timings, 'counters': counters}
+
+    def utilization(self, timings, suffix=""):
+        busy = timings.get('worker_busy' + suffix, {}).get('total', 0)
+        idle = timings.get('worker_idle' + suffix, {}).get('total', 0)
+        if not busy + idle:
+            return None
+        return float(busy) / (busy + idle)
+
+    def report(self):
+        """Summary as lines of text for the end of a command.
+        """
+        summary = self.summary()
+        timings = summary['timings']
+        lines = ["{:<24} {:>6} {:>8} {:>8} {:>8}".format(
+            "Timing (s)", "Count", "p50", "p95", "Max")]
+        for name in sorted(timings):
+            if name.startswith('worker_'):
+                continue
+            t = timings[name]
+            lines.append("{:<24} {:>6} {:>8.2f} {:>8.2f} {:>8.2f}".format(
+                name, t['count'], t['p50'], t['p95'], t['max']))
+        for name, count in sorted(summary['counters'].items()):
+            lines.append("{:<24} {:>6}".format(name, count))
+        suffixes = sorted(set(
+            [name[len('worker_busy'):] for name in timings
+             if name.startswith('worker_busy')]))
+        for suffix in suffixes:
+            lines.append("{:<24} {:>5.0f}%".format(
+                "utilization" + suffix,
+                100 * (self.utilization(timings, suffix) or 0)))
+        return lines
@@ -1,8 +1,14 @@
+import contextlib
 import logging
 import time
 import subprocess
 
+from juju_rs.converge import Convergence
 from juju_rs.exceptions import TimeoutError
+from juju_rs.journal import STATES
+from juju_rs.limit import Limits, JUJU, PROVIDER
+from juju_rs import probe
+from juju_rs import retry
 from juju_rs import ssh
 
 log = logging.getLogger("juju.rspace")
@@ -10,36 +16,128 @@ log = logging.getLogger("juju.rspace")
 
 class MachineOp(object):
 
+    # Concurrency limits by resource and metrics, bound by the runner.
+    limits = None
+    metrics = None
+
+    # Ops which must succeed before this one runs.
+    depends_on = ()
+
     def __init__(self, provider, env, params, **options):
         self.provider = provider
         self.env = env
         self.params = params
         self.created = time.time()
         self.options = options
+        # Seconds spent in each phase, and api retries made.
+        self.timings = {}
+        self.retries = 0
 
     def run(self):
         raise NotImplementedError()
 
+    def after(self, *ops):
+        """Run this op once the given ops succeeded.
+        """
+        self.depends_on = tuple(self.depends_on) + ops
+        return self
+
+    def slot(self, resource):
+        """Hold a concurrency slot while calling the provider or juju.
+        """
+        return (self.limits or Limits()).slot(resource)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase of the op, ie. launch or add_machine.
+        """
+        retries = retry.thread_retries()
+        started = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+            retries = retry.thread_retries() - retries
+            self.timings[name] = self.timings.get(name, 0) + elapsed
+            self.retries += retries
+            if self.metrics is not None:
+                self.metrics.record(name, elapsed)
+                if retries:
+                    self.metrics.incr('retries', retries)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.params.get(
+            'name') or self.params.get('machine_id') or self.params.get(
+                'instance_id'))
+
 
 class MachineAdd(MachineOp):
+    """Launch an instance and wait for it to be reachable over ssh.
+
+    Each of `stages` is a method which can be run on its own, so a
+    pipeline can move many machines through them independently.
+    """
 
     timeout = 360
-    delay = 8
+    delay = 2
+
+    stages = ('launch', 'wait', 'verify')
+
+    # Journal state reached after each stage.
+    stage_states = {'launch': 'launched', 'wait': 'ready', 'verify': 'ssh_ok'}
+
+    instance = None
+    completed = ()
 
     def run(self):
-        instance = self.provider.launch_instance(self.params)
-        self.provider.wait_on(instance)
-        instance = self.provider.get_instance(instance.id)
-        self.verify_ssh(instance)
-        return instance
+        for stage in self.stages:
+            if stage not in self.completed:
+                getattr(self, stage)()
+        return self.get_result()
+
+    def get_result(self):
+        return self.instance
+
+    def adopt(self, instance, state):
+        """Resume with an instance from an earlier, interrupted run.
+        """
+        self.instance = instance
+        self.completed = tuple(
+            stage for stage in self.stages
+            if self.stage_states.get(stage) and
+            STATES.index(self.stage_states[stage]) <= STATES.index(state))
+
+    def record(self, state, **fields):
+        journal = self.options.get('journal')
+        if journal is not None:
+            journal.record(self.params['name'], state, **fields)
+
+    def launch(self):
+        self.record('launching')
+        with self.slot(PROVIDER), self.phase('launch'):
+            self.instance = self.provider.launch_instance(self.params)
+        self.record('launched', instance_id=self.instance.id)
+
+    def wait(self):
+        with self.phase('wait_on'):
+            self.instance = self.provider.wait_on(self.instance)
+        self.record('ready', ip_address=self.instance.ip_address)
+
+    def verify(self):
+        with self.phase('verify_ssh'):
+            self.verify_ssh(self.instance)
+        self.record('ssh_ok')
 
     def verify_ssh(self, instance):
         """Workaround for manual provisioning and ssh availability.
 
         Manual provider bails immediately upon failure to connect on
-        ssh, we loop to allow the instance time to start ssh.
+        ssh, we wait for the ssh port to accept connections and then
+        loop to allow sshd to finish starting.
         """
         max_time = self.timeout + time.time()
+        probe.shared_probe().wait(
+            instance.ip_address, 22, timeout=self.timeout)
         running = False
         while max_time > time.time():
             try:
@@ -71,24 +169,127 @@ class MachineAdd(MachineOp):
 
 class MachineRegister(MachineAdd):
 
+    stages = MachineAdd.stages + ('register',)
+
+    machine_id = None
+
+    def get_result(self):
+        return self.instance, self.machine_id
+
+    def register(self):
+        try:
+            with self.slot(JUJU), self.phase('add_machine'):
+                self.machine_id = self.env.add_machine(
+                    "ssh:root@%s" % self.instance.ip_address,
+                    key=self.options.get('key'))
+        except:
+            self.provider.terminate_instance(self.instance.id)
+            if self.options.get('journal') is not None:
+                self.options['journal'].remove(self.params['name'])
+            raise
+        self.record('registered', machine_id=self.machine_id)
+        if self.options.get('index') is not None:
+            self.options['index'].add(self.machine_id, self.instance)
+
+
+class MachineEnlist(MachineRegister):
+    """Register the instance launched by a MachineAdd dependency.
+
+    Lets machines boot alongside work they must wait for before
+    joining juju, ie. the bootstrap of the environment.
+    """
+
+    stages = ('register',)
+
+    def run(self):
+        self.instance = self.depends_on[0].instance
+        return super(MachineEnlist, self).run()
+
+
+class EnvironmentBootstrap(MachineAdd):
+    """Launch the state server's instance and bootstrap juju on it.
+    """
+
     def run(self):
-        instance = super(MachineRegister, self).run()
         try:
-            machine_id = self.env.add_machine(
-                "ssh:root@%s" % instance.ip_address,
-                key=self.options.get('key'))
+            instance = super(EnvironmentBootstrap, self).run()
+            log.info("Bootstrapping environment...")
+            with self.phase('bootstrap'):
+                self.env.bootstrap_jenv(instance.ip_address)
         except:
-            self.provider.terminate_instance(instance.id)
+            self.terminate()
             raise
-        return instance, machine_id
+        if self.options.get('index') is not None:
+            self.options['index'].add('0', instance)
+        return instance
+
+    def terminate(self):
+        """Terminate the state server's instance, if launched.
+
+        Also called by the command when the op timed out, so whichever
+        of the two gets here first does it.
+        """
+        instance, self.instance = self.instance, None
+        if instance is not None:
+            self.provider.terminate_instance(instance.id)
+
+
+class EnvironmentDestroy(MachineOp):
+    """Destroy the juju environment once its machines are removed.
+    """
+
+    def run(self):
+        # Machines are marked dead, but juju is async to reality, wait
+        # for them to leave state (`status` option) before destroying.
+        self.wait_removed()
+        log.info("Destroying environment")
+        with self.slot(JUJU), self.phase('destroy_environment'):
+            self.env.destroy_environment()
+
+    def wait_removed(self):
+        status = self.options.get('status')
+        machine_ids = self.options.get('machine_ids')
+        if status is None or not machine_ids:
+            return
+        waiter = Convergence(
+            "removal of machines", lambda: status.present(machine_ids),
+            timeout=self.options.get('settle_timeout', Convergence.TIMEOUT))
+        try:
+            with self.phase('converge'):
+                waiter.wait()
+        except TimeoutError, e:
+            log.warning("%s, destroying environment anyway", e)
 
 
 class MachineDestroy(MachineOp):
+    """Remove a machine from juju and terminate its instance.
+
+    With a `terminations` batcher option the juju removal is batched
+    with those of other ops.
+    """
 
     def run(self):
         if not self.options.get('iaas_only'):
-            self.env.terminate_machines([self.params['machine_id']])
+            with self.phase('terminate_machine'):
+                self.terminate_machine()
         if self.options.get('env_only'):
+            if self.params.get('instance_id') is None:
+                self.unindex()
             return
         log.debug("Destroying instance %s", self.params['instance_id'])
-        self.provider.terminate_instance(self.params['instance_id'])
+        with self.slot(PROVIDER), self.phase('terminate_instance'):
+            self.provider.terminate_instance(self.params['instance_id'])
+        self.unindex()
+
+    def unindex(self):
+        if self.options.get('index') is not None:
+            self.options['index'].remove(
+                self.params.get('machine_id'), self.params.get('instance_id'))
+
+    def terminate_machine(self):
+        machine_id = self.params['machine_id']
+        terminations = self.options.get('terminations')
+        if terminations is not None:
+            return terminations.submit(machine_id)
+        with self.slot(JUJU):
+            self.env.terminate_machines([machine_id])
@@ -0,0 +1,196 @@
+"""
+Staged execution of multi step ops.
+
+Ops declaring `stages` (ie. launch, wait, verify, register) move through
+a pipeline where each stage has its own queue and concurrency limit, so
+api calls, boot waits, ssh checks and juju registrations of a large
+batch overlap instead of one op holding a runner slot end to end.
+
+Like the runner, an op whose stage runs past the deadline is reported
+as timed out and the stage's worker replaced, and Ctrl-C cancels ops
+waiting for a stage.
+"""
+
+import logging
+from Queue import Queue, Empty
+import threading
+import time
+
+from juju_rs.exceptions import TimeoutError
+from juju_rs.metrics import Metrics
+from juju_rs.runner import CancelledError, OpResult, Runner, Summary, bind_op
+
+log = logging.getLogger("juju.rspace")
+
+
+class Stage(object):
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = Queue()
+        self.workers = []
+        self.enqueued = {}
+        self.next = None
+
+
+class Pipeline(object):
+    """Run ops through named stages in order.
+
+    `stages` is a sequence of (stage name, concurrency) pairs, each op
+    method of that name is invoked by one of the stage's workers. Ops
+    are yielded by iter_results as they leave the pipeline, with `error`
+    set if a stage failed and `result` set otherwise. Stage concurrency
+    is an upper bound, ops hold a slot of `limits` for the provider or
+    juju calls they make. `timeout` is the deadline in seconds of each
+    stage of an op (None for none). Per stage queue waits and worker
+    busy/idle time go to `metrics`.
+    """
+
+    CHECK_INTERVAL = Runner.CHECK_INTERVAL
+
+    def __init__(self, stages, limits=None, metrics=None, timeout=None):
+        self.limits = limits
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        self.timeout = timeout
+        self.stages = [Stage(name, concurrency)
+                       for name, concurrency in stages]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+        self.results = Queue()
+        self.lock = threading.Lock()
+        self.running = {}
+        self.cancelled = threading.Event()
+        self.summary = Summary()
+        self.op_count = 0
+        self.started = False
+
+    def queue_op(self, op):
+        op.error = op.result = None
+        bind_op(op, self.limits, self.metrics)
+        self.put(self.stages[0], op)
+        self.op_count += 1
+
+    def iter_results(self):
+        if not self.started:
+            self.start()
+        remaining = self.op_count
+        try:
+            while remaining:
+                try:
+                    op = self.results.get(timeout=self.CHECK_INTERVAL)
+                except Empty:
+                    self.check_deadlines()
+                    continue
+                remaining -= 1
+                self.op_count -= 1
+                self.summary.add(OpResult(op, op.result, op.error))
+                yield op
+        except KeyboardInterrupt:
+            self.cancel()
+            raise
+        finally:
+            self.stop()
+        if self.summary.errors:
+            log.info("Completed %s", self.summary)
+        else:
+            log.debug("Completed %s", self.summary)
+
+    def check_deadlines(self):
+        if self.timeout is None:
+            return
+        now = time.time()
+        with self.lock:
+            expired = [(worker, op, stage, started)
+                       for worker, (op, stage, started) in
+                       self.running.items() if now - started > self.timeout]
+            for worker, op, stage, started in expired:
+                del self.running[worker]
+                worker.abandoned = True
+                stage.workers.remove(worker)
+        for worker, op, stage, started in expired:
+            log.warning("Op %s exceeded deadline of %ds in %s stage",
+                        op, self.timeout, stage.name)
+            op.error = TimeoutError("Op %s timed out after %ds in %s" % (
+                op, self.timeout, stage.name))
+            self.results.put(op)
+            self.add_worker(stage)
+
+    def start(self):
+        for stage in self.stages:
+            for i in range(min(stage.concurrency, self.op_count) or 1):
+                self.add_worker(stage)
+        self.started = True
+
+    def add_worker(self, stage):
+        worker = threading.Thread(target=self.work, args=(stage,))
+        worker.abandoned = False
+        worker.daemon = True
+        with self.lock:
+            stage.workers.append(worker)
+        worker.start()
+
+    def stop(self):
+        for stage in self.stages:
+            with self.lock:
+                workers, stage.workers = stage.workers, []
+            for worker in workers:
+                stage.queue.put(None)
+        self.started = False
+
+    def cancel(self):
+        """Cancel ops waiting for a stage, running ones are abandoned.
+        """
+        self.cancelled.set()
+        for stage in self.stages:
+            while True:
+                try:
+                    op = stage.queue.get(block=False)
+                except Empty:
+                    break
+                if op is not None:
+                    self.summary.add(OpResult(op, error=CancelledError()))
+        log.warning("Cancelled, %s", self.summary)
+
+    def put(self, stage, op):
+        stage.enqueued[op] = time.time()
+        stage.queue.put(op)
+
+    def work(self, stage):
+        worker = threading.current_thread()
+        while not self.cancelled.is_set():
+            idle = time.time()
+            op = stage.queue.get()
+            started = time.time()
+            self.metrics.record('worker_idle.' + stage.name, started - idle)
+            if op is None or self.cancelled.is_set():
+                return
+            self.metrics.record('queued.' + stage.name, started - (
+                stage.enqueued.pop(op, started)))
+            with self.lock:
+                self.running[worker] = (op, stage, started)
+            error = None
+            try:
+                if stage.name not in getattr(op, 'completed', ()):
+                    getattr(op, stage.name)()
+            except Exception, e:
+                log.exception("Error in %s stage of op %s", stage.name, op)
+                error = e
+            finally:
+                self.metrics.record(
+                    'worker_busy.' + stage.name, time.time() - started)
+            with self.lock:
+                self.running.pop(worker, None)
+            if worker.abandoned:
+                # Already reported as timed out.
+                return
+            if error is not None:
+                op.error = error
+                self.results.put(op)
+            elif stage.next is None:
+                op.result = op.get_result()
+                self.results.put(op)
+            else:
+                self.put(stage.next, op)
@@ -0,0 +1,172 @@
+"""
+Shared poller for instances waiting to become active.
+
+Rather than each op sleeping and polling its own instance, pending
+instances are registered with a single poller thread which refreshes
+all of them with one api call per tick and notifies waiters as soon as
+their instance is ready.
+"""
+
+import logging
+import threading
+import time
+
+from juju_rs.exceptions import ProviderError
+
+log = logging.getLogger("juju.rspace")
+
+
+class Waiter(object):
+    """Future for a pending subject (instance, host), resolved when ready.
+    """
+
+    def __init__(self, subject, name):
+        self.subject = subject
+        self.name = name
+        self.started = time.time()
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def done(self):
+        return self.event.is_set()
+
+    def add_done_callback(self, func):
+        with self.lock:
+            if not self.done():
+                self.callbacks.append(func)
+                return
+        func(self)
+
+    def result(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise ProviderError("Timed out waiting on %s" % self.name)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def _resolve(self, value=None, error=None):
+        with self.lock:
+            self.value = value
+            self.error = error
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for func in callbacks:
+            try:
+                func(self)
+            except Exception:
+                log.exception("Error in waiter callback for %s", self.name)
+
+
+class InstancePoller(object):
+    """Poll all pending instances together with adaptive intervals.
+
+    Polling starts fast and backs off while nothing becomes ready. The
+    backoff ceiling and the initial quiet period track the observed boot
+    times, ie. no polling before the fastest boot seen so far.
+    """
+
+    MIN_INTERVAL = 2
+    MAX_INTERVAL = 15
+    BACKOFF = 1.5
+    DEFAULT_BOOT_TIME = 60
+    TIMEOUT = 240
+    MAX_SAMPLES = 50
+
+    def __init__(self, client, timeout=TIMEOUT):
+        self.client = client
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.boot_times = []
+        self.interval = self.MIN_INTERVAL
+        self.thread = None
+
+    def watch(self, instance):
+        """Register an instance, returning a waiter for it.
+        """
+        waiter = Waiter(instance, instance.name)
+        with self.lock:
+            self.pending.setdefault(instance.id, []).append(waiter)
+            if self.thread is None:
+                self.interval = self.MIN_INTERVAL
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+        return waiter
+
+    def wait(self, instance):
+        return self.watch(instance).result()
+
+    def run(self):
+        while True:
+            time.sleep(self.next_interval())
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+            self.poll()
+
+    def next_interval(self):
+        with self.lock:
+            if not self.pending:
+                return 0
+            oldest = min(w.started for waiters in self.pending.values()
+                         for w in waiters)
+            quiet = (min(self.boot_times or [self.MIN_INTERVAL])
+                     - (time.time() - oldest))
+        return min(self.MAX_INTERVAL, max(self.interval, quiet))
+
+    def expected_boot_time(self):
+        if not self.boot_times:
+            return self.DEFAULT_BOOT_TIME
+        times = sorted(self.boot_times)
+        return times[len(times) / 2]
+
+    def poll(self):
+        with self.lock:
+            pending_ids = set(self.pending)
+        try:
+            if len(pending_ids) == 1:
+                droplets = [self.client.get_droplet(list(pending_ids)[0])]
+            else:
+                droplets = self.client.iter_droplets()
+            ready = []
+            for d in droplets:
+                if d.id in pending_ids and d.status == 'active':
+                    ready.append(d)
+        except Exception, e:
+            # Keep polling, waiters time out if the api stays broken.
+            log.warning("Error polling instances %s", e)
+            ready = []
+
+        now = time.time()
+        with self.lock:
+            ceiling = max(self.MIN_INTERVAL, min(
+                self.MAX_INTERVAL, self.expected_boot_time() / 4.0))
+            if ready:
+                self.interval = self.MIN_INTERVAL
+            else:
+                self.interval = min(ceiling, self.interval * self.BACKOFF)
+            resolved = []
+            for d in ready:
+                for w in self.pending.pop(d.id, ()):
+                    self.boot_times.append(now - w.started)
+                    resolved.append((w, d, None))
+            for instance_id in self.pending.keys():
+                waiters = self.pending[instance_id]
+                if now - waiters[0].started < self.timeout:
+                    continue
+                del self.pending[instance_id]
+                for w in waiters:
+                    resolved.append((w, None, ProviderError(
+                        "Failed to get running instance %s" % w.name)))
+            del self.boot_times[:-self.MAX_SAMPLES]
+
+        for w, d, error in resolved:
+            if d is not None:
+                log.debug("Instance %s ready in %ds",
+                          d.name, now - w.started)
+            w._resolve(d, error)
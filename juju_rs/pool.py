@@ -0,0 +1,109 @@
+"""
+Keep-alive http connection pooling for the provider api client.
+
+A single requests session is shared by all runner threads, urllib3
+connection pools are thread safe and we size them per host to match
+the number of concurrent runners so that every runner can hold a warm
+connection.
+"""
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool, HTTPSConnectionPool)
+
+from juju_rs.limit import PROVIDER_MAX
+
+log = logging.getLogger("juju.rspace")
+
+
+class PoolStats(object):
+    """Connection reuse counters across all per host pools.
+
+    A hit is a request served on an already open connection, a miss
+    is a request which had to open a new connection.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, reused):
+        with self.lock:
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'requests': self.hits + self.misses}
+
+
+class _CountingPoolMixin(object):
+
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        conn = super(_CountingPoolMixin, self)._get_conn(timeout)
+        # Fresh or dropped connections don't have a socket until used.
+        self.stats.record(getattr(conn, 'sock', None) is not None)
+        return conn
+
+
+class CountingAdapter(HTTPAdapter):
+    """Http adapter whose connection pools report reuse to `stats`.
+    """
+
+    def __init__(self, stats, **kw):
+        self.stats = stats
+        super(CountingAdapter, self).__init__(**kw)
+
+    def init_poolmanager(self, *args, **kw):
+        super(CountingAdapter, self).init_poolmanager(*args, **kw)
+        attrs = {'stats': self.stats}
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('CountingHTTPConnectionPool',
+                         (_CountingPoolMixin, HTTPConnectionPool), attrs),
+            'https': type('CountingHTTPSConnectionPool',
+                          (_CountingPoolMixin, HTTPSConnectionPool), attrs)}
+
+
+class SessionPool(object):
+    """Thread safe keep-alive session with per host connection pools.
+
+    `pool_size` is the number of connections kept open per host, it
+    defaults to the most provider requests the adaptive limit admits at
+    once, as a request waiting on the pool would read as api latency.
+    `max_hosts` bounds the number of distinct hosts for which we keep a
+    pool.
+    """
+
+    DEFAULT_MAX_HOSTS = 10
+
+    def __init__(self, pool_size=None, max_hosts=DEFAULT_MAX_HOSTS):
+        if pool_size is None:
+            pool_size = PROVIDER_MAX
+        self.pool_size = pool_size
+        self.stats = PoolStats()
+        self.session = requests.Session()
+        adapter = CountingAdapter(
+            self.stats, pool_connections=max_hosts,
+            pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kw):
+        return self.session.request(method, url, **kw)
+
+    def get_stats(self):
+        return self.stats.as_dict()
+
+    def close(self):
+        log.debug("Closing http pool %s", self.get_stats())
+        self.session.close()
@@ -0,0 +1,163 @@
+"""
+Non-blocking tcp readiness probe for many hosts.
+
+New instances take a while to start sshd. Instead of forking ssh in a
+sleep loop per instance, a single thread keeps non-blocking connects in
+flight to every pending host and retries refused or timed out attempts
+sub-second. Waiters are resolved as soon as the port accepts a
+connection, after which the real ssh handshake can run.
+"""
+
+import errno
+import logging
+import select
+import socket
+import threading
+import time
+
+from juju_rs.exceptions import TimeoutError
+from juju_rs.poller import Waiter
+
+log = logging.getLogger("juju.rspace")
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_probe():
+    """Process wide probe, shared by all runner threads.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PortProbe()
+        return _shared
+
+
+class _Target(object):
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.deadline = time.time() + timeout
+        self.waiters = []
+        self.sock = None
+        self.connect_started = 0
+        self.next_attempt = 0
+        self.attempts = 0
+
+
+class PortProbe(object):
+
+    RETRY_INTERVAL = 0.5
+    CONNECT_TIMEOUT = 3
+    DEFAULT_TIMEOUT = 360
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.targets = {}
+        self.thread = None
+
+    def watch(self, host, port=22, timeout=DEFAULT_TIMEOUT):
+        """Return a waiter resolved once host accepts connections on port.
+        """
+        waiter = Waiter((host, port), "%s:%s" % (host, port))
+        with self.lock:
+            target = self.targets.get((host, port))
+            if target is None:
+                target = self.targets[(host, port)] = _Target(
+                    host, port, timeout)
+            target.waiters.append(waiter)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+        return waiter
+
+    def wait(self, host, port=22, timeout=DEFAULT_TIMEOUT):
+        return self.watch(host, port, timeout).result()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.targets:
+                    self.thread = None
+                    return
+                targets = self.targets.values()
+            self.step(targets)
+
+    def step(self, targets):
+        now = time.time()
+        for t in targets:
+            if t.sock is None and t.next_attempt <= now:
+                self._connect(t, now)
+        targets = [t for t in targets if (t.host, t.port) in self.targets]
+        if not targets:
+            return
+
+        in_flight = dict((t.sock, t) for t in targets if t.sock is not None)
+        wait = self.RETRY_INTERVAL
+        if in_flight:
+            try:
+                r, writable, errored = select.select(
+                    [], in_flight.keys(), in_flight.keys(), wait)
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                writable = errored = []
+        else:
+            time.sleep(min(wait, max(
+                0, min(t.next_attempt for t in targets) - now)))
+            writable = errored = []
+
+        now = time.time()
+        for sock in set(writable) | set(errored):
+            t = in_flight[sock]
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            self._close(t, now)
+            if not err:
+                self._resolve(t)
+                continue
+            log.debug("Waiting for %s:%s %s",
+                      t.host, t.port, errno.errorcode.get(err, err))
+
+        for t in targets:
+            if t.sock is not None and (
+                    now - t.connect_started > self.CONNECT_TIMEOUT):
+                self._close(t, now)
+            if t.deadline < now and (t.host, t.port) in self.targets:
+                self._resolve(t, TimeoutError(
+                    "Port %s on %s not reachable before timeout" % (
+                        t.port, t.host)))
+
+    def _connect(self, t, now):
+        t.attempts += 1
+        t.connect_started = now
+        t.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        t.sock.setblocking(0)
+        try:
+            err = t.sock.connect_ex((t.host, t.port))
+        except (socket.gaierror, TypeError), e:
+            # Unresolvable or invalid address, retrying won't help.
+            self._resolve(t, e)
+            return
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK,
+                       getattr(errno, 'WSAEWOULDBLOCK', -1)):
+            self._close(t, now)
+
+    def _close(self, t, now):
+        if t.sock is not None:
+            t.sock.close()
+            t.sock = None
+        t.next_attempt = now + self.RETRY_INTERVAL
+
+    def _resolve(self, t, error=None):
+        self._close(t, time.time())
+        with self.lock:
+            self.targets.pop((t.host, t.port), None)
+            waiters, t.waiters = t.waiters, []
+        if error is None:
+            log.debug("Port %s open on %s after %d attempts",
+                      t.port, t.host, t.attempts)
+        for w in waiters:
+            w._resolve(t.host, error)
@@ -1,15 +1,25 @@
 import logging
 import os
-import time
 
-from juju_rs.exceptions import ConfigError, ProviderError
+from juju_rs.cache import ResponseCache
+from juju_rs.exceptions import ConfigError
+from juju_rs.inventory import Inventory
+from juju_rs.limit import PROVIDER_MAX
+from juju_rs.poller import InstancePoller
 from juju_rs.client import Client
+from juju_rs.retry import RetryPolicy, TokenBucket
 
 log = logging.getLogger("juju.rspace")
 
 
-def factory():
+def factory(cache_dir=None, refresh_cache=False, parallel=None):
     cfg = RackSpace.get_config()
+    if cache_dir:
+        cfg['cache_dir'] = cache_dir
+    if parallel and 'pool_size' not in cfg:
+        # Enough connections for every request --parallel admits.
+        cfg['pool_size'] = max(parallel, PROVIDER_MAX)
+    cfg['refresh_cache'] = refresh_cache
     return RackSpace(cfg)
 
 
@@ -21,10 +31,31 @@ class RackSpace(object):
 
     def __init__(self, config, client=None):
         self.config = config
+        inventory_path = None
+        if config.get('cache_dir'):
+            inventory_path = os.path.join(
+                config['cache_dir'], 'inventory.json')
         if client is None:
-            self.client = Client(
+            token_cache = cache = None
+            if config.get('cache_dir'):
+                token_cache = os.path.join(config['cache_dir'], 'tokens.json')
+                cache = ResponseCache(
+                    os.path.join(config['cache_dir'], 'catalog.json'),
+                    config['client_id'],
+                    refresh=config.get('refresh_cache', False))
+            client = Client(
                 config['client_id'],
-                config['api_key'])
+                config['api_key'],
+                pool_size=config.get('pool_size'),
+                token_cache=token_cache,
+                cache=cache,
+                retry=RetryPolicy(
+                    bucket=TokenBucket.shared(config.get('rate_limit'))))
+        self.client = client
+        self.poller = InstancePoller(client)
+        self.inventory = Inventory(
+            client, inventory_path, account=config.get('client_id'),
+            refresh=config.get('refresh_cache', False))
 
     @classmethod
     def get_config(cls):
@@ -42,6 +73,21 @@ class RackSpace(object):
         if ssh_key:
             provider_conf['ssh_key'] = ssh_key
 
+        pool_size = os.environ.get('DO_POOL_SIZE')
+        if pool_size:
+            if not pool_size.isdigit() or not int(pool_size):
+                raise ConfigError("Invalid DO_POOL_SIZE %s" % pool_size)
+            provider_conf['pool_size'] = int(pool_size)
+
+        rate_limit = os.environ.get('DO_RATE_LIMIT')
+        if rate_limit:
+            try:
+                provider_conf['rate_limit'] = float(rate_limit)
+            except ValueError:
+                raise ConfigError("Invalid DO_RATE_LIMIT %s" % rate_limit)
+            if provider_conf['rate_limit'] <= 0:
+                raise ConfigError("Invalid DO_RATE_LIMIT %s" % rate_limit)
+
         if (not 'client_id' in provider_conf or
                 not 'api_key' in provider_conf):
             raise ConfigError("Missing digital ocean api credentials")
@@ -54,8 +100,18 @@ class RackSpace(object):
         log.debug("Using DO ssh keys: %s" % (", ".join(k.name for k in keys)))
         return keys
 
-    def get_instances(self):
-        return self.client.get_droplets()
+    def get_instances(self, env=None, max_age=None):
+        """Instances in the account, or only those of environment env.
+
+        Served from the inventory, which is relisted when older than
+        max_age seconds (0 for always).
+        """
+        return self.inventory.get_instances(env, max_age)
+
+    def close(self):
+        """Save instances written through to the inventory.
+        """
+        self.inventory.save()
 
     def get_instance(self, instance_id):
         return self.client.get_droplet(instance_id)
@@ -67,40 +123,21 @@ class RackSpace(object):
             params['private_networking'] = True
         if 'ssh_key_ids' in params:
             params['ssh_key_ids'] = map(str, params['ssh_key_ids'])
-        return self.client.create_droplet(**params)
+        instance = self.client.create_droplet(**params)
+        self.inventory.put(instance)
+        return instance
+
+    def rename_instance(self, instance_id, name):
+        self.client.rename_droplet(instance_id, name)
+        self.inventory.rename(instance_id, name)
 
     def terminate_instance(self, instance_id):
         self.client.destroy_droplet(instance_id)
+        self.inventory.remove(instance_id)
 
     def wait_on(self, instance):
-        return self._wait_on(instance.event_id, instance.name)
-
-    def _wait_on(self, event, name, event_type=1):
-        loop_count = 0
-        while 1:
-            time.sleep(8)  # Takes on average 1m for a do instance.
-            result = self.client.request("/events/%s" % event)
-            event_data = result['event']
-            if not event_data['event_type_id'] == event_type:
-                raise ValueError(
-                    "Waiting on invalid event type: %d for %s",
-                    event_data['event_type_id'], name)
-            elif event_data['action_status'] == 'done':
-                log.debug("Instance %s ready", name)
-                return
-            elif result['status'] != "OK":
-                log.warning("Unknown provider error %s", result)
-            else:
-                log.debug("Waiting on instance %s %s%%",
-                          name, event_data.get('percentage') or '0')
-            if loop_count > 8:
-                # Its taking a long while (2m+), give the user some
-                # diagnostics if in debug mode.
-                log.debug("Diagnostics on instance %s event %s",
-                          name, result)
-            if loop_count > 25:
-                # After 3.5m for instance, just bail as provider error.
-                raise ProviderError(
-                    "Failed to get running instance %s event: %s" % (
-                        name, result))
-            loop_count += 1
+        """Wait for a launched instance to become active, returning it.
+        """
+        instance = self.poller.wait(instance)
+        self.inventory.put(instance)
+        return instance
@@ -0,0 +1,159 @@
+"""
+Rate limit aware retries for provider api requests.
+
+Throttled (413/429) and transient server (5xx) responses are retried
+with jittered exponential backoff, honoring Retry-After. A process wide
+token bucket shared by all runner threads paces requests to stay under
+the account rate limit rather than repeatedly hitting it.
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger("juju.rspace")
+
+# Rejected before any work was done, safe to retry any request.
+THROTTLE_STATUSES = (413, 429)
+
+# May have been processed, only safe to retry idempotent requests.
+TRANSIENT_STATUSES = (500, 502, 503, 504)
+
+# The v1 api performs every action via GET, so idempotency is decided
+# by endpoint rather than method. Replaying these could double-launch.
+NON_IDEMPOTENT_TARGETS = ('/droplets/new',)
+
+# Retries made by the current thread, attributed to ops by their phases.
+_thread = threading.local()
+
+
+def thread_retries():
+    return getattr(_thread, 'retries', 0)
+
+
+class TokenBucket(object):
+    """Pace requests to `rate` per second with bursts up to `capacity`.
+    """
+
+    DEFAULT_RATE = 5
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=None):
+        self.rate = float(rate)
+        self.capacity = capacity or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, rate=None):
+        """Return the process wide bucket, optionally updating its rate.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(rate or cls.DEFAULT_RATE)
+            elif rate:
+                cls._shared.rate = float(rate)
+                cls._shared.capacity = max(1.0, cls._shared.rate)
+            return cls._shared
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                if now >= self.paused_until:
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold all requests for `seconds`, ie. when the api throttles us.
+        """
+        with self.lock:
+            until = time.time() + seconds
+            if until > self.paused_until:
+                self.paused_until = self.updated = until
+                self.tokens = 0
+
+
+class RetryPolicy(object):
+
+    DEFAULT_ATTEMPTS = 5
+    DEFAULT_BASE_DELAY = 0.5
+    DEFAULT_MAX_DELAY = 30
+
+    def __init__(self, max_attempts=DEFAULT_ATTEMPTS,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 bucket=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        if bucket is None:
+            bucket = TokenBucket.shared()
+        self.bucket = bucket
+        self.lock = threading.Lock()
+        self.retries = 0
+
+    @staticmethod
+    def is_idempotent(target):
+        return target not in NON_IDEMPOTENT_TARGETS
+
+    def should_retry(self, target, attempt, response=None, error=None):
+        if attempt + 1 >= self.max_attempts:
+            return False
+        if response is not None:
+            if response.status_code in THROTTLE_STATUSES:
+                return True
+            if response.status_code not in TRANSIENT_STATUSES:
+                return False
+        return self.is_idempotent(target)
+
+    def get_delay(self, attempt, response=None):
+        retry_after = None
+        if response is not None:
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter, spreads retries of concurrent runners apart.
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def backoff(self, target, attempt, response=None):
+        delay = self.get_delay(attempt, response)
+        with self.lock:
+            self.retries += 1
+        _thread.retries = thread_retries() + 1
+        if response is not None and response.status_code in THROTTLE_STATUSES:
+            log.debug("Throttled on %s, pausing requests %0.2fs",
+                      target, delay)
+            self.bucket.pause(delay)
+        else:
+            log.debug("Retrying %s in %0.2fs", target, delay)
+        time.sleep(delay)
+
+
+def parse_retry_after(value):
+    """Return seconds from a Retry-After header of seconds or http date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    stamp = email.utils.parsedate_tz(value)
+    if stamp is None:
+        return None
+    return max(0, email.utils.mktime_tz(stamp) - time.time())
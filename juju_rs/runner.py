@@ -1,81 +1,312 @@
 """
 Thread based concurrency around bulk ops. do api is sync
+
+A bounded set of workers runs queued ops, while per resource limits
+(see limit.py) adapt how many of them call the provider or juju at
+once. Results are yielded in completion order with their op attached.
+
+Ops may declare `depends_on`, other ops queued before them. An op
+starts as soon as all of its dependencies succeeded, and is skipped if
+any of them failed, so independent steps of a workflow run at once.
+
+An op running past its deadline is reported as timed out and its worker
+replaced, as threads can't be killed, and Ctrl-C cancels everything not
+yet started.
 """
 
 import logging
 from Queue import Queue, Empty
 import threading
+import time
+
+from juju_rs.exceptions import TimeoutError
+from juju_rs.limit import Limits
+from juju_rs.metrics import Metrics
 
 
 log = logging.getLogger("juju.rspace")
 
 
-class Runner(object):
+def bind_op(op, limits, metrics):
+    """Hand concurrency limits and metrics to an op that takes them.
+    """
+    if getattr(op, 'limits', False) is None:
+        op.limits = limits
+    if getattr(op, 'metrics', False) is None:
+        op.metrics = metrics
+
+
+class CancelledError(Exception):
+    """Op was cancelled before it ran."""
+
+
+class DependencyError(Exception):
+    """Op was skipped as one of its dependencies failed."""
+
 
-    DEFAULT_NUM_RUNNER = 4
+class OpResult(object):
+    """Outcome of an op, `error` is set if it failed.
+    """
+    __slots__ = ('op', 'value', 'error', 'started', 'finished', 'queued')
+
+    def __init__(self, op, value=None, error=None, started=None, queued=0):
+        self.op = op
+        self.value = value
+        self.error = error
+        self.started = started
+        self.finished = time.time()
+        # Seconds spent ready to run, waiting for a worker.
+        self.queued = queued
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return 0
+        return self.finished - self.started
+
+    def __repr__(self):
+        return "<OpResult %s %s>" % (
+            self.op, self.ok and "ok" or repr(self.error))
+
+
+class Summary(object):
+    """Counts of op outcomes.
+    """
 
     def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add(self, result):
+        if result.ok:
+            self.succeeded += 1
+            return
+        if isinstance(result.error, TimeoutError):
+            self.timed_out += 1
+        elif isinstance(result.error, CancelledError):
+            self.cancelled += 1
+        elif isinstance(result.error, DependencyError):
+            self.skipped += 1
+        else:
+            self.failed += 1
+        self.errors.append(result)
+
+    @property
+    def total(self):
+        return (self.succeeded + self.failed + self.timed_out +
+                self.cancelled + self.skipped)
+
+    def to_dict(self):
+        return dict(total=self.total, succeeded=self.succeeded,
+                    failed=self.failed, timed_out=self.timed_out,
+                    cancelled=self.cancelled, skipped=self.skipped)
+
+    def __str__(self):
+        return ("%(total)d ops: %(succeeded)d succeeded, %(failed)d failed, "
+                "%(timed_out)d timed out, %(cancelled)d cancelled, "
+                "%(skipped)d skipped" % self.to_dict())
+
+
+class Runner(object):
+    """Run ops on a bounded set of worker threads.
+
+    `parallel` fixes the number of ops running at once, by default
+    concurrency adapts per resource to `limits`, which are handed to
+    ops. `timeout` is the per op deadline in seconds (None for none),
+    ops with a `deadline` attribute use theirs instead.
+    Queue waits, op durations and worker busy/idle time go to `metrics`.
+    """
+
+    # How often iter_results wakes up to check deadlines, also keeps
+    # the main thread responsive to Ctrl-C.
+    CHECK_INTERVAL = 0.5
+
+    def __init__(self, parallel=None, timeout=None, limits=None,
+                 metrics=None):
+        if limits is None:
+            limits = Limits.create(parallel)
+        self.limits = limits
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        self.parallel = parallel or limits.maximum
+        self.timeout = timeout
         self.jobs = Queue()
         self.results = Queue()
-        self.job_count = 0
-        self.runners = []
-        self.started = False
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.queued = set()
+        self.enqueued = {}
+        # Ops waiting on dependencies, and outcome of finished ops.
+        self.blocked = []
+        self.finished = {}
+        self.running = {}
+        self.workers = []
+        self.cancelled = threading.Event()
+        self.summary = Summary()
 
     def queue_op(self, op):
-        self.jobs.put(op)
-        self.job_count += 1
-
-    def iter_results(self):
-        auto = not self.started
+        deps = getattr(op, 'depends_on', ())
+        for dep in deps:
+            if dep not in self.queued:
+                raise ValueError(
+                    "Dependency %s of %s must be queued first" % (dep, op))
+        bind_op(op, self.limits, self.metrics)
+        with self.lock:
+            self.pending += 1
+            self.queued.add(op)
+        if deps:
+            self.blocked.append(op)
+            self.release_blocked()
+        else:
+            self.put(op)
 
-        if auto:
-            self.start(min(self.DEFAULT_NUM_RUNNER, self.job_count))
+    def put(self, op):
+        with self.lock:
+            self.enqueued[op] = time.time()
+        self.jobs.put(op)
 
-        for i in range(self.job_count):
-            self.job_count -= 1
-            result = self.gather_result()
-            if isinstance(result, Exception):
+    def release_blocked(self):
+        """Start blocked ops whose dependencies all finished.
+        """
+        skipped = []
+        for op in list(self.blocked):
+            outcomes = [self.finished.get(dep) for dep in op.depends_on]
+            if None in outcomes:
                 continue
-            yield result
+            self.blocked.remove(op)
+            if all(outcomes):
+                self.put(op)
+            else:
+                skipped.append(op)
+        for op in skipped:
+            log.warning("Skipping %s, a dependency failed", op)
+            self.results.put(OpResult(op, error=DependencyError(
+                "Dependency of %s failed" % op)))
 
-        if auto:
+    def iter_results(self):
+        """Yield an OpResult per queued op as it completes.
+        """
+        self.start()
+        try:
+            while self.pending:
+                result = self.gather_result()
+                if result is None:
+                    continue
+                self.pending -= 1
+                self.summary.add(result)
+                self.finished[result.op] = result.ok
+                self.release_blocked()
+                yield result
+        except KeyboardInterrupt:
+            self.cancel()
+            raise
+        finally:
             self.stop()
+        if self.summary.errors:
+            log.info("Completed %s", self.summary)
+        else:
+            log.debug("Completed %s", self.summary)
 
     def gather_result(self):
-        return self.results.get()
+        try:
+            return self.results.get(timeout=self.CHECK_INTERVAL)
+        except Empty:
+            self.check_deadlines()
+            return None
 
-    def start(self, count):
-        for i in range(count):
-            runner = OpRunner(self.jobs, self.results)
-            runner.daemon = True
-            self.runners.append(runner)
-            runner.start()
-        self.started = True
+    def deadline(self, op):
+        return getattr(op, 'deadline', self.timeout)
 
-    def stop(self):
-        for runner in self.runners:
-            runner.join()
-        self.started = False
+    def check_deadlines(self):
+        now = time.time()
+        with self.lock:
+            expired = [(worker, op, started) for worker, (op, started) in
+                       self.running.items()
+                       if self.deadline(op) is not None and
+                       now - started > self.deadline(op)]
+            for worker, op, started in expired:
+                del self.running[worker]
+                worker.abandoned = True
+                self.workers.remove(worker)
+        for worker, op, started in expired:
+            deadline = self.deadline(op)
+            log.warning("Op %s exceeded deadline of %ds", op, deadline)
+            self.results.put(OpResult(
+                op, error=TimeoutError(
+                    "Op %s timed out after %ds" % (op, deadline)),
+                started=started))
+            self.add_worker()
 
+    def start(self):
+        with self.lock:
+            count = min(self.parallel, self.pending) - len(self.workers)
+        for i in range(count):
+            self.add_worker()
 
-class OpRunner(threading.Thread):
+    def add_worker(self):
+        worker = threading.Thread(target=self.work)
+        worker.abandoned = False
+        worker.daemon = True
+        with self.lock:
+            self.workers.append(worker)
+        worker.start()
 
-    def __init__(self, ops, results):
-        self.ops = ops
-        self.results = results
-        super(OpRunner, self).__init__()
+    def stop(self):
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            self.jobs.put(None)
 
-    def run(self):
-        while 1:
+    def cancel(self):
+        """Cancel ops not yet started, running ones are abandoned.
+        """
+        self.cancelled.set()
+        while True:
             try:
-                op = self.ops.get(block=False)
+                op = self.jobs.get(block=False)
             except Empty:
-                op = None
-            if op is None:
+                break
+            if op is not None:
+                self.summary.add(OpResult(op, error=CancelledError()))
+        for op in self.blocked:
+            self.summary.add(OpResult(op, error=CancelledError()))
+        self.blocked = []
+        log.warning("Cancelled, %s", self.summary)
+
+    def work(self):
+        worker = threading.current_thread()
+        while not self.cancelled.is_set():
+            idle = time.time()
+            op = self.jobs.get()
+            started = time.time()
+            self.metrics.record('worker_idle', started - idle)
+            if op is None or self.cancelled.is_set():
                 return
+            with self.lock:
+                self.running[worker] = (op, started)
+                queued = started - self.enqueued.pop(op, started)
+            self.metrics.record('queued', queued)
             try:
-                result = op.run()
+                result = OpResult(
+                    op, value=op.run(), started=started, queued=queued)
             except Exception, e:
                 log.exception("Error while processing op %s", op)
-                result = e
+                result = OpResult(
+                    op, error=e, started=started, queued=queued)
+            with self.lock:
+                self.running.pop(worker, None)
+            self.metrics.record('worker_busy', result.duration)
+            self.metrics.record('op', result.duration)
+            if worker.abandoned:
+                # Already reported as timed out.
+                return
             self.results.put(result)
@@ -1,5 +1,10 @@
-import subprocess
+import atexit
 import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
 
 log = logging.getLogger('juju.rspace')
 
@@ -10,9 +15,119 @@ SSH_CMD = ("/usr/bin/ssh",
            "-o", "StrictHostKeyChecking=no",
            "-o", "UserKnownHostsFile=/dev/null")
 
+WRAPPER = """#!/bin/sh
+exec %s -o ControlMaster=no -o "ControlPath=%s" "$@"
+"""
+
+
+class SSHMux(object):
+    """Per host ssh master connections shared by all ssh invocations.
+
+    Masters listen on control sockets in a private runtime directory and
+    persist for the life of the command, so the key exchange and
+    authentication happen once per host. Juju subprocesses reuse them
+    through an ssh wrapper placed first on their PATH.
+    """
+
+    PERSIST = 600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runtime_dir = None
+        self.masters = set()
+        self.enabled = os.name == 'posix'
+
+    @property
+    def control_path(self):
+        return os.path.join(self.runtime_dir, "%r@%h:%p")
+
+    def _setup(self):
+        if self.runtime_dir is not None:
+            return
+        # mkdtemp creates the directory accessible only to us.
+        self.runtime_dir = tempfile.mkdtemp(prefix="juju-rs-ssh-")
+        bin_dir = os.path.join(self.runtime_dir, "bin")
+        os.mkdir(bin_dir)
+        wrapper = os.path.join(bin_dir, "ssh")
+        with open(wrapper, "w") as fh:
+            fh.write(WRAPPER % (SSH_CMD[0], self.control_path))
+        os.chmod(wrapper, 0700)
+        atexit.register(self.close)
+
+    def command(self, host, user="root"):
+        """Return an ssh command line to host, via its master if any.
+        """
+        cmd = list(SSH_CMD)
+        if self.enabled and (user, host) in self.masters:
+            cmd.extend(["-o", "ControlMaster=no",
+                        "-o", "ControlPath=%s" % self.control_path])
+        cmd.append("%s@%s" % (user, host))
+        return cmd
+
+    def connect(self, host, user="root"):
+        """Start a backgrounded master connection to host.
+
+        Raises CalledProcessError with ssh's output on failure.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            if (user, host) in self.masters:
+                return
+            self._setup()
+        cmd = list(SSH_CMD) + [
+            "-o", "ControlMaster=yes",
+            "-o", "ControlPersist=%d" % self.PERSIST,
+            "-o", "ControlPath=%s" % self.control_path,
+            "-f", "-N", "%s@%s" % (user, host)]
+        # The backgrounded master keeps its stdio, so don't capture via
+        # pipes that would never see eof.
+        with open(os.devnull, "r+") as null:
+            with tempfile.TemporaryFile() as err:
+                retcode = subprocess.call(
+                    cmd, stdin=null, stdout=null, stderr=err)
+                if retcode:
+                    err.seek(0)
+                    raise subprocess.CalledProcessError(
+                        retcode, cmd, err.read())
+        with self.lock:
+            self.masters.add((user, host))
+        log.debug("Started ssh master for %s@%s", user, host)
+
+    def update_env(self, env):
+        """Route ssh in a subprocess env through existing masters.
+        """
+        with self.lock:
+            if self.runtime_dir is None or not self.masters:
+                return env
+            env["PATH"] = os.pathsep.join(
+                [os.path.join(self.runtime_dir, "bin"),
+                 env.get("PATH", os.defpath)])
+        return env
+
+    def close(self):
+        with self.lock:
+            masters, self.masters = self.masters, set()
+            runtime_dir, self.runtime_dir = self.runtime_dir, None
+        if runtime_dir is None:
+            return
+        control_path = os.path.join(runtime_dir, "%r@%h:%p")
+        with open(os.devnull, "r+") as null:
+            for user, host in masters:
+                subprocess.call(
+                    list(SSH_CMD) + [
+                        "-o", "ControlPath=%s" % control_path,
+                        "-O", "exit", "%s@%s" % (user, host)],
+                    stdin=null, stdout=null, stderr=null)
+        shutil.rmtree(runtime_dir, ignore_errors=True)
+
+
+mux = SSHMux()
+
 
 def check_ssh(host, user="root"):
-    cmd = list(SSH_CMD) + ["%s@%s" % (user, host), "ls"]
+    mux.connect(host, user)
+    cmd = mux.command(host, user) + ["ls"]
     process = subprocess.Popen(
         args=cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
@@ -25,7 +140,7 @@ def check_ssh(host, user="root"):
 
 
 def update_instance(host, user="root"):
-    base = list(SSH_CMD) + ["%s@%s" % (user, host)]
+    base = mux.command(host, user)
     subprocess.check_output(
         base + ["apt-get", "update"], stderr=subprocess.STDOUT)
 # Don't really need to update the image, just the package lists.
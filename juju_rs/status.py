@@ -0,0 +1,171 @@
+"""
+In memory model of the environment's machines.
+
+A full `juju status` of a large environment takes many seconds, so
+machines (id, dns-name, instance-id, agent-state) are kept here and
+looked up by id or address. While the api server is reachable the model
+follows its all watcher's delta stream, otherwise refreshes diff a new
+status snapshot against the model.
+"""
+
+import logging
+import socket
+import threading
+
+from juju_rs.exceptions import JujuAPIError
+
+log = logging.getLogger("juju.rspace")
+
+FIELDS = ('dns-name', 'instance-id', 'agent-state')
+
+
+def machine_from_delta(data):
+    """Status fields of a machine from its all watcher delta.
+    """
+    addresses = data.get('Addresses') or []
+    public = [a['Value'] for a in addresses if a.get('Scope') == 'public']
+    address = (public or [a['Value'] for a in addresses] or [None])[0]
+    return {'dns-name': address,
+            'instance-id': data.get('InstanceId'),
+            'agent-state': data.get('Status')}
+
+
+class StatusCache(object):
+
+    def __init__(self, env):
+        self.env = env
+        self.lock = threading.Lock()
+        self.machines = {}
+        self.addresses = {}
+        self.loaded = False
+        self.watcher = None
+        self.watcher_id = None
+        self.api = None
+
+    @property
+    def watching(self):
+        return self.watcher is not None and self.watcher.is_alive()
+
+    def refresh(self):
+        """Bring the model up to date.
+
+        Returns the ids of machines added, changed and removed since the
+        last refresh, which are unknown (empty) while watching.
+        """
+        if self.watching or self.watch():
+            return set(), set(), set()
+        return self.diff(self.env.status() or {})
+
+    def machine(self, machine_id):
+        with self.lock:
+            m = self.machines.get(machine_id)
+            return m and dict(m)
+
+    def by_address(self, address):
+        """Id and status of the machine at address, or (None, None).
+        """
+        with self.lock:
+            machine_id = self.addresses.get(address)
+            if machine_id is None:
+                return None, None
+            return machine_id, dict(self.machines[machine_id])
+
+    def present(self, machine_ids):
+        """Refresh, returning which of machine_ids are still in state.
+        """
+        self.refresh()
+        with self.lock:
+            return set(machine_ids) & set(self.machines)
+
+    def snapshot(self):
+        """Copy of the model as machine id to status dict.
+        """
+        with self.lock:
+            return dict((k, dict(v)) for k, v in self.machines.items())
+
+    def diff(self, status):
+        """Apply the differences of a full status to the model.
+        """
+        machines = dict(
+            (mid, dict((f, m.get(f)) for f in FIELDS))
+            for mid, m in (status.get('machines') or {}).items())
+        with self.lock:
+            removed = set(self.machines) - set(machines)
+            added = set(machines) - set(self.machines)
+            changed = set(mid for mid in set(machines) & set(self.machines)
+                          if machines[mid] != self.machines[mid])
+            for mid in removed:
+                self._remove(mid)
+            for mid in added | changed:
+                self._update(mid, machines[mid])
+            self.loaded = True
+        log.debug("Status refreshed, %d added %d changed %d removed",
+                  len(added), len(changed), len(removed))
+        return added, changed, removed
+
+    def watch(self):
+        """Follow the api server's deltas, returns False if unavailable.
+        """
+        api = self.env.api()
+        if api is None:
+            return False
+        try:
+            watcher_id = api.watch_all()
+            # The first batch of deltas is the whole environment.
+            deltas = api.next_deltas(watcher_id)
+        except (socket.error, JujuAPIError), e:
+            log.debug("Could not watch environment, diffing status: %s", e)
+            return False
+        with self.lock:
+            for mid in list(self.machines):
+                self._remove(mid)
+        self.apply(deltas)
+        self.api, self.watcher_id = api, watcher_id
+        self.watcher = threading.Thread(
+            target=self.follow, args=(api, watcher_id))
+        self.watcher.daemon = True
+        self.watcher.start()
+        return True
+
+    def close(self):
+        """Stop the api server's watcher, if following it.
+        """
+        api, watcher_id = self.api, self.watcher_id
+        self.api = self.watcher_id = None
+        if watcher_id is None:
+            return
+        try:
+            api.stop_watcher(watcher_id)
+        except (socket.error, JujuAPIError), e:
+            log.debug("Could not stop environment watcher: %s", e)
+
+    def follow(self, api, watcher_id):
+        while True:
+            try:
+                deltas = api.next_deltas(watcher_id)
+            except (socket.error, JujuAPIError), e:
+                log.debug("Environment watcher stopped: %s", e)
+                return
+            self.apply(deltas)
+
+    def apply(self, deltas):
+        with self.lock:
+            for entity, change, data in deltas:
+                if entity != 'machine':
+                    continue
+                if change == 'remove':
+                    self._remove(data['Id'])
+                else:
+                    self._update(data['Id'], machine_from_delta(data))
+            self.loaded = True
+
+    def _update(self, machine_id, machine):
+        self._remove(machine_id)
+        self.machines[machine_id] = machine
+        if machine['dns-name']:
+            self.addresses[machine['dns-name']] = machine_id
+
+    def _remove(self, machine_id):
+        machine = self.machines.pop(machine_id, None)
+        if machine and self.addresses.get(machine['dns-name']) == machine_id:
+            del self.addresses[machine['dns-name']]
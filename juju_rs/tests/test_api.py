@@ -0,0 +1,267 @@
+import json
+import mock
+import os
+import socket
+import threading
+
+import yaml
+
+from juju_rs import api
+from juju_rs.env import Environment
+from juju_rs.exceptions import JujuAPIError
+
+from base import Base
+
+
+class FakeAPIServer(object):
+    """Websocket server answering requests with handlers by name.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.requests = []
+        self.ids = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.address = "127.0.0.1:%d" % self.sock.getsockname()[1]
+        self.conns = []
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            self.conns.append(conn)
+            thread = threading.Thread(target=self.handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, conn):
+        request = ""
+        while "\r\n\r\n" not in request:
+            request += conn.recv(1024)
+        key = [l.split(":", 1)[1].strip() for l in request.split("\r\n")
+               if l.lower().startswith("sec-websocket-key")][0]
+        conn.sendall(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+            "Connection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n" % (
+                api.accept_key(key)))
+        # Pings must be answered before requests are.
+        conn.sendall(api.encode_frame(api.OP_PING, "hi", mask=False))
+        while True:
+            try:
+                fin, opcode, payload = api.read_frame(conn.recv)
+            except socket.error:
+                return
+            if opcode == api.OP_PONG:
+                self.pong = payload
+                continue
+            if opcode == api.OP_CLOSE:
+                conn.close()
+                return
+            message = json.loads(payload)
+            name = "%s.%s" % (message['Type'], message['Request'])
+            self.requests.append((name, message['Params']))
+            self.ids.append(message.get('Id'))
+            handler = self.handlers.get(name, lambda params: {})
+            response = {'RequestId': message['RequestId']}
+            try:
+                response['Response'] = handler(message['Params'])
+            except JujuAPIError, e:
+                response['Error'] = e.message
+                response['ErrorCode'] = e.code
+            data = json.dumps(response)
+            # Send responses fragmented to exercise continuations.
+            half = len(data) // 2
+            conn.sendall(
+                chr(api.OP_TEXT) + chr(half) + data[:half] +
+                api.encode_frame(api.OP_CONTINUATION, data[half:],
+                                 mask=False))
+
+    def drop(self):
+        for conn in self.conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+        self.drop()
+
+
+class APITest(Base):
+
+    def serve(self, handlers=None):
+        server = FakeAPIServer(handlers or {})
+        self.addCleanup(server.close)
+        return server
+
+    def connect(self, server):
+        conn = api.APIConnection.connect(
+            server.address, "admin", "secret", secure=False)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_frame_lengths(self):
+        for size in (5, 300, 70000):
+            payload = "x" * size
+            frame = api.encode_frame(api.OP_TEXT, payload)
+
+            class Sock(object):
+                data = frame
+
+                def recv(self, count):
+                    chunk, self.data = self.data[:count], self.data[count:]
+                    return chunk
+
+            self.assertEqual(
+                api.read_frame(Sock().recv), (True, api.OP_TEXT, payload))
+
+    def test_login(self):
+        server = self.serve()
+        conn = self.connect(server)
+        self.assertEqual(server.requests, [
+            ("Admin.Login", {"AuthTag": "user-admin", "Password": "secret"})])
+        # The pong went out before the login response was read, so the
+        # server has it once a later request is answered.
+        conn.status()
+        self.assertEqual(server.pong, "hi")
+
+    def test_login_error(self):
+        def login(params):
+            raise JujuAPIError("invalid entity name or password",
+                               "unauthorized access")
+        server = self.serve({'Admin.Login': login})
+        self.assertRaises(
+            JujuAPIError, api.APIConnection.connect,
+            server.address, "admin", "bad", secure=False)
+
+    def test_status(self):
+        server = self.serve({'Client.FullStatus': lambda p: {
+            'EnvironmentName': 'rspace',
+            'Machines': {'1': {'DNSName': '10.0.0.1', 'InstanceId':
+                               'manual:10.0.0.1', 'AgentState': 'started',
+                               'Series': 'trusty'}},
+            'Services': {}}})
+        conn = self.connect(server)
+        self.assertEqual(conn.status(), {
+            'environment': 'rspace',
+            'machines': {'1': {'dns-name': '10.0.0.1',
+                               'instance-id': 'manual:10.0.0.1',
+                               'agent-state': 'started',
+                               'series': 'trusty'}},
+            'services': {}})
+
+    def test_concurrent_requests(self):
+        server = self.serve({'Client.DestroyMachines': lambda p: {
+            'Results': p['MachineNames']}})
+        conn = self.connect(server)
+        results = {}
+
+        def destroy(mid):
+            results[mid] = conn.destroy_machines([mid])['Results']
+
+        threads = [threading.Thread(target=destroy, args=(str(i),))
+                   for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(
+            results, dict((str(i), [str(i)]) for i in range(20)))
+
+    def test_watch(self):
+        server = self.serve({
+            'Client.WatchAll': lambda p: {'AllWatcherId': '7'},
+            'AllWatcher.Next': lambda p: {'Deltas': [
+                ['machine', 'change', {'Id': '0'}]]}})
+        conn = self.connect(server)
+        watcher_id = conn.watch_all()
+        self.assertEqual(
+            conn.next_deltas(watcher_id),
+            [['machine', 'change', {'Id': '0'}]])
+        self.assertEqual(server.ids[-1], '7')
+
+    def test_disconnect(self):
+        server = self.serve()
+        conn = self.connect(server)
+        server.drop()
+        self.assertRaises(
+            api.ConnectionClosed, conn.rpc, "Client", "FullStatus",
+            timeout=5)
+        self.assertTrue(conn.closed)
+
+
+class EnvironmentAPITest(Base):
+
+    def setUp(self):
+        self.config = mock.MagicMock()
+        self.config.get_env_name.return_value = "rspace"
+        self.config.juju_home = self.mkdir()
+        os.mkdir(os.path.join(self.config.juju_home, "environments"))
+        self.env = Environment(self.config)
+        self.addCleanup(self.env.close_api)
+
+    def write_jenv(self, address):
+        with open(self.env.jenv_path(), 'w') as fh:
+            fh.write(yaml.safe_dump({
+                'state-servers': [address], 'user': 'admin',
+                'password': 'secret'}))
+
+    def serve(self):
+        server = FakeAPIServer({})
+        self.addCleanup(server.close)
+        self.write_jenv(server.address)
+        # The fake server doesn't speak tls.
+        from_jenv = api.APIConnection.from_jenv
+        patcher = mock.patch.object(
+            api.APIConnection, 'from_jenv',
+            side_effect=lambda path: from_jenv(path, secure=False))
+        self.connects = patcher.start()
+        self.addCleanup(patcher.stop)
+        return server
+
+    def test_api_shared(self):
+        server = self.serve()
+        self.env.terminate_machines(["1"])
+        self.env.terminate_machines(["2"])
+        self.assertEqual(len(self.connects.call_args_list), 1)
+        self.assertEqual(
+            [r for r in server.requests if r[0] != 'Admin.Login'],
+            [('Client.DestroyMachines',
+              {'MachineNames': ['1'], 'Force': True}),
+             ('Client.DestroyMachines',
+              {'MachineNames': ['2'], 'Force': True})])
+
+    def test_destroy_environment_removes_jenv(self):
+        server = self.serve()
+        self.env.destroy_environment()
+        self.assertEqual(server.requests[-1][0], 'Client.DestroyEnvironment')
+        self.assertFalse(os.path.exists(self.env.jenv_path()))
+
+    @mock.patch('subprocess.check_output')
+    def test_cli_fallback(self, run_juju):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        address = "127.0.0.1:%d" % sock.getsockname()[1]
+        sock.close()
+        self.write_jenv(address)
+        run_juju.return_value = "machines: {}"
+        self.assertEqual(self.env.status(), {'machines': {}})
+        self.assertEqual(self.env.status(), {'machines': {}})
+        self.assertEqual(len(run_juju.call_args_list), 2)
+        self.assertTrue(self.env.api_failed)
+
+    @mock.patch('subprocess.check_output')
+    def test_cli_without_jenv(self, run_juju):
+        self.env.terminate_machines(["1"])
+        self.assertEqual(
+            run_juju.call_args[0][0],
+            ['juju', 'terminate-machine', '--force', '1'])
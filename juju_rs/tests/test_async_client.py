@@ -0,0 +1,94 @@
+import time
+import unittest
+
+try:
+    from tornado.testing import AsyncHTTPTestCase, gen_test
+    from tornado.web import Application, RequestHandler
+except ImportError:
+    raise unittest.SkipTest("tornado not installed")
+
+from juju_rs.async_client import AsyncClient
+from juju_rs.exceptions import ProviderAPIError
+
+
+class TokenHandler(RequestHandler):
+
+    def post(self):
+        self.application.auth_count += 1
+        expires = time.strftime(
+            "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() + 3600))
+        self.write({'access': {'token': {'id': 'abc', 'expires': expires}}})
+
+
+class DropletsHandler(RequestHandler):
+
+    def get(self, droplet_id=None):
+        if self.request.headers.get('X-Auth-Token') != 'abc':
+            self.set_status(401)
+            return
+        droplets = [{'id': 1, 'name': 'rspace-0', 'status': 'active'},
+                    {'id': 2, 'name': 'rspace-1', 'status': 'new'}]
+        if droplet_id is None:
+            return self.write({'status': 'OK', 'droplets': droplets})
+        for d in droplets:
+            if d['id'] == int(droplet_id):
+                return self.write({'status': 'OK', 'droplet': d})
+        self.write({'status': 'ERROR', 'message': 'Not Found'})
+
+
+class EventHandler(RequestHandler):
+
+    def get(self, event_id):
+        self.application.polls += 1
+        status = self.application.polls > 1 and 'done' or 'new'
+        self.write({'status': 'OK', 'event': {
+            'id': int(event_id), 'action_status': status}})
+
+
+class AsyncClientTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        app = Application([
+            (r'/tokens', TokenHandler),
+            (r'/tokens/droplets', DropletsHandler),
+            (r'/tokens/droplets/(\d+)', DropletsHandler),
+            (r'/tokens/events/(\d+)', EventHandler)])
+        app.auth_count = 0
+        app.polls = 0
+        return app
+
+    def setUp(self):
+        super(AsyncClientTest, self).setUp()
+        self.client = AsyncClient('user', 'key')
+        self.client.api_url_base = self.get_url('/tokens')
+        self.client.tokens.auth_url = self.get_url('/tokens')
+
+    def tearDown(self):
+        self.client.close()
+        super(AsyncClientTest, self).tearDown()
+
+    @gen_test
+    def test_concurrent_requests(self):
+        results = yield [self.client.get_droplet(1),
+                         self.client.get_droplet(2),
+                         self.client.get_droplets()]
+        self.assertEqual([d.name for d in results[:2]],
+                         ['rspace-0', 'rspace-1'])
+        self.assertEqual([d.id for d in results[2]], [1, 2])
+        # Concurrent requests share a single authentication.
+        self.assertEqual(self._app.auth_count, 1)
+
+    @gen_test
+    def test_api_error(self):
+        try:
+            yield self.client.get_droplet(3)
+        except ProviderAPIError, e:
+            self.assertEqual(e.message, 'Not Found')
+        else:
+            self.fail("missing droplet should raise")
+
+    @gen_test
+    def test_wait_on_event(self):
+        event = yield self.client.wait_on_event(5, interval=0.01)
+        self.assertEqual(event['action_status'], 'done')
+        self.assertEqual(self._app.polls, 2)
@@ -0,0 +1,105 @@
+import json
+import mock
+import os
+import threading
+import time
+
+from juju_rs.auth import TokenManager, parse_expires
+from juju_rs.exceptions import ProviderAPIError
+from base import Base
+
+
+def auth_response(token_id, expires, status_code=200):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.json.return_value = {
+        'access': {'token': {'id': token_id, 'expires': expires}}}
+    return response
+
+
+def stamp(offset):
+    return time.strftime(
+        "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() + offset))
+
+
+class TokenManagerTest(Base):
+
+    def setUp(self):
+        self.http = mock.MagicMock()
+
+    def test_parse_expires(self):
+        self.assertEqual(parse_expires("2014-11-24T22:05:39.115Z"), 1416866739)
+        self.assertEqual(
+            parse_expires("2014-11-24T16:05:39.115-06:00"), 1416866739)
+
+    def test_token_reused(self):
+        self.http.request.return_value = auth_response('abc', stamp(3600))
+        tokens = TokenManager('user', 'key', self.http)
+        self.assertEqual(tokens.get_token(), 'abc')
+        self.assertEqual(tokens.get_token(), 'abc')
+        self.assertEqual(self.http.request.call_count, 1)
+        body = json.loads(self.http.request.call_args[1]['data'])
+        self.assertEqual(
+            body['auth']['RAX-KSKEY:apiKeyCredentials'],
+            {'username': 'user', 'apiKey': 'key'})
+
+    def test_refresh_ahead_of_expiry(self):
+        self.http.request.side_effect = [
+            auth_response('abc', stamp(60)),
+            auth_response('def', stamp(3600))]
+        tokens = TokenManager('user', 'key', self.http)
+        self.assertEqual(tokens.get_token(), 'abc')
+        self.assertEqual(tokens.get_token(), 'def')
+
+    def test_concurrent_refresh(self):
+        def slow_auth(*args, **kw):
+            time.sleep(0.1)
+            return auth_response('abc', stamp(3600))
+        self.http.request.side_effect = slow_auth
+        tokens = TokenManager('user', 'key', self.http)
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(tokens.get_token()))
+            for i in range(4)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEqual(results, ['abc'] * 4)
+        self.assertEqual(self.http.request.call_count, 1)
+
+    def test_auth_failure(self):
+        self.http.request.return_value = auth_response('', '', 401)
+        tokens = TokenManager('user', 'key', self.http)
+        self.assertRaises(ProviderAPIError, tokens.get_token)
+
+    def test_disk_cache(self):
+        cache_path = os.path.join(self.mkdir(), 'rspace', 'tokens.json')
+        self.http.request.return_value = auth_response('abc', stamp(3600))
+        TokenManager('user', 'key', self.http, cache_path=cache_path).get_token()
+        self.assertEqual(os.stat(cache_path).st_mode & 0777, 0600)
+
+        tokens = TokenManager('user', 'key', self.http, cache_path=cache_path)
+        self.assertEqual(tokens.get_token(), 'abc')
+        self.assertEqual(self.http.request.call_count, 1)
+
+        # Different credentials don't share the cached token.
+        self.http.request.return_value = auth_response('xyz', stamp(3600))
+        tokens = TokenManager('user', 'key2', self.http, cache_path=cache_path)
+        self.assertEqual(tokens.get_token(), 'xyz')
+
+        tokens.invalidate('xyz')
+        self.assertEqual(tokens.load(), None)
+
+    def test_current_and_store(self):
+        cache_path = os.path.join(self.mkdir(), 'rspace', 'tokens.json')
+        tokens = TokenManager('user', 'key', cache_path=cache_path)
+        self.assertEqual(tokens.current(), None)
+        tokens.store(tokens.auth_result(auth_response('abc', stamp(3600))))
+        self.assertEqual(tokens.current(), 'abc')
+        # Stored tokens are cached on disk like authenticated ones.
+        self.assertEqual(
+            TokenManager('user', 'key', cache_path=cache_path).current(),
+            'abc')
+        tokens.store(tokens.auth_result(auth_response('def', stamp(60))))
+        self.assertEqual(
+            TokenManager('user', 'key', cache_path=cache_path).current(),
+            None)
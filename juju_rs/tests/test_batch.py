@@ -0,0 +1,64 @@
+import threading
+
+from juju_rs.batch import Batcher
+from juju_rs.metrics import Metrics
+from base import Base
+
+
+class BatcherTest(Base):
+
+    def submit_all(self, batcher, items):
+        results = {}
+
+        def submit(item):
+            try:
+                results[item] = batcher.submit(item)
+            except Exception, e:
+                results[item] = e
+
+        threads = [threading.Thread(target=submit, args=(i,))
+                   for i in items]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_batches(self):
+        calls = []
+
+        def call(items):
+            calls.append(sorted(items))
+            return [i * 2 for i in items]
+
+        metrics = Metrics()
+        batcher = Batcher(call, window=0.5, size=5, metrics=metrics)
+        results = self.submit_all(batcher, range(10))
+        self.assertEqual(results, dict((i, i * 2) for i in range(10)))
+        # Full batches are flushed without waiting out the window.
+        self.assertEqual(sorted(len(c) for c in calls), [5, 5])
+        self.assertEqual(metrics.counters['batches'], 2)
+        self.assertEqual(metrics.counters['batched'], 10)
+
+    def test_window(self):
+        calls = []
+        batcher = Batcher(calls.append, window=0.01)
+        self.assertEqual(batcher.submit(1), None)
+        self.assertEqual(batcher.submit(2), None)
+        self.assertEqual(calls, [[1], [2]])
+
+    def test_failure_per_item(self):
+        calls = []
+
+        def call(items):
+            calls.append(sorted(items))
+            if 3 in items:
+                raise ValueError("bad %s" % items)
+
+        batcher = Batcher(call, window=0.5, size=4)
+        results = self.submit_all(batcher, range(4))
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(str(results[3]), "bad [3]")
+        self.assertEqual([results[i] for i in range(3)], [None] * 3)
+        self.assertEqual(calls[0], [0, 1, 2, 3])
+        self.assertEqual(len(calls), 5)
@@ -0,0 +1,97 @@
+import mock
+import os
+import time
+
+from juju_rs.cache import ResponseCache
+from juju_rs.client import Client
+from base import Base
+
+
+def api_response(data, status_code=200, headers=None):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.json.return_value = data
+    response.headers = headers or {}
+    return response
+
+
+class ResponseCacheTest(Base):
+
+    def setUp(self):
+        self.path = os.path.join(self.mkdir(), 'rspace', 'catalog.json')
+
+    def test_persisted(self):
+        cache = ResponseCache(self.path, 'user')
+        cache.put('/images', {'images': []}, etag='"v1"')
+        entry = ResponseCache(self.path, 'user').get('/images')
+        self.assertEqual(entry['data'], {'images': []})
+        self.assertEqual(entry['etag'], '"v1"')
+        self.assertTrue(cache.is_fresh('/images', entry))
+        self.assertEqual(ResponseCache(self.path, 'other').get('/images'), None)
+
+    def test_ttl(self):
+        cache = ResponseCache(self.path, 'user', ttls={'/ssh_keys': 60})
+        self.assertFalse(cache.cacheable('/droplets'))
+        cache.put('/ssh_keys', {'ssh_keys': []})
+        entry = cache.get('/ssh_keys')
+        entry['stored'] = time.time() - 61
+        self.assertFalse(cache.is_fresh('/ssh_keys', entry))
+        cache.touch('/ssh_keys')
+        self.assertTrue(cache.is_fresh('/ssh_keys', cache.get('/ssh_keys')))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(self.path, 'user', max_entries=2)
+        cache.put('/images', 1)
+        cache.put('/regions', 2)
+        cache.get('/images')
+        cache.put('/ssh_keys', 3)
+        cache = ResponseCache(self.path, 'user')
+        self.assertEqual(cache.get('/regions'), None)
+        self.assertEqual(cache.get('/images')['data'], 1)
+        self.assertEqual(cache.get('/ssh_keys')['data'], 3)
+
+    def test_refresh(self):
+        ResponseCache(self.path, 'user').put('/images', 1)
+        cache = ResponseCache(self.path, 'user', refresh=True)
+        self.assertEqual(cache.get('/images'), None)
+
+
+class ClientCacheTest(Base):
+
+    def setUp(self):
+        path = os.path.join(self.mkdir(), 'catalog.json')
+        self.client = Client(
+            'user', 'key', cache=ResponseCache(path, 'user'))
+        self.client.tokens = mock.MagicMock()
+        self.client.http = mock.MagicMock()
+
+    def test_cached_request(self):
+        data = {'status': 'OK', 'images': [{'id': 1}]}
+        self.client.http.request.return_value = api_response(
+            data, headers={'ETag': '"v1"'})
+        self.assertEqual(self.client.request('/images'), data)
+        self.assertEqual(self.client.request('/images'), data)
+        self.assertEqual(self.client.http.request.call_count, 1)
+
+    def test_revalidate(self):
+        data = {'status': 'OK', 'images': [{'id': 1}]}
+        self.client.cache.put(
+            '/images', data, etag='"v1"',
+            last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+        self.client.cache.get('/images')['stored'] = 0
+
+        self.client.http.request.return_value = api_response(None, 304)
+        self.assertEqual(self.client.request('/images'), data)
+        headers = self.client.http.request.call_args[1]['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(
+            headers['If-Modified-Since'], 'Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertTrue(self.client.cache.is_fresh(
+            '/images', self.client.cache.get('/images')))
+
+    def test_uncached_endpoint(self):
+        data = {'status': 'OK', 'droplets': []}
+        self.client.http.request.return_value = api_response(data)
+        self.client.request('/droplets')
+        self.client.request('/droplets')
+        self.assertEqual(self.client.http.request.call_count, 2)
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+
+from juju_rs.cli import PLUGIN_DESCRIPTION, load_command
+from juju_rs import commands
+from base import Base
+
+# Run the cli in a fresh interpreter, reporting the modules it imported.
+SCRIPT = """
+import json, sys
+sys.argv = ['juju-rs'] + sys.argv[1:]
+try:
+    from juju_rs import cli
+    cli.main()
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+# Not needed until a command runs.
+HEAVY = ('juju_rs.commands', 'juju_rs.config', 'juju_rs.provider',
+         'juju_rs.env', 'requests', 'urllib3', 'yaml', 'uuid')
+
+SUBCOMMANDS = ('bootstrap', 'add-machine', 'warm-pool', 'list-machines',
+               'terminate-machine', 'destroy-environment', 'reconcile')
+
+
+class StartupTest(Base):
+
+    def run_cli(self, *args):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env = dict(os.environ, PYTHONPATH=root)
+        proc = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT] + list(args), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        return out, json.loads(err.splitlines()[-1])
+
+    def assert_light(self, modules):
+        self.assertEqual([m for m in HEAVY if m in modules], [])
+
+    def test_description(self):
+        out, modules = self.run_cli('--description')
+        self.assertEqual(out.strip(), PLUGIN_DESCRIPTION)
+        self.assert_light(modules)
+
+    def test_help(self):
+        out, modules = self.run_cli('--help')
+        for name in SUBCOMMANDS:
+            self.assertIn(name, out)
+        self.assert_light(modules)
+
+    def test_subcommand_help(self):
+        for name in SUBCOMMANDS:
+            out, modules = self.run_cli(name, '--help')
+            self.assertIn('usage:', out)
+            self.assert_light(modules)
+
+    def test_load_command(self):
+        self.assertIs(load_command('AddMachine'), commands.AddMachine)
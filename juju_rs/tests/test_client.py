@@ -0,0 +1,73 @@
+import mock
+import time
+
+from juju_rs.client import Client, Droplet, SSHKey
+from base import Base
+
+
+class EntityTest(Base):
+
+    def test_from_dict(self):
+        d = Droplet.from_dict(dict(
+            id=221, name="rspace-123123", ip_address="10.0.1.23",
+            image_id=5141286, backups_active=False))
+        self.assertEqual(d.id, 221)
+        self.assertEqual(d.ip_address, "10.0.1.23")
+        self.assertEqual(d.status, None)
+        self.assertFalse(hasattr(d, '__dict__'))
+
+        # Fields outside of slots are decoded on access.
+        self.assertTrue(isinstance(d._extra, tuple))
+        self.assertEqual(d.image_id, 5141286)
+        self.assertEqual(d._extra,
+                         {'image_id': 5141286, 'backups_active': False})
+        self.assertRaises(AttributeError, getattr, d, 'missing')
+        self.assertRaises(AttributeError, setattr, d, 'missing', 1)
+
+    def test_to_dict(self):
+        data = {'id': 1, 'name': 'abc', 'fingerprint': 'xyz'}
+        self.assertEqual(SSHKey.from_dict(data).to_dict(), data)
+        self.assertEqual(SSHKey.from_dict({'id': 1})._extra, None)
+
+
+class ClientTest(Base):
+
+    def setUp(self):
+        self.client = Client('user', 'key')
+        self.client.request = mock.MagicMock()
+
+    def test_iter_droplets(self):
+        pages = {
+            1: {'status': 'OK', 'droplets': [{'id': 1}, {'id': 2}],
+                'links': {'pages': {'next': 'droplets?page=2'}}},
+            2: {'status': 'OK', 'droplets': [{'id': 3}],
+                'links': {'pages': {'prev': 'droplets?page=1'}}}}
+        self.client.request.side_effect = (
+            lambda target, method='GET', params=None: pages[params['page']])
+
+        droplets = self.client.iter_droplets(per_page=2)
+        self.assertEqual(droplets.next().id, 1)
+        # Next page is fetched in the background while the first is used.
+        deadline = time.time() + 5
+        while self.client.request.call_count < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(
+            self.client.request.call_args_list[-1],
+            mock.call('/droplets', 'GET', dict(page=2, per_page=2)))
+        self.assertEqual([d.id for d in droplets], [2, 3])
+        self.assertEqual(self.client.request.call_count, 2)
+
+    def test_iter_droplets_unpaginated(self):
+        self.client.request.return_value = {
+            'status': 'OK', 'droplets': [{'id': 1}, {'id': 2}]}
+        self.assertEqual([d.id for d in self.client.iter_droplets()], [1, 2])
+        self.assertEqual(self.client.request.call_count, 1)
+
+    def test_iter_droplets_error(self):
+        self.client.request.side_effect = [
+            {'status': 'OK', 'droplets': [{'id': 1}],
+             'links': {'pages': {'next': 'droplets?page=2'}}},
+            ValueError("boom")]
+        droplets = self.client.iter_droplets()
+        self.assertEqual(droplets.next().id, 1)
+        self.assertRaises(ValueError, droplets.next)
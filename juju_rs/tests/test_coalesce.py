@@ -0,0 +1,83 @@
+import mock
+import threading
+import time
+
+from juju_rs.client import Client
+from juju_rs.coalesce import SingleFlight
+from base import Base
+
+
+class SingleFlightTest(Base):
+
+    def run_concurrently(self, func, count=4):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(func()))
+                   for i in range(count)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        return results
+
+    def test_concurrent_calls_shared(self):
+        flights = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'status': 'OK'}
+
+        results = self.run_concurrently(lambda: flights.do('a', slow))
+        self.assertEqual(results, [{'status': 'OK'}] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.shared, 3)
+        self.assertEqual(flights.calls, {})
+
+        # Without a ttl, later calls go through.
+        flights.do('a', slow)
+        self.assertEqual(len(calls), 2)
+
+    def test_ttl(self):
+        flights = SingleFlight()
+        func = mock.MagicMock(return_value=1)
+        flights.do('a', func, ttl=10)
+        flights.do('a', func, ttl=10)
+        flights.do('b', func, ttl=10)
+        self.assertEqual(func.call_count, 2)
+
+    def test_error_shared(self):
+        flights = SingleFlight()
+        errors = []
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                flights.do('a', fail, ttl=10)
+            except ValueError, e:
+                errors.append(e)
+        self.run_concurrently(call, 3)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(flights.recent, {})
+
+
+class ClientCoalesceTest(Base):
+
+    def setUp(self):
+        self.client = Client('user', 'key')
+        self.client._request = mock.MagicMock(return_value={'status': 'OK'})
+
+    def test_coalesce_keys(self):
+        self.client.request('/events/1')
+        self.client.request('/events/1')
+        self.assertEqual(self.client._request.call_count, 1)
+        self.client.request('/droplets', params={'page': 1})
+        self.client.request('/droplets', params={'page': 2})
+        self.assertEqual(self.client._request.call_count, 3)
+
+    def test_create_not_coalesced(self):
+        self.assertEqual(self.client.retry.is_idempotent('/droplets/new'),
+                         False)
+        self.client.request('/droplets/new', params={'name': 'a'})
+        self.assertEqual(self.client.flights.shared, 0)
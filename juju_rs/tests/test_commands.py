@@ -3,6 +3,7 @@ import mock
 import os
 import StringIO
 import tempfile
+import threading
 import unittest
 import yaml
 
@@ -11,11 +12,14 @@ from juju_rs.commands import (
     Bootstrap,
     AddMachine,
     TerminateMachine,
-    DestroyEnvironment)
+    DestroyEnvironment,
+    Reconcile)
 
 
 from juju_rs.client import SSHKey, Droplet
-from juju_rs.exceptions import ConfigError
+from juju_rs.exceptions import (
+    ConfigError, PrecheckError, ProviderAPIError, TimeoutError)
+from juju_rs.journal import Journal
 from juju_rs.tests.base import Base
 
 # Generated from constraints.images(do_client)
@@ -32,6 +36,23 @@ class CommandBase(Base):
         self.config = mock.MagicMock()
         self.provider = mock.MagicMock()
         self.env = mock.MagicMock()
+        # Child mocks are created on first access, create those called
+        # from concurrent ops up front so no thread records its calls
+        # on a child that loses the race. call_count is not updated
+        # atomically either, count call_args_list instead.
+        for name in ('launch_instance', 'wait_on', 'rename_instance',
+                     'terminate_instance'):
+            getattr(self.provider, name)
+        for name in ('add_machine', 'terminate_machines',
+                     'destroy_environment'):
+            getattr(self.env, name)
+        # Status comes from `juju status` rather than the api watcher.
+        self.env.api.return_value = None
+        self.config.cache_dir = self.mkdir()
+        self.config.resume = False
+        self.config.warm_pool = 0
+        self.config.parallel = None
+        self.config.num_machines = 0
         self.output = self.capture_logging('juju.rspace')
 
     def setup_env(self, conf=None):
@@ -133,8 +154,9 @@ class BootstrapTest(CommandBase):
         self.cmd = Bootstrap(self.config, self.provider, self.env)
 
     @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
     @mock.patch('juju_rs.ops.ssh')
-    def test_bootstrap(self, mock_ssh, mock_get_images):
+    def test_bootstrap(self, mock_ssh, mock_probe, mock_get_images):
         mock_get_images.return_value = IMAGE_MAP
         self.setup_env()
         self.env.is_running.return_value = False
@@ -143,14 +165,116 @@ class BootstrapTest(CommandBase):
         mock_ssh.check_ssh.return_value = True
         mock_ssh.update_instance.return_value = True
 
-        self.provider.get_instance.return_value = Droplet.from_dict(dict(
+        self.provider.wait_on.return_value = Droplet.from_dict(dict(
             id=2121,
             name='rspace-13290123j13',
             ip_address="10.0.2.1"))
         self.cmd.run()
 
+        mock_probe.shared_probe().wait.assert_called_once_with(
+            '10.0.2.1', 22, timeout=360)
         mock_ssh.check_ssh.assert_called_once_with('10.0.2.1')
 
+    @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_bootstrap_add_machines(self, mock_ssh, mock_probe,
+                                    mock_get_images):
+        mock_get_images.return_value = IMAGE_MAP
+        self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.env.is_running.return_value = False
+        self.config.num_machines = 2
+        self.config.options.ssh_key = None
+        self.provider.wait_on.side_effect = lambda instance: instance
+        self.provider.launch_instance.side_effect = lambda params: (
+            Droplet.from_dict(dict(
+                id=len(params['name']), name=params['name'],
+                ip_address="10.0.2.%d" % len(params['name']))))
+
+        events = []
+        self.env.bootstrap_jenv.side_effect = (
+            lambda address: events.append('bootstrap'))
+        self.env.add_machine.side_effect = (
+            lambda location, key: events.append('add') or "1")
+        self.cmd.run()
+        self.assertEqual(len(self.provider.launch_instance.call_args_list), 3)
+        self.assertEqual(events, ['bootstrap', 'add', 'add'])
+
+    @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_bootstrap_failure_add_machines(self, mock_ssh, mock_probe,
+                                            mock_get_images):
+        mock_get_images.return_value = IMAGE_MAP
+        self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.env.is_running.return_value = False
+        self.config.num_machines = 1
+        self.provider.wait_on.side_effect = lambda instance: instance
+        self.provider.launch_instance.side_effect = lambda params: (
+            Droplet.from_dict(dict(
+                id=len(params['name']), name=params['name'],
+                ip_address="10.0.2.1")))
+        self.env.bootstrap_jenv.side_effect = ValueError("bootstrap")
+        self.assertRaises(ValueError, self.cmd.run)
+        # Neither the state server nor the added machine are left.
+        self.assertEqual(
+            sorted(self.provider.terminate_instance.call_args_list),
+            [mock.call(8), mock.call(39)])
+        self.assertFalse(self.env.add_machine.called)
+
+    @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_bootstrap_timeout(self, mock_ssh, mock_probe, mock_get_images):
+        mock_get_images.return_value = IMAGE_MAP
+        self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.env.is_running.return_value = False
+        self.config.num_machines = 1
+        self.provider.wait_on.side_effect = lambda instance: instance
+        self.provider.launch_instance.side_effect = lambda params: (
+            Droplet.from_dict(dict(
+                id=len(params['name']), name=params['name'],
+                ip_address="10.0.2.1")))
+        stuck = threading.Event()
+        self.addCleanup(stuck.set)
+        self.env.bootstrap_jenv.side_effect = lambda address: stuck.wait(5)
+        self.cmd.BOOTSTRAP_TIMEOUT = 0.2
+        self.cmd.runner.CHECK_INTERVAL = 0.05
+        self.assertRaises(TimeoutError, self.cmd.run)
+        # The state server still bootstrapping is terminated as well.
+        self.assertEqual(
+            sorted(self.provider.terminate_instance.call_args_list),
+            [mock.call(8), mock.call(39)])
+
+    @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_bootstrap_add_machine_failure(self, mock_ssh, mock_probe,
+                                           mock_get_images):
+        mock_get_images.return_value = IMAGE_MAP
+        self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.env.is_running.return_value = False
+        self.config.num_machines = 1
+        self.provider.launch_instance.side_effect = lambda params: (
+            Droplet.from_dict(dict(
+                id=len(params['name']), name=params['name'],
+                ip_address="10.0.2.1")))
+
+        def wait_on(instance):
+            if instance.id != 8:
+                raise ProviderAPIError(mock.MagicMock(), "event failed")
+            return instance
+        self.provider.wait_on.side_effect = wait_on
+        self.assertRaises(PrecheckError, self.cmd.run)
+        self.assertTrue(self.env.bootstrap_jenv.called)
+        # Only the machine that failed to boot is terminated.
+        self.provider.terminate_instance.assert_called_once_with(39)
+        self.assertIn("Could not add machine rspace-", self.output.getvalue())
+
     # TODO
     # test existing named host / ie precondition check for live env
     # test for jenv bootstrap (also in test_environment.py)
@@ -162,11 +286,149 @@ class AddMachineTest(CommandBase):
         super(AddMachineTest, self).setUp()
         self.cmd = AddMachine(self.config, self.provider, self.env)
 
+        self.config.num_machines = 2
+        self.config.options.ssh_key = ""
+        self.journal_path = os.path.join(
+            self.config.cache_dir, 'journal-rspace.json')
+
+    def droplet(self, instance_id, name, **kw):
+        return Droplet.from_dict(dict(
+            id=instance_id, name=name, ip_address="10.0.2.%d" % instance_id,
+            **kw))
+
     @mock.patch('juju_rs.constraints.get_images')
-    def test_add_machine(self, mock_get_images):
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_add_machine(self, mock_ssh, mock_probe, mock_get_images):
         mock_get_images.return_value = IMAGE_MAP
         self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.provider.launch_instance.side_effect = lambda params: (
+            self.droplet(len(params['name']) % 100, params['name']))
+        self.provider.wait_on.side_effect = lambda instance: instance
+        self.env.add_machine.return_value = "1"
         self.cmd.run()
+        self.assertEqual(len(self.env.add_machine.call_args_list), 2)
+        # A fully registered batch doesn't leave a journal behind.
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_add_machine_failure_journaled(
+            self, mock_ssh, mock_probe, mock_get_images):
+        mock_get_images.return_value = IMAGE_MAP
+        self.setup_env()
+        self.provider.launch_instance.side_effect = lambda params: (
+            self.droplet(1, params['name']))
+        self.provider.wait_on.side_effect = lambda instance: instance
+        mock_ssh.check_ssh.side_effect = TimeoutError("no ssh")
+        self.cmd.run()
+        journal = Journal(self.journal_path)
+        self.assertEqual(
+            [e['state'] for n, e in journal.unfinished()], ['ready', 'ready'])
+        self.assertEqual(journal.load()['total'], 2)
+
+    def test_add_machine_unfinished_journal(self):
+        self.setup_env()
+        journal = Journal(self.journal_path)
+        journal.start(2, {'image_id': 1, 'size_id': 66, 'region_id': 1,
+                          'ssh_key_ids': [1]}, {'series': 'precise'})
+        journal.record('rspace-a', 'launched', instance_id=1)
+        self.assertRaises(PrecheckError, self.cmd.run)
+        # The launched instance stays journaled for --resume.
+        self.assertEqual(
+            Journal(self.journal_path).unfinished(),
+            [('rspace-a', {'state': 'launched', 'instance_id': 1})])
+        self.assertFalse(self.provider.launch_instance.called)
+
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_add_machine_resume(self, mock_ssh, mock_probe):
+        self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.config.resume = True
+        journal = Journal(self.journal_path)
+        journal.start(4, {'image_id': 1, 'size_id': 66, 'region_id': 1,
+                          'ssh_key_ids': [1]}, {'series': 'precise'})
+        journal.record('rspace-a', 'registered', instance_id=1, machine_id='1')
+        journal.record('rspace-b', 'ready', instance_id=2)
+        journal.record('rspace-c', 'launching')
+        journal.record('rspace-d', 'launched', instance_id=4)
+
+        self.provider.get_instances.return_value = [
+            self.droplet(3, 'rspace-c')]
+
+        def get_instance(instance_id):
+            if instance_id == 4:
+                raise ProviderAPIError(mock.MagicMock(), "Not Found")
+            return self.droplet(instance_id, 'rspace-b')
+        self.provider.get_instance.side_effect = get_instance
+        self.provider.launch_instance.side_effect = lambda params: (
+            self.droplet(5, params['name']))
+        self.provider.wait_on.side_effect = lambda instance: instance
+        self.env.add_machine.return_value = "2"
+        self.cmd.run()
+
+        # b is adopted past wait, c is found by name, d is gone and
+        # replaced by a new launch.
+        self.assertEqual(len(self.provider.launch_instance.call_args_list), 1)
+        self.assertEqual(
+            sorted([c[0][0].id for c in self.provider.wait_on.call_args_list]),
+            [3, 5])
+        self.assertEqual(len(self.env.add_machine.call_args_list), 3)
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    @mock.patch('juju_rs.constraints.get_images')
+    @mock.patch('juju_rs.ops.probe')
+    @mock.patch('juju_rs.ops.ssh')
+    def test_add_machine_warm_pool(self, mock_ssh, mock_probe,
+                                   mock_get_images):
+        mock_get_images.return_value = IMAGE_MAP
+        self.setup_env()
+        mock_ssh.check_ssh.return_value = True
+        self.config.warm_pool = 2
+        self.config.constraints = ""
+        pooled = self.droplet(
+            7, 'rspace-pool-abc', status='active', size_id=66,
+            region_id=4, image_id=IMAGE_MAP['precise'])
+        self.provider.get_instances.return_value = [pooled]
+        pool = self.cmd.get_pool()
+        pool.record_verified([pooled])
+        ids = iter([8, 9, 10])
+        self.provider.launch_instance.side_effect = lambda params: (
+            self.droplet(next(ids), params['name']))
+        self.provider.wait_on.side_effect = lambda instance: instance
+        self.env.add_machine.return_value = "1"
+        self.cmd.run()
+
+        # The active, verified pool machine skips launch, wait and ssh.
+        self.provider.rename_instance.assert_called_once_with(
+            7, mock.ANY)
+        self.assertEqual(len(self.env.add_machine.call_args_list), 2)
+        self.assertNotIn(
+            mock.call('10.0.2.7'), mock_ssh.check_ssh.call_args_list)
+        # One new machine for the batch, two pool refills as the
+        # claimed instance was renamed out of the pool. Refills are
+        # waited on and verified like the batch.
+        names = [c[0][0]['name'] for c in
+                 self.provider.launch_instance.call_args_list]
+        self.assertEqual(
+            len([n for n in names if n.startswith('rspace-pool-')]), 2)
+        self.assertEqual(len(names), 3)
+        self.assertEqual(len(self.provider.wait_on.call_args_list), 3)
+        self.assertEqual(len(mock_ssh.check_ssh.call_args_list), 3)
+
+        # Recorded as verified while still pool members.
+        self.provider.get_instances.return_value = [
+            self.droplet(9, 'rspace-pool-a'),
+            self.droplet(10, 'rspace-pool-b')]
+        self.assertEqual(pool.verified(), set([9, 10]))
+
+    def test_add_machine_resume_no_journal(self):
+        self.setup_env()
+        self.config.resume = True
+        self.assertRaises(PrecheckError, self.cmd.run)
 
 
 class TerminateMachineTest(CommandBase):
@@ -191,6 +453,62 @@ class TerminateMachineTest(CommandBase):
         self.config.options.machines = ["1"]
         self.cmd.run()
         self.provider.terminate_instance.assert_called_once_with(221)
+        self.assertEqual(self.cmd.get_index().entries(), {})
+
+    def test_terminate_indexed_machine(self):
+        self.setup_env()
+        self.env.status.return_value = {
+            'machines': {
+                '1': {
+                    'dns-name': '10.0.1.23',
+                    'instance-id': 'manual:ip_address'},
+                '2': {
+                    'dns-name': '10.0.1.24',
+                    'instance-id': 'manual:ip_address'}
+            }}
+        index = self.cmd.get_index()
+        index.add('1', Droplet.from_dict(dict(
+            id=221, name="rspace-123123", ip_address="10.0.1.23")))
+        index.add('2', Droplet.from_dict(dict(
+            id=222, name="rspace-123124", ip_address="10.0.1.24")))
+        self.config.options.machines = ["1"]
+        self.cmd.run()
+        # Resolved from the index without listing the account.
+        self.assertFalse(self.provider.get_instances.called)
+        self.provider.terminate_instance.assert_called_once_with(221)
+        self.assertEqual(index.entries().keys(), ['2'])
+
+
+class ReconcileTest(CommandBase):
+
+    def test_reconcile(self):
+        self.setup_env()
+        cmd = Reconcile(self.config, self.provider, self.env)
+        index = cmd.get_index()
+        # Stale entry of a terminated machine, and a drifted one.
+        index.add('3', Droplet.from_dict(dict(
+            id=300, name="rspace-3", ip_address="10.0.1.30")))
+        index.add('1', Droplet.from_dict(dict(
+            id=100, name="rspace-1", ip_address="10.0.1.23")))
+        self.env.status.return_value = {
+            'machines': {
+                '1': {'dns-name': '10.0.1.23'},
+                '2': {'dns-name': '10.0.1.24'},
+                '4': {'dns-name': '10.0.1.40'}}}
+        self.provider.get_instances.return_value = [
+            Droplet.from_dict(dict(
+                id=221, name="rspace-1", ip_address="10.0.1.23")),
+            Droplet.from_dict(dict(
+                id=222, name="rspace-2", ip_address="10.0.1.24")),
+            Droplet.from_dict(dict(
+                id=258, name="docena-209123", ip_address="10.0.1.103"))]
+        cmd.run()
+        self.assertEqual(
+            dict((k, v['instance_id']) for k, v in index.entries().items()),
+            {'1': 221, '2': 222})
+        output = self.output.getvalue()
+        self.assertIn("Machine 4 at 10.0.1.40 has no instance", output)
+        self.assertIn("1 added 1 changed 1 removed", output)
 
 
 class DestroyEnvironmentTest(CommandBase):
@@ -198,6 +516,14 @@ class DestroyEnvironmentTest(CommandBase):
     def setUp(self):
         super(DestroyEnvironmentTest, self).setUp()
         self.cmd = DestroyEnvironment(self.config, self.provider, self.env)
+        self.removed = []
+
+    def set_machines(self, machines):
+        """Serve status of machines, less those terminated in juju.
+        """
+        self.env.terminate_machines.side_effect = self.removed.extend
+        self.env.status.side_effect = lambda: {'machines': dict(
+            (k, v) for k, v in machines.items() if k not in self.removed)}
 
     def test_destroy_environment_force(self):
         self.config.options.force = True
@@ -215,69 +541,136 @@ class DestroyEnvironmentTest(CommandBase):
                 id=234, name="loug", ip_address="10.0.1.18"))]
 
         self.cmd.run()
+        # Results come back in completion order.
         self.assertEqual(
-            self.provider.terminate_instance.call_args_list,
+            sorted(self.provider.terminate_instance.call_args_list),
             [mock.call(221), mock.call(258)])
         self.env.destroy_environment_jenv.assert_called_once()
 
-    @mock.patch('juju_rs.commands.time')
-    def test_destroy_environment(self, mock_time):
+    def test_destroy_environment(self):
         self.config.options.force = False
         self.setup_env()
-        self.env.status.return_value = {
-            'machines': {
-                '0': {
-                    'dns-name': '10.0.1.23',
-                    'instance-id': 'manual:ip_address'},
-                '1': {
-                    'dns-name': '10.0.1.25',
-                    'instance-id': 'manual:ip_address'}
-            }}
+        self.set_machines({
+            '0': {
+                'dns-name': '10.0.1.23',
+                'instance-id': 'manual:ip_address'},
+            '1': {
+                'dns-name': '10.0.1.25',
+                'instance-id': 'manual:ip_address'}})
         self.provider.get_instances.return_value = [
             Droplet.from_dict(dict(
                 id=221, name="rspace-123123", ip_address="10.0.1.23")),
             Droplet.from_dict(dict(
                 id=258, name="docena-209123", ip_address="10.0.1.25"))]
 
-        # Destroy Env has a sleep / mock it out.
-        mock_time.sleep.return_value = None
+        events = []
+
+        def terminate(machines):
+            events.append(('juju', machines[0]))
+            self.removed.extend(machines)
+        self.env.terminate_machines.side_effect = terminate
+        self.env.destroy_environment.side_effect = (
+            lambda: events.append(('destroy', None)))
+        self.provider.terminate_instance.side_effect = (
+            lambda i: events.append(('instance', i)))
         self.cmd.run()
         self.assertEqual(
-            self.provider.terminate_instance.call_args_list,
-            [mock.call(258), mock.call(221)])
+            sorted(self.provider.terminate_instance.call_args_list),
+            [mock.call(221), mock.call(258)])
         self.env.terminate_machines.assert_called_once_with(['1'])
+        # Machine 1's instance may go alongside the env destroy, the
+        # state server only after it.
+        self.assertEqual(events[0], ('juju', '1'))
+        self.assertEqual(events[-1], ('instance', 221))
+        self.assertIn(('destroy', None), events[1:3])
+
+    def test_destroy_environment_with_missing_iaas_machine(self):
+        self.config.options.force = False
+        self.setup_env()
+        self.set_machines({
+            '0': {
+                'dns-name': '10.0.1.23',
+                'instance-id': 'manual:ip_address'},
+            '1': {
+                'dns-name': '10.0.1.25',
+                'instance-id': 'manual:ip_address'},
+            '2': {
+                'dns-name': '10.0.1.27',
+                'instance-id': 'manual:ip_address'}})
+        self.provider.get_instances.return_value = [
+            Droplet.from_dict(dict(
+                id=221, name="rspace-123123", ip_address="10.0.1.23")),
+            Droplet.from_dict(dict(
+                id=258, name="docena-209123", ip_address="10.0.1.25"))]
 
-    @mock.patch('juju_rs.commands.time')
-    def test_destroy_environment_with_missing_iaas_machine(self, mock_time):
+        self.cmd.run()
+        self.assertEqual(
+            sorted(self.provider.terminate_instance.call_args_list),
+            [mock.call(221), mock.call(258)])
+        # Juju removals are batched into one call.
+        self.assertEqual(
+            len(self.env.terminate_machines.call_args_list), 1)
+        self.assertEqual(
+            sorted(self.env.terminate_machines.call_args[0][0]), ['1', '2'])
+
+    def test_destroy_environment_failure(self):
         self.config.options.force = False
         self.setup_env()
         self.env.status.return_value = {
             'machines': {
                 '0': {
                     'dns-name': '10.0.1.23',
-                    'instance-id': 'manual:ip_address'},
-                '1': {
-                    'dns-name': '10.0.1.25',
-                    'instance-id': 'manual:ip_address'},
-                '2': {
-                    'dns-name': '10.0.1.27',
-                    'instance-id': 'manual:ip_address'}
-            }}
+                    'instance-id': 'manual:ip_address'}}}
+        self.provider.get_instances.return_value = [
+            Droplet.from_dict(dict(
+                id=221, name="rspace-123123", ip_address="10.0.1.23"))]
+        self.env.destroy_environment.side_effect = ValueError("juju")
+        self.assertRaises(ValueError, self.cmd.run)
+        # The state server is kept when destroying the env failed.
+        self.assertFalse(self.provider.terminate_instance.called)
+
+    def test_destroy_environment_removal_failure(self):
+        self.config.options.force = False
+        self.setup_env()
+        self.set_machines({
+            '0': {
+                'dns-name': '10.0.1.23',
+                'instance-id': 'manual:ip_address'},
+            '1': {
+                'dns-name': '10.0.1.25',
+                'instance-id': 'manual:ip_address'}})
         self.provider.get_instances.return_value = [
             Droplet.from_dict(dict(
                 id=221, name="rspace-123123", ip_address="10.0.1.23")),
             Droplet.from_dict(dict(
-                id=258, name="docena-209123", ip_address="10.0.1.25"))]
+                id=258, name="rspace-209123", ip_address="10.0.1.25"))]
+        self.env.terminate_machines.side_effect = ValueError("no dice")
+        try:
+            self.cmd.run()
+        except PrecheckError, e:
+            self.assertIn("1 (no dice)", str(e))
+        else:
+            self.fail("Expected precheck error")
+        self.assertFalse(self.env.destroy_environment.called)
+        self.assertFalse(self.provider.terminate_instance.called)
 
-        # Destroy Env has a sleep / mock it out.
-        mock_time.sleep.return_value = None
+    def test_destroy_environment_settle_timeout(self):
+        self.config.options.force = False
+        self.setup_env()
+        # Machine 1 never leaves juju state.
+        self.env.status.return_value = {
+            'machines': {
+                '0': {
+                    'dns-name': '10.0.1.23',
+                    'instance-id': 'manual:ip_address'},
+                '1': {
+                    'dns-name': '10.0.1.25',
+                    'instance-id': 'manual:ip_address'}}}
+        self.provider.get_instances.return_value = []
+        self.cmd.SETTLE_TIMEOUT = 0.1
         self.cmd.run()
-        self.assertEqual(
-            self.provider.terminate_instance.call_args_list,
-            [mock.call(258), mock.call(221)])
-        self.assertEqual(
-            self.env.terminate_machines.call_args_list,
-            [mock.call(['1']), mock.call(['2'])])
+        self.env.destroy_environment.assert_called_once_with()
+        self.assertIn("did not converge", self.output.getvalue())
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,10 @@
+import mock
 import os
 import yaml
 
 from juju_rs.config import Config
 from juju_rs.exceptions import ConfigError
+from juju_rs.provider import RackSpace
 
 from base import Base
 
@@ -56,3 +58,17 @@ class ConfigTest(Base):
         # Via Environment
         self.change_environment(JUJU_ENV="mercury")
         self.assertEqual(config.get_env_name(), 'mercury')
+
+    @mock.patch('juju_rs.provider.RackSpace')
+    def test_connect_provider_pool_size(self, rackspace):
+        self.change_environment(
+            DO_CLIENT_ID="abc", DO_API_KEY="xyz", DO_POOL_SIZE="")
+        rackspace.get_config = RackSpace.get_config
+        self.get_config(parallel=64).connect_provider()
+        self.assertEqual(rackspace.call_args[0][0]['pool_size'], 64)
+        # Never below the default, nor overriding DO_POOL_SIZE.
+        self.get_config(parallel=2).connect_provider()
+        self.assertEqual(rackspace.call_args[0][0]['pool_size'], 32)
+        self.change_environment(DO_POOL_SIZE="8")
+        self.get_config(parallel=64).connect_provider()
+        self.assertEqual(rackspace.call_args[0][0]['pool_size'], 8)
@@ -0,0 +1,42 @@
+import mock
+
+from juju_rs.converge import Convergence
+from juju_rs.exceptions import TimeoutError
+from base import Base
+
+
+class ConvergenceTest(Base):
+
+    @mock.patch('time.sleep')
+    def test_converges(self, sleep):
+        outstanding = [set(['1', '2']), set(['1', '2']), set(['1']), set()]
+        waiter = Convergence("removal", lambda: outstanding.pop(0))
+        waiter.wait()
+        self.assertEqual(outstanding, [])
+        # Backs off while nothing changes, fast again on progress.
+        delays = [c[0][0] for c in sleep.call_args_list]
+        self.assertEqual(len(delays), 3)
+        self.assertTrue(delays[1] > delays[0])
+        self.assertEqual(delays[2], Convergence.MIN_INTERVAL)
+
+    @mock.patch('time.sleep')
+    def test_converged_already(self, sleep):
+        Convergence("removal", lambda: []).wait()
+        self.assertFalse(sleep.called)
+
+    @mock.patch('time.sleep')
+    def test_backoff_ceiling(self, sleep):
+        checks = [set(['1'])] * 30 + [set()]
+        Convergence("removal", lambda: checks.pop(0), timeout=600).wait()
+        self.assertEqual(
+            max(c[0][0] for c in sleep.call_args_list),
+            Convergence.MAX_INTERVAL)
+
+    def test_timeout(self):
+        waiter = Convergence("removal", lambda: set(['3']), timeout=0.05)
+        try:
+            waiter.wait()
+        except TimeoutError, e:
+            self.assertIn("waiting on 3", str(e))
+        else:
+            self.fail("Expected timeout")
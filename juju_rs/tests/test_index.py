@@ -0,0 +1,47 @@
+import os
+
+from juju_rs.client import Droplet
+from juju_rs.index import MachineIndex
+from base import Base
+
+
+class MachineIndexTest(Base):
+
+    def setUp(self):
+        self.path = os.path.join(self.mkdir(), 'rspace', 'index-env.json')
+
+    def droplet(self, id, address, **extra):
+        return Droplet.from_dict(dict(
+            id=id, name="env-%d" % id, ip_address=address, **extra))
+
+    def test_persisted(self):
+        index = MachineIndex(self.path)
+        index.add('1', self.droplet(
+            21, '10.0.0.1', private_ip_address='192.168.0.1'))
+        index.add('2', self.droplet(22, '10.0.0.2'))
+
+        index = MachineIndex(self.path)
+        self.assertEqual(index.get('1'), {
+            'machine_id': '1', 'instance_id': 21, 'name': 'env-21',
+            'public_ip': '10.0.0.1', 'private_ip': '192.168.0.1'})
+        self.assertEqual(index.resolve('1', '10.0.0.1'), 21)
+        self.assertEqual(index.resolve('1', '192.168.0.1'), 21)
+        # A reused machine id at another address isn't trusted.
+        self.assertEqual(index.resolve('2', '10.0.0.9'), None)
+        self.assertEqual(index.resolve('3', '10.0.0.3'), None)
+
+        index.remove(instance_id=22)
+        index.remove('1')
+        self.assertEqual(MachineIndex(self.path).entries(), {})
+
+    def test_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as fh:
+            fh.write('{"1": ')
+        index = MachineIndex(self.path)
+        self.assertEqual(index.entries(), {})
+        index.add('1', self.droplet(21, '10.0.0.1'))
+        self.assertEqual(MachineIndex(self.path).get('1')['instance_id'], 21)
+        self.assertEqual(
+            [f for f in os.listdir(os.path.dirname(self.path))],
+            ['index-env.json'])
@@ -0,0 +1,100 @@
+import mock
+import os
+
+from juju_rs.client import Droplet
+from juju_rs.inventory import Inventory, name_prefixes
+from base import Base
+
+
+def droplet(instance_id, name, status='active'):
+    return Droplet.from_dict(dict(
+        id=instance_id, name=name, status=status,
+        ip_address="10.0.0.%d" % instance_id))
+
+
+class InventoryTest(Base):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.path = os.path.join(self.mkdir(), 'rspace', 'inventory.json')
+        self.listing = [droplet(1, 'env-0'), droplet(2, 'env-abc'),
+                        droplet(3, 'my-env-0'), droplet(4, 'other')]
+        self.client.iter_droplets.side_effect = lambda: iter(self.listing)
+
+    def test_name_prefixes(self):
+        self.assertEqual(name_prefixes('my-env-abc'), ['my', 'my-env'])
+        self.assertEqual(name_prefixes('other'), [])
+
+    def test_get_instances(self):
+        inventory = Inventory(self.client, self.path, 'acct')
+        self.assertEqual(
+            [d.id for d in inventory.get_instances(env='env')], [1, 2])
+        self.assertEqual(
+            [d.id for d in inventory.get_instances(env='my-env')], [3])
+        self.assertEqual(
+            [d.id for d in inventory.get_instances()], [1, 2, 3, 4])
+        # Served from the snapshot until it expires.
+        self.assertEqual(len(self.client.iter_droplets.call_args_list), 1)
+        inventory.get_instances(max_age=0)
+        self.assertEqual(len(self.client.iter_droplets.call_args_list), 2)
+
+    def test_refresh_diff(self):
+        inventory = Inventory(self.client, self.path, 'acct')
+        self.assertEqual(
+            inventory.refresh(), (set([1, 2, 3, 4]), set(), set()))
+        self.listing = [droplet(1, 'env-0'), droplet(2, 'env-abc', 'off'),
+                        droplet(5, 'env-def')]
+        self.assertEqual(
+            inventory.refresh(), (set([5]), set([2]), set([3, 4])))
+        self.assertEqual(
+            [d.id for d in inventory.get_instances(env='env')], [1, 2, 5])
+        self.assertEqual(inventory.get_instances(env='my-env'), [])
+
+    def test_persisted(self):
+        Inventory(self.client, self.path, 'acct').refresh()
+        inventory = Inventory(self.client, self.path, 'acct')
+        self.assertEqual(
+            [d.name for d in inventory.get_instances(env='env')],
+            ['env-0', 'env-abc'])
+        self.assertEqual(len(self.client.iter_droplets.call_args_list), 1)
+        # Not shared across accounts, or when refreshing caches.
+        Inventory(self.client, self.path, 'other').get_instances()
+        Inventory(self.client, self.path, 'acct',
+                  refresh=True).get_instances()
+        self.assertEqual(len(self.client.iter_droplets.call_args_list), 3)
+
+    def test_write_through(self):
+        inventory = Inventory(self.client, self.path, 'acct')
+        inventory.refresh()
+        inventory.put(droplet(6, 'env-pool-a'))
+        inventory.rename(6, 'env-def')
+        inventory.remove(1)
+        self.assertEqual(
+            [d.name for d in inventory.get_instances(env='env')],
+            ['env-abc', 'env-def'])
+        self.assertEqual(inventory.get_instances(env='env-pool'), [])
+        # Write throughs since the last save are saved on request.
+        self.assertEqual(
+            [d.id for d in Inventory(self.client, self.path, 'acct')
+             .get_instances(env='env')], [1, 2])
+        inventory.save()
+        self.assertEqual(
+            [d.id for d in Inventory(self.client, self.path, 'acct')
+             .get_instances(env='env')], [2, 6])
+
+    def test_refresh_keeps_concurrent_writes(self):
+        inventory = Inventory(self.client, self.path, 'acct')
+        inventory.refresh()
+
+        # Written through while the account is being listed.
+        def listing():
+            inventory.put(droplet(6, 'env-def'))
+            inventory.remove(2)
+            return iter(self.listing)
+        self.client.iter_droplets.side_effect = listing
+        self.assertEqual(inventory.refresh(), (set(), set(), set()))
+        self.assertEqual(
+            [d.id for d in inventory.get_instances(env='env')], [1, 6])
+        # Later listings apply as usual.
+        self.client.iter_droplets.side_effect = lambda: iter(self.listing)
+        self.assertEqual(inventory.refresh(), (set([2]), set(), set([6])))
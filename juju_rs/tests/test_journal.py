@@ -0,0 +1,45 @@
+import os
+
+from juju_rs.journal import Journal
+from juju_rs.ops import MachineRegister
+from base import Base
+
+
+class JournalTest(Base):
+
+    def setUp(self):
+        self.path = os.path.join(self.mkdir(), 'rspace', 'journal-env.json')
+
+    def test_persisted(self):
+        journal = Journal(self.path)
+        self.assertFalse(journal.exists())
+        journal.start(2, {'size_id': 66}, {'series': 'trusty'})
+        journal.record('env-a', 'launching')
+        journal.record('env-a', 'launched', instance_id=1)
+        journal.record('env-b', 'registered', instance_id=2, machine_id='1')
+
+        journal = Journal(self.path)
+        self.assertTrue(journal.exists())
+        self.assertEqual(journal.load()['template'], {'size_id': 66})
+        self.assertEqual(
+            journal.unfinished(),
+            [('env-a', {'state': 'launched', 'instance_id': 1})])
+        self.assertEqual(journal.registered(), ['env-b'])
+
+        journal.remove('env-a')
+        self.assertEqual(Journal(self.path).unfinished(), [])
+        journal.clear()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as fh:
+            fh.write('{"total": ')
+        self.assertFalse(Journal(self.path).exists())
+
+    def test_adopt(self):
+        op = MachineRegister(None, None, {'name': 'env-a'})
+        op.adopt('instance', 'launched')
+        self.assertEqual(op.completed, ('launch',))
+        op.adopt('instance', 'ssh_ok')
+        self.assertEqual(op.completed, ('launch', 'wait', 'verify'))
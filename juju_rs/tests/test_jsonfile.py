@@ -0,0 +1,22 @@
+import json
+import os
+
+from juju_rs.jsonfile import write_json
+from base import Base
+
+
+class WriteJSONTest(Base):
+
+    def test_write_json(self):
+        path = os.path.join(self.mkdir(), 'rspace', 'state.json')
+        write_json(path, {'a': 1})
+        write_json(path, {'b': 2})
+        with open(path) as fh:
+            self.assertEqual(json.load(fh), {'b': 2})
+        # No temp files are left behind.
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['state.json'])
+
+    def test_write_json_mode(self):
+        path = os.path.join(self.mkdir(), 'tokens.json')
+        write_json(path, {}, mode=0600)
+        self.assertEqual(os.stat(path).st_mode & 0777, 0600)
@@ -0,0 +1,97 @@
+import mock
+import subprocess
+import threading
+
+from juju_rs.exceptions import ProviderAPIError
+from juju_rs.limit import AdaptiveLimit, Limits, is_congestion
+from base import Base
+
+
+def api_error(status_code):
+    return ProviderAPIError(mock.MagicMock(status_code=status_code), "")
+
+
+class AdaptiveLimitTest(Base):
+
+    def test_is_congestion(self):
+        self.assertTrue(is_congestion(api_error(429)))
+        self.assertTrue(is_congestion(api_error(503)))
+        self.assertFalse(is_congestion(api_error(404)))
+        self.assertTrue(is_congestion(
+            subprocess.CalledProcessError(1, 'juju', 'i/o timeout')))
+        self.assertTrue(is_congestion(subprocess.CalledProcessError(
+            1, 'juju', 'dial tcp 10.0.0.1:17070: connection refused')))
+        self.assertFalse(is_congestion(subprocess.CalledProcessError(
+            1, 'juju', 'error: machine 3 not found')))
+        self.assertFalse(is_congestion(ValueError()))
+
+    def test_additive_increase(self):
+        limit = AdaptiveLimit('provider', 4, maximum=6)
+        # About one slot per window of limit completions.
+        for i in range(5):
+            limit.acquire()
+            limit.release(0.1)
+        self.assertEqual(int(limit.limit), 5)
+        for i in range(100):
+            limit.acquire()
+            limit.release(0.1)
+        self.assertEqual(limit.limit, 6)
+
+    def test_multiplicative_decrease(self):
+        limit = AdaptiveLimit('provider', 16)
+        limit.acquire()
+        limit.release(0.1, api_error(429))
+        self.assertEqual(limit.limit, 8)
+        # Further errors from ops in flight at the old limit are ignored.
+        limit.acquire()
+        limit.release(0.1, api_error(429))
+        self.assertEqual(limit.limit, 8)
+        # Non congestion errors don't reduce the limit.
+        limit.cooldown = 0
+        limit.acquire()
+        limit.release(0.1, api_error(404))
+        self.assertEqual(limit.limit, 8)
+        limit.acquire()
+        limit.release(0.1, subprocess.CalledProcessError(
+            1, 'juju', 'error: no machines were destroyed'))
+        self.assertEqual(limit.limit, 8)
+
+    def test_tail_latency(self):
+        limit = AdaptiveLimit('juju', 8, maximum=8)
+        for i in range(limit.WINDOW - 2):
+            limit.acquire()
+            limit.release(1.0)
+        self.assertEqual(limit.limit, 8)
+        for i in range(2):
+            limit.acquire()
+            limit.release(10.0)
+        self.assertEqual(limit.limit, 4)
+
+    def test_fixed(self):
+        limit = AdaptiveLimit('juju', 2, 2, 2)
+        limit.acquire()
+        limit.release(1, api_error(429))
+        self.assertEqual(limit.limit, 2)
+
+    def test_slot_bounds_concurrency(self):
+        limit = AdaptiveLimit('juju', 1, 1, 1)
+        entered = threading.Event()
+        with limit.slot():
+            t = threading.Thread(target=lambda: (
+                limit.acquire(), entered.set()))
+            t.daemon = True
+            t.start()
+            self.assertFalse(entered.wait(0.1))
+        self.assertTrue(entered.wait(1))
+
+    def test_slot_releases_on_error(self):
+        limits = Limits.create()
+        try:
+            with limits.slot('provider'):
+                raise api_error(429)
+        except ProviderAPIError:
+            pass
+        self.assertEqual(limits['provider'].active, 0)
+        self.assertEqual(limits['provider'].limit, 2)
+        with limits.slot('unknown'):
+            pass
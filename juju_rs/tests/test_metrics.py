@@ -0,0 +1,59 @@
+import mock
+
+from juju_rs.metrics import Metrics, percentile
+from juju_rs import ops
+from juju_rs import retry
+from juju_rs.runner import Runner
+from base import Base
+
+
+class MetricsTest(Base):
+
+    def test_percentile(self):
+        ordered = range(1, 101)
+        self.assertEqual(percentile(ordered, 0.5), 50)
+        self.assertEqual(percentile(ordered, 0.95), 95)
+        self.assertEqual(percentile([3], 0.95), 3)
+        self.assertEqual(percentile([], 0.5), 0)
+
+    def test_summary(self):
+        metrics = Metrics()
+        self.assertFalse(metrics)
+        for i in range(1, 21):
+            metrics.record('launch', i)
+        metrics.incr('retries', 2)
+        metrics.record('worker_busy', 3)
+        metrics.record('worker_idle', 1)
+        summary = metrics.summary()
+        self.assertEqual(summary['timings']['launch'], dict(
+            count=20, total=210, p50=10, p95=19, max=20))
+        self.assertEqual(summary['counters'], {'retries': 2})
+        self.assertEqual(metrics.utilization(summary['timings']), 0.75)
+        report = metrics.report()
+        self.assertTrue(report[1].startswith('launch'))
+        self.assertIn('75%', report[-1])
+
+    def test_op_phases(self):
+        provider = mock.MagicMock()
+
+        def terminate(instance_id):
+            policy = retry.RetryPolicy(bucket=mock.MagicMock())
+            with mock.patch('juju_rs.retry.time'):
+                policy.backoff('/droplets/1/destroy', 0)
+
+        provider.terminate_instance.side_effect = terminate
+        runner = Runner(parallel=2)
+        op = ops.MachineDestroy(
+            provider, mock.MagicMock(), {'machine_id': '1', 'instance_id': 1})
+        runner.queue_op(op)
+        result = list(runner.iter_results())[0]
+        self.assertTrue(result.ok)
+        self.assertEqual(
+            sorted(op.timings), ['terminate_instance', 'terminate_machine'])
+        self.assertEqual(op.retries, 1)
+
+        summary = runner.metrics.summary()
+        self.assertEqual(summary['counters'], {'retries': 1})
+        for name in ('queued', 'op', 'terminate_instance',
+                     'terminate_machine', 'worker_busy', 'worker_idle'):
+            self.assertIn(name, summary['timings'])
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from juju_rs.exceptions import TimeoutError
+from juju_rs.pipeline import Pipeline
+from juju_rs.runner import CancelledError
+from base import Base
+
+
+class StagedOp(object):
+
+    log = []
+    lock = threading.Lock()
+    active = {}
+
+    def __init__(self, name, fail_in=None, delay=0.02):
+        self.name = name
+        self.fail_in = fail_in
+        self.delay = delay
+
+    def record(self, stage):
+        with self.lock:
+            self.active[stage] = self.active.get(stage, 0) + 1
+            self.log.append((stage, time.time(), self.active[stage]))
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[stage] -= 1
+            self.log.append((stage + '-done', time.time(), 0))
+        if stage == self.fail_in:
+            raise ValueError("failed %s" % stage)
+
+    def launch(self):
+        self.record('launch')
+
+    def register(self):
+        self.record('register')
+
+    def get_result(self):
+        return self.name
+
+
+class PipelineTest(Base):
+
+    def setUp(self):
+        StagedOp.log = []
+        StagedOp.active = {}
+
+    def test_pipeline(self):
+        pipeline = Pipeline((('launch', 3), ('register', 1)))
+        for i in range(6):
+            pipeline.queue_op(StagedOp(i, fail_in=i == 2 and 'launch'))
+        done = list(pipeline.iter_results())
+
+        self.assertEqual(sorted(op.result for op in done if not op.error),
+                         [0, 1, 3, 4, 5])
+        failed = [op for op in done if op.error]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(str(failed[0].error), "failed launch")
+
+        # Stages run concurrently up to their own limits, and the first
+        # registration started before all launches were done.
+        launches = [c for s, n, c in StagedOp.log if s == 'launch']
+        registers = [c for s, n, c in StagedOp.log if s == 'register']
+        self.assertEqual(max(launches), 3)
+        self.assertEqual(max(registers), 1)
+        first_register = min(t for s, t, c in StagedOp.log if s == 'register')
+        last_launch = max(t for s, t, c in StagedOp.log if s == 'launch-done')
+        self.assertTrue(first_register < last_launch)
+        self.assertFalse(pipeline.started)
+
+    def test_deadline(self):
+        pipeline = Pipeline((('launch', 2), ('register', 1)), timeout=0.2)
+        pipeline.CHECK_INTERVAL = 0.05
+        pipeline.queue_op(StagedOp('slow', delay=0.6))
+        pipeline.queue_op(StagedOp('fast'))
+        started = time.time()
+        done = dict((op.name, op) for op in pipeline.iter_results())
+        self.assertTrue(time.time() - started < 0.6)
+        self.assertTrue(isinstance(done['slow'].error, TimeoutError))
+        self.assertEqual(done['fast'].result, 'fast')
+        self.assertEqual(pipeline.summary.timed_out, 1)
+        self.assertEqual(pipeline.summary.succeeded, 1)
+        # Let the abandoned stage finish before the next test.
+        time.sleep(0.6)
+
+    def test_cancel(self):
+        pipeline = Pipeline((('launch', 1), ('register', 1)))
+        pipeline.CHECK_INTERVAL = 0.05
+        for i in range(4):
+            pipeline.queue_op(StagedOp(i, delay=0.2))
+        results = pipeline.iter_results()
+        results.next()
+        # Ctrl-C while waiting on the next result.
+        self.assertRaises(KeyboardInterrupt, results.throw, KeyboardInterrupt)
+        self.assertTrue(pipeline.summary.cancelled >= 1)
+        self.assertTrue(isinstance(
+            pipeline.summary.errors[-1].error, CancelledError))
+        time.sleep(0.5)
+        # Ops waiting for a stage never ran.
+        launched = [s for s, t, c in StagedOp.log if s == 'launch']
+        self.assertTrue(len(launched) < 4)
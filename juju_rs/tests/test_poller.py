@@ -0,0 +1,75 @@
+import mock
+import time
+
+from juju_rs.client import Droplet
+from juju_rs.exceptions import ProviderError
+from juju_rs.poller import InstancePoller
+from base import Base
+
+
+def droplet(id, status):
+    return Droplet.from_dict(dict(
+        id=id, name="rspace-%d" % id, status=status))
+
+
+class FastPoller(InstancePoller):
+
+    MIN_INTERVAL = 0.01
+    MAX_INTERVAL = 0.05
+
+
+class InstancePollerTest(Base):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+
+    def test_batch_poll(self):
+        statuses = {1: ['new', 'active'], 2: ['new', 'new', 'active']}
+
+        def get_droplet(i):
+            s = statuses[i]
+            return droplet(i, len(s) > 1 and s.pop(0) or s[0])
+        self.client.iter_droplets.side_effect = lambda: map(
+            get_droplet, statuses)
+        self.client.get_droplet.side_effect = get_droplet
+
+        poller = FastPoller(self.client)
+        ready = []
+        w1 = poller.watch(droplet(1, 'new'))
+        w2 = poller.watch(droplet(2, 'new'))
+        w1.add_done_callback(lambda w: ready.append(w.value.id))
+        self.assertEqual(w2.result(5).status, 'active')
+        self.assertEqual(w1.result(5).id, 1)
+        self.assertEqual(ready, [1])
+        # One listing per tick while several are pending, then a
+        # detail call for the last one.
+        self.assertEqual(self.client.iter_droplets.call_count, 2)
+        self.assertEqual(self.client.get_droplet.call_count, 1)
+        self.assertEqual(len(poller.boot_times), 2)
+
+    def test_single_instance_detail(self):
+        self.client.get_droplet.side_effect = [
+            ValueError("api error"), droplet(3, 'active')]
+        poller = FastPoller(self.client)
+        self.assertEqual(poller.wait(droplet(3, 'new')).id, 3)
+        self.assertFalse(self.client.iter_droplets.called)
+
+    def test_timeout(self):
+        self.client.get_droplet.return_value = droplet(4, 'new')
+        poller = FastPoller(self.client, timeout=0.05)
+        self.assertRaises(ProviderError, poller.wait, droplet(4, 'new'))
+        time.sleep(0.1)
+        self.assertEqual(poller.thread, None)
+
+    def test_adaptive_interval(self):
+        poller = InstancePoller(self.client)
+        poller.boot_times = [40, 60, 80]
+        poller.pending = {1: [mock.MagicMock(started=time.time() - 10)]}
+        # Quiet until the fastest observed boot.
+        self.assertEqual(int(poller.next_interval()), 15)
+        poller.pending[1][0].started = time.time() - 50
+        self.assertEqual(poller.next_interval(), 2)
+        self.client.get_droplet.return_value = droplet(1, 'new')
+        for i in range(5):
+            poller.poll()
+        self.assertEqual(poller.interval, 15)
@@ -0,0 +1,49 @@
+import BaseHTTPServer
+import threading
+
+from juju_rs.limit import PROVIDER_MAX
+from juju_rs.pool import SessionPool
+from base import Base
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = '{"status": "OK"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionPoolTest(Base):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(
+            ('127.0.0.1', 0), KeepAliveHandler)
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:%d/droplets" % self.server.server_port
+
+    def test_connection_reuse(self):
+        pool = SessionPool(pool_size=2)
+        self.addCleanup(pool.close)
+        for i in range(3):
+            self.assertEqual(
+                pool.request('GET', self.url).json(), {'status': 'OK'})
+        self.assertEqual(
+            pool.get_stats(), {'hits': 2, 'misses': 1, 'requests': 3})
+
+    def test_default_size(self):
+        pool = SessionPool()
+        self.addCleanup(pool.close)
+        self.assertEqual(pool.pool_size, PROVIDER_MAX)
@@ -0,0 +1,52 @@
+import socket
+import threading
+import time
+
+from juju_rs.exceptions import TimeoutError
+from juju_rs.probe import PortProbe
+from base import Base
+
+
+class FastProbe(PortProbe):
+
+    RETRY_INTERVAL = 0.05
+
+
+class PortProbeTest(Base):
+
+    def unused_port(self):
+        s = socket.socket()
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+        return port
+
+    def listen(self, port=0):
+        s = socket.socket()
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(('127.0.0.1', port))
+        s.listen(5)
+        self.addCleanup(s.close)
+        return s.getsockname()[1]
+
+    def test_open_ports(self):
+        probe = FastProbe()
+        ports = [self.listen() for i in range(3)]
+        waiters = [probe.watch('127.0.0.1', p, timeout=5) for p in ports]
+        self.assertEqual([w.result(5) for w in waiters], ['127.0.0.1'] * 3)
+
+    def test_port_opens_later(self):
+        probe = FastProbe()
+        port = self.unused_port()
+        waiter = probe.watch('127.0.0.1', port, timeout=5)
+        time.sleep(0.2)
+        self.assertFalse(waiter.done())
+        threading.Timer(0.1, self.listen, (port,)).start()
+        self.assertEqual(waiter.result(5), '127.0.0.1')
+        time.sleep(0.1)
+        self.assertEqual(probe.targets, {})
+
+    def test_timeout(self):
+        probe = FastProbe()
+        self.assertRaises(
+            TimeoutError, probe.wait, '127.0.0.1', self.unused_port(), 0.2)
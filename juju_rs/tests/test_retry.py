@@ -0,0 +1,101 @@
+import mock
+import requests
+import time
+
+from juju_rs.client import Client
+from juju_rs.exceptions import ProviderAPIError
+from juju_rs.retry import RetryPolicy, TokenBucket, parse_retry_after
+from base import Base
+
+
+def api_response(status_code, data=None, headers=None):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    if data is None:
+        response.json.side_effect = ValueError("No JSON object")
+    else:
+        response.json.return_value = data
+    response.headers = headers or {}
+    return response
+
+
+OK = {'status': 'OK', 'droplet': {'id': 1}}
+
+
+class TokenBucketTest(Base):
+
+    def test_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        t = time.time()
+        for i in range(6):
+            bucket.acquire()
+        self.assertTrue(time.time() - t >= 0.09)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1000)
+        bucket.pause(0.1)
+        t = time.time()
+        bucket.acquire()
+        self.assertTrue(time.time() - t >= 0.09)
+
+    def test_shared(self):
+        self.assertTrue(TokenBucket.shared() is TokenBucket.shared())
+
+
+class RetryPolicyTest(Base):
+
+    def test_idempotency(self):
+        policy = RetryPolicy(bucket=TokenBucket(1000))
+        self.assertTrue(policy.should_retry(
+            '/droplets/1/destroy', 0, api_response(503)))
+        self.assertFalse(policy.should_retry(
+            '/droplets/new', 0, api_response(503)))
+        self.assertTrue(policy.should_retry(
+            '/droplets/new', 0, api_response(429)))
+        self.assertFalse(policy.should_retry(
+            '/droplets/new', 0, error=requests.ConnectionError()))
+        self.assertFalse(policy.should_retry('/droplets', 0, api_response(404)))
+        self.assertFalse(policy.should_retry('/droplets', 4, api_response(503)))
+
+    def test_delay(self):
+        policy = RetryPolicy(base_delay=1, max_delay=10)
+        for attempt in range(6):
+            delay = policy.get_delay(attempt)
+            self.assertTrue(0 <= delay <= min(10, 2 ** attempt))
+        self.assertEqual(policy.get_delay(
+            0, api_response(429, headers={'Retry-After': '7'})), 7)
+        self.assertEqual(parse_retry_after(
+            'Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+
+@mock.patch('juju_rs.retry.time.sleep')
+class ClientRetryTest(Base):
+
+    def setUp(self):
+        self.client = Client(
+            'user', 'key', retry=RetryPolicy(bucket=mock.MagicMock()))
+        self.client.tokens = mock.MagicMock()
+        self.client.http = mock.MagicMock()
+
+    def test_retry_get(self, mock_sleep):
+        self.client.http.request.side_effect = [
+            api_response(503), api_response(429, headers={'Retry-After': '2'}),
+            api_response(200, OK)]
+        self.assertEqual(self.client.get_droplet(1).id, 1)
+        self.assertEqual(mock_sleep.call_args_list[-1], mock.call(2))
+        self.client.retry.bucket.pause.assert_called_once_with(2)
+        self.assertEqual(self.client.retry.bucket.acquire.call_count, 3)
+        self.assertEqual(self.client.retry.retries, 2)
+
+    def test_no_retry_create(self, mock_sleep):
+        self.client.http.request.side_effect = [
+            api_response(502), api_response(200, OK)]
+        self.assertRaises(
+            ProviderAPIError, self.client.create_droplet,
+            'rspace-1', 66, 1, 4)
+        self.assertEqual(self.client.http.request.call_count, 1)
+
+    def test_retry_connection_error(self, mock_sleep):
+        self.client.http.request.side_effect = [
+            requests.ConnectionError(), api_response(200, OK)]
+        self.assertEqual(self.client.get_droplet(1).id, 1)
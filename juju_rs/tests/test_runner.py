@@ -1,18 +1,41 @@
+import threading
+import time
 
-from juju_rs.runner import Runner
+from juju_rs.exceptions import TimeoutError
+from juju_rs.runner import Runner, CancelledError, DependencyError
 from base import Base
 
 
 class FakeOp(object):
 
+    depends_on = ()
+
+    def __init__(self, value=1, delay=0, depends_on=()):
+        self.value = value
+        self.delay = delay
+        self.depends_on = depends_on
+
     def run(self):
-        return 1
+        time.sleep(self.delay)
+        return self.value
 
 
 class FakeBadOp(object):
 
+    depends_on = ()
+
+    def run(self):
+        raise ValueError("Bad")
+
+
+class BlockingOp(object):
+
+    def __init__(self):
+        self.release = threading.Event()
+
     def run(self):
-        return ValueError("Bad")
+        self.release.wait()
+        return 1
 
 
 class RunnerTest(Base):
@@ -22,15 +45,122 @@ class RunnerTest(Base):
         runner.queue_op(FakeOp())
         runner.queue_op(FakeOp())
         results = list(runner.iter_results())
-        self.assertEqual(results, [1, 1])
-        self.assertFalse(runner.started)
+        self.assertEqual([r.value for r in results], [1, 1])
+        self.assertEqual(runner.workers, [])
 
     def test_runner(self):
-        runner = Runner()
+        runner = Runner(parallel=2)
+        bad = FakeBadOp()
+        runner.queue_op(FakeOp())
+        runner.queue_op(FakeOp())
+        runner.queue_op(bad)
+        results = list(runner.iter_results())
+        self.assertEqual(len(results), 3)
+        failed = [r for r in results if not r.ok]
+        self.assertEqual(len(failed), 1)
+        self.assertIs(failed[0].op, bad)
+        self.assertIsInstance(failed[0].error, ValueError)
+        self.assertEqual(runner.summary.to_dict(), dict(
+            total=3, succeeded=2, failed=1, timed_out=0, cancelled=0,
+            skipped=0))
+
+    def test_completion_order(self):
+        runner = Runner(parallel=2)
+        runner.queue_op(FakeOp('slow', 0.2))
+        runner.queue_op(FakeOp('fast'))
+        self.assertEqual(
+            [r.value for r in runner.iter_results()], ['fast', 'slow'])
+
+    def test_parallel_bound(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        class CountingOp(object):
+            def run(self):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+        runner = Runner(parallel=3)
+        for i in range(30):
+            runner.queue_op(CountingOp())
+        self.assertEqual(len(list(runner.iter_results())), 30)
+        self.assertEqual(max(peak), 3)
+
+    def test_deadline(self):
+        runner = Runner(parallel=1, timeout=0.1)
+        runner.CHECK_INTERVAL = 0.05
+        stuck = BlockingOp()
+        self.addCleanup(stuck.release.set)
+        runner.queue_op(stuck)
+        runner.queue_op(FakeOp())
+        results = list(runner.iter_results())
+        self.assertIs(results[0].op, stuck)
+        self.assertIsInstance(results[0].error, TimeoutError)
+        # A replacement worker runs the rest of the queue.
+        self.assertEqual(results[1].value, 1)
+        self.assertEqual(runner.summary.timed_out, 1)
+
+    def test_op_deadline(self):
+        runner = Runner(parallel=2, timeout=0.1)
+        runner.CHECK_INTERVAL = 0.05
+        slow = FakeOp(value=2, delay=0.3)
+        # Ops may have their own deadline, or none.
+        slow.deadline = None
+        stuck = BlockingOp()
+        stuck.deadline = 0.2
+        self.addCleanup(stuck.release.set)
+        runner.queue_op(slow)
+        runner.queue_op(stuck)
+        results = dict((r.op, r) for r in runner.iter_results())
+        self.assertEqual(results[slow].value, 2)
+        self.assertIsInstance(results[stuck].error, TimeoutError)
+
+    def test_cancel(self):
+        runner = Runner(parallel=1)
+        blocked = BlockingOp()
+        runner.queue_op(blocked)
         runner.queue_op(FakeOp())
         runner.queue_op(FakeOp())
-        runner.queue_op(FakeBadOp())
-        runner.start(2)
+        runner.start()
+        while not runner.running:
+            time.sleep(0.01)
+        runner.cancel()
+        blocked.release.set()
+        self.assertEqual(runner.summary.cancelled, 2)
+        self.assertIsInstance(
+            runner.summary.errors[0].error, CancelledError)
+
+    def test_dependencies(self):
+        runner = Runner(parallel=4)
+        slow = FakeOp('slow', 0.2)
+        fast = FakeOp('fast')
+        joined = FakeOp('joined', depends_on=(slow, fast))
+        after_fast = FakeOp('after_fast', depends_on=(fast,))
+        for op in (slow, fast, joined, after_fast):
+            runner.queue_op(op)
+        # Dependents start as soon as their own dependencies finish.
+        self.assertEqual(
+            [r.value for r in runner.iter_results()],
+            ['fast', 'after_fast', 'slow', 'joined'])
+
+    def test_failed_dependency(self):
+        runner = Runner()
+        bad = FakeBadOp()
+        dependent = FakeOp(depends_on=(bad,))
+        runner.queue_op(bad)
+        runner.queue_op(dependent)
+        runner.queue_op(FakeOp(depends_on=(dependent,)))
         results = list(runner.iter_results())
-        self.assertEqual(len(results), 2)
-        runner.stop()
+        self.assertEqual(len(results), 3)
+        self.assertIsInstance(results[1].error, DependencyError)
+        self.assertEqual(runner.summary.skipped, 2)
+
+    def test_dependency_queued_first(self):
+        runner = Runner()
+        self.assertRaises(
+            ValueError, runner.queue_op, FakeOp(depends_on=(FakeOp(),)))
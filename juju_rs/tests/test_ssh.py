@@ -0,0 +1,59 @@
+import mock
+import os
+import subprocess
+
+from juju_rs.ssh import SSHMux, SSH_CMD
+from base import Base
+
+
+class SSHMuxTest(Base):
+
+    def setUp(self):
+        self.mux = SSHMux()
+        self.mux.enabled = True
+        self.addCleanup(self.mux.close)
+
+    @mock.patch('juju_rs.ssh.subprocess.call')
+    def test_connect(self, mock_call):
+        mock_call.return_value = 0
+        self.assertEqual(
+            self.mux.command('10.0.1.2'), list(SSH_CMD) + ['root@10.0.1.2'])
+        self.mux.connect('10.0.1.2')
+        self.mux.connect('10.0.1.2')
+        self.assertEqual(mock_call.call_count, 1)
+        cmd = mock_call.call_args[0][0]
+        self.assertIn('ControlMaster=yes', cmd)
+        self.assertEqual(cmd[-3:], ['-f', '-N', 'root@10.0.1.2'])
+
+        control = "ControlPath=%s/%%r@%%h:%%p" % self.mux.runtime_dir
+        self.assertEqual(os.stat(self.mux.runtime_dir).st_mode & 0777, 0700)
+        self.assertIn(control, self.mux.command('10.0.1.2'))
+        self.assertNotIn(control, self.mux.command('10.0.1.3'))
+
+        env = self.mux.update_env({'PATH': '/usr/bin'})
+        wrapper_dir = env['PATH'].split(os.pathsep)[0]
+        with open(os.path.join(wrapper_dir, 'ssh')) as fh:
+            self.assertIn(control[len("ControlPath="):], fh.read())
+
+        runtime_dir = self.mux.runtime_dir
+        self.mux.close()
+        self.assertFalse(os.path.exists(runtime_dir))
+        self.assertEqual(
+            mock_call.call_args[0][0][-3:], ['-O', 'exit', 'root@10.0.1.2'])
+
+    @mock.patch('juju_rs.ssh.subprocess.call')
+    def test_connect_error(self, mock_call):
+        def fail(cmd, stdin, stdout, stderr):
+            stderr.write("ssh: connect to host 10.0.1.2 port 22: "
+                         "Connection refused\n")
+            return 255
+        mock_call.side_effect = fail
+        try:
+            self.mux.connect('10.0.1.2')
+        except subprocess.CalledProcessError, e:
+            self.assertIn("Connection refused", e.output)
+        else:
+            self.fail("failed master should raise")
+        self.assertEqual(self.mux.masters, set())
+        self.assertEqual(self.mux.update_env({'PATH': '/bin'}),
+                         {'PATH': '/bin'})
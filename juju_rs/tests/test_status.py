@@ -0,0 +1,101 @@
+import mock
+import threading
+
+from juju_rs.exceptions import JujuAPIError
+from juju_rs.status import StatusCache
+from base import Base
+
+
+def machine(address, state='started'):
+    return {'dns-name': address, 'instance-id': 'manual:%s' % address,
+            'agent-state': state}
+
+
+def delta(mid, address, state='started', change='change'):
+    return ['machine', change, {
+        'Id': mid, 'InstanceId': 'manual:%s' % address, 'Status': state,
+        'Addresses': [{'Value': '172.16.0.1', 'Scope': 'local-cloud'},
+                      {'Value': address, 'Scope': 'public'}]}]
+
+
+class StatusCacheTest(Base):
+
+    def setUp(self):
+        self.env = mock.MagicMock()
+        self.env.api.return_value = None
+        self.cache = StatusCache(self.env)
+
+    def test_diff(self):
+        self.env.status.return_value = {'machines': {
+            '0': machine('10.0.0.1'), '1': machine('10.0.0.2', 'pending')}}
+        self.assertEqual(self.cache.refresh(), (set(['0', '1']), set(), set()))
+        self.env.status.return_value = {'machines': {
+            '0': machine('10.0.0.1'), '1': machine('10.0.0.2'),
+            '2': machine('10.0.0.3')}}
+        self.assertEqual(
+            self.cache.refresh(), (set(['2']), set(['1']), set()))
+        self.env.status.return_value = {'machines': {
+            '0': machine('10.0.0.1'), '2': machine('10.0.0.3')}}
+        self.assertEqual(self.cache.refresh(), (set(), set(), set(['1'])))
+
+        self.assertEqual(self.cache.machine('2'), machine('10.0.0.3'))
+        self.assertEqual(self.cache.machine('1'), None)
+        self.assertEqual(
+            self.cache.by_address('10.0.0.1'), ('0', machine('10.0.0.1')))
+        self.assertEqual(self.cache.by_address('10.0.0.2'), (None, None))
+
+    def test_watch(self):
+        api = self.env.api.return_value = mock.MagicMock()
+        api.watch_all.return_value = 'w1'
+        more = threading.Event()
+        deltas = [
+            [delta('0', '10.0.0.1'), delta('1', '10.0.0.2', 'pending'),
+             ['service', 'change', {'Name': 'mysql'}]],
+            [delta('1', '10.0.0.2', change='remove'),
+             delta('2', '10.0.0.3')]]
+
+        def next_deltas(watcher_id):
+            if not deltas:
+                more.set()
+                raise JujuAPIError("watcher was stopped")
+            return deltas.pop(0)
+
+        api.next_deltas.side_effect = next_deltas
+        self.cache.refresh()
+        more.wait(5)
+        self.cache.watcher.join(5)
+        self.assertEqual(self.cache.snapshot(), {
+            '0': machine('10.0.0.1'), '2': machine('10.0.0.3')})
+        self.assertEqual(self.cache.by_address('10.0.0.3')[0], '2')
+        self.assertFalse(self.env.status.called)
+
+    def test_close(self):
+        api = self.env.api.return_value = mock.MagicMock()
+        api.watch_all.return_value = 'w1'
+        stopped = threading.Event()
+
+        def next_deltas(watcher_id):
+            if api.next_deltas.call_count == 1:
+                return [delta('0', '10.0.0.1')]
+            stopped.wait(5)
+            raise JujuAPIError("watcher was stopped")
+
+        api.next_deltas.side_effect = next_deltas
+        api.stop_watcher.side_effect = lambda watcher_id: stopped.set()
+        self.cache.refresh()
+        self.assertTrue(self.cache.watching)
+        self.cache.close()
+        api.stop_watcher.assert_called_once_with('w1')
+        self.cache.watcher.join(5)
+        self.assertFalse(self.cache.watching)
+        # Closing again, or without a watcher, does nothing.
+        self.cache.close()
+        self.assertEqual(len(api.stop_watcher.call_args_list), 1)
+
+    def test_watch_unavailable(self):
+        api = self.env.api.return_value = mock.MagicMock()
+        api.watch_all.side_effect = JujuAPIError("permission denied")
+        self.env.status.return_value = {'machines': {
+            '0': machine('10.0.0.1')}}
+        self.cache.refresh()
+        self.assertEqual(self.cache.snapshot(), {'0': machine('10.0.0.1')})
@@ -0,0 +1,75 @@
+import mock
+import os
+
+from juju_rs.client import Droplet
+from juju_rs.exceptions import ProviderAPIError
+from juju_rs.warm import WarmPool
+from base import Base
+
+TEMPLATE = {'size_id': 66, 'region_id': 4, 'image_id': 5141286}
+
+
+def droplet(instance_id, name, status='active', **kw):
+    data = dict(TEMPLATE, id=instance_id, name=name, status=status)
+    data.update(kw)
+    return Droplet.from_dict(data)
+
+
+class WarmPoolTest(Base):
+
+    def setUp(self):
+        self.provider = mock.MagicMock()
+        self.pool = WarmPool(self.provider, 'env')
+
+    def test_members(self):
+        self.provider.get_instances.return_value = [
+            droplet(1, 'env-pool-a', status='new'),
+            droplet(2, 'env-pool-b'),
+            droplet(3, 'env-pool-c', size_id=63),
+            droplet(4, 'env-d'),
+            droplet(5, 'env-pool-e', status='off')]
+        self.assertEqual(
+            [d.id for d in self.pool.members(TEMPLATE)], [2, 1])
+        self.assertEqual(
+            [d.id for d in self.pool.members()], [2, 3, 1])
+
+    def test_claim(self):
+        self.provider.get_instances.return_value = [
+            droplet(1, 'env-pool-a'), droplet(2, 'env-pool-b'),
+            droplet(3, 'env-pool-c')]
+        self.provider.rename_instance.side_effect = [
+            ProviderAPIError(mock.MagicMock(), "Not Found"), None]
+        claimed = self.pool.claim(TEMPLATE, 2)
+        self.assertEqual([d.id for d in claimed], [2])
+        self.assertTrue(claimed[0].name.startswith('env-'))
+        self.assertFalse(self.pool.is_member(claimed[0]))
+        # Members are relisted so ones claimed elsewhere aren't reclaimed.
+        self.provider.get_instances.assert_called_once_with(
+            env='env-pool', max_age=0)
+
+    def test_shortfall(self):
+        self.provider.get_instances.return_value = [droplet(1, 'env-pool-a')]
+        self.assertEqual(self.pool.shortfall(dict(TEMPLATE), 3), 2)
+        self.assertEqual(self.pool.shortfall(dict(TEMPLATE), 0), 0)
+        self.provider.get_instances.assert_called_with(
+            env='env-pool', max_age=0)
+
+    def test_verified(self):
+        pool = WarmPool(
+            self.provider, 'env', os.path.join(self.mkdir(), 'pool.json'))
+        self.assertEqual(pool.verified(), set())
+        self.provider.get_instances.return_value = [
+            droplet(1, 'env-pool-a'), droplet(2, 'env-pool-b')]
+        pool.record_verified([droplet(1, 'env-pool-a')])
+        # Ids no longer pooled, ie. claimed, are forgotten.
+        self.provider.get_instances.return_value = [droplet(2, 'env-pool-b')]
+        pool.record_verified([droplet(2, 'env-pool-b')])
+        self.assertEqual(pool.verified(), set([2]))
+        pool.drain()
+        self.assertEqual(pool.verified(), set())
+
+    def test_drain(self):
+        self.provider.get_instances.return_value = [
+            droplet(1, 'env-pool-a', status='off'), droplet(2, 'env-b')]
+        self.pool.drain()
+        self.provider.terminate_instance.assert_called_once_with(1)
@@ -0,0 +1,122 @@
+"""
+Warm pool of pre-launched machines.
+
+Pool instances are launched ahead of demand and tagged by name
+(<env>-pool-<hex>) with the size, region and image they were launched
+with. add-machine claims matching members by renaming them into the
+environment, which saves the boot and ssh wait, and then tops the pool
+back up with members it has launched and ssh verified.
+
+Members verified by this client are recorded in a local file, claims of
+those skip the ssh check. Others, ie. pooled from another machine, are
+verified when claimed.
+"""
+
+import json
+import logging
+import os
+import uuid
+
+from juju_rs.exceptions import ProviderAPIError
+from juju_rs.jsonfile import write_json
+
+log = logging.getLogger("juju.rspace")
+
+# Pool members in these states can still become usable machines.
+LIVE_STATUSES = ('new', 'active')
+
+
+class WarmPool(object):
+
+    def __init__(self, provider, env_name, path=None):
+        self.provider = provider
+        self.env_name = env_name
+        self.prefix = "%s-pool-" % env_name
+        # Record of ssh verified members.
+        self.path = path
+
+    def is_member(self, instance):
+        return instance.name.startswith(self.prefix)
+
+    def new_name(self):
+        return "%s%s" % (self.prefix, uuid.uuid4().hex)
+
+    @staticmethod
+    def matches(instance, template):
+        return (instance.size_id == template['size_id'] and
+                instance.region_id == template['region_id'] and
+                instance.image_id == template['image_id'])
+
+    def members(self, template=None, max_age=None):
+        """Live pool instances matching template, active ones first.
+
+        Pass max_age=0 before acting on them, as another client may have
+        claimed members since the inventory was last listed.
+        """
+        instances = self.provider.get_instances(
+            env=self.prefix[:-1], max_age=max_age)
+        found = [d for d in instances
+                 if self.is_member(d) and d.status in LIVE_STATUSES and
+                 (template is None or self.matches(d, template))]
+        found.sort(key=lambda d: d.status != 'active')
+        return found
+
+    def claim(self, template, count):
+        """Take up to count matching instances out of the pool.
+
+        Claimed instances are renamed into the environment, so they
+        are no longer pool members for this or any other client.
+        """
+        claimed = []
+        for d in self.members(template, max_age=0)[:count]:
+            name = "%s-%s" % (self.env_name, uuid.uuid4().hex)
+            try:
+                self.provider.rename_instance(d.id, name)
+            except ProviderAPIError, e:
+                log.warning("Could not claim pool instance %s: %s", d.id, e)
+                continue
+            d.name = name
+            claimed.append(d)
+        if claimed:
+            log.info("Claimed %d machines from the warm pool", len(claimed))
+        return claimed
+
+    def shortfall(self, template, size):
+        """Number of members to launch to bring the pool up to size.
+        """
+        return max(0, size - len(self.members(template, max_age=0)))
+
+    def verified(self):
+        """Ids of instances recorded as ssh verified when pooled.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return set()
+        try:
+            with open(self.path) as fh:
+                return set(json.load(fh))
+        except (IOError, ValueError):
+            log.debug("Ignoring unreadable pool record %s", self.path)
+            return set()
+
+    def record_verified(self, instances):
+        """Record members as ssh verified, forgetting ids no longer pooled.
+        """
+        if not self.path:
+            return
+        members = set([d.id for d in self.members()])
+        ids = (self.verified() & members) | set([d.id for d in instances])
+        write_json(self.path, sorted(ids))
+
+    def drain(self):
+        """Terminate every pool instance, whatever its template.
+        """
+        drained = []
+        for d in self.provider.get_instances(env=self.prefix[:-1], max_age=0):
+            if self.is_member(d):
+                self.provider.terminate_instance(d.id)
+                drained.append(d)
+        if drained:
+            log.info("Terminated %d warm pool machines", len(drained))
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        return drained
@@ -14,6 +14,7 @@ setup(name='juju-rs',
       license='BSD',
       packages=find_packages(),
       install_requires=["PyYAML", "requests"],
+      extras_require={"async": ["tornado"]},
       tests_require=["nose", "mock"],
       entry_points={
           "console_scripts": [